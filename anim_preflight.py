@@ -0,0 +1,174 @@
+import mmap
+import os
+import struct
+
+# Checks an anim folder the way krane will read it, without starting krane:
+# anim.bin and build.bin are memory-mapped and their headers, symbol tables
+# and atlas references validated, and the atlases' .tex headers give the
+# size of the decoded images. Layouts follow ktools' kbuild/kanim readers.
+
+ANIM_MAGIC = b"ANIM"
+BUILD_MAGIC = b"BILD"
+# Versions krane reads
+ANIM_VERSIONS = (4,)
+BUILD_VERSIONS = (6,)
+KTEX_MAGIC = b"KTEX"
+
+_ANIM_HEADER = struct.Struct("<4siIIII")  # magic, version, elements, frames, events, anims
+_BUILD_HEADER = struct.Struct("<4siII")  # magic, version, symbols, frames
+_UINT = struct.Struct("<I")
+_SYMBOL = struct.Struct("<II")  # hash, frames
+FRAME_SIZE = 32  # frame number, duration, x, y, w, h, alpha index, alpha count
+VERTEX_FLOATS = 6  # x, y, z, u, v, w; w is the atlas index
+VERTEX_SIZE = VERTEX_FLOATS * 4
+_TEX_HEADER = struct.Struct("<4sIHH")  # magic, flags, first mipmap width and height
+# The smallest anim: name length, facing, root symbol, frame rate, frame count
+MIN_ANIM_SIZE = 17
+
+
+class AnimError(ValueError):
+    pass
+
+
+class AnimInfo:
+    """What preflight() read from an anim folder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.animations = 0
+        self.build_name = ""
+        self.symbols = 0
+        self.frames = 0
+        self.vertices = 0
+        self.atlases = []  # .tex paths in build.bin order
+        self.atlas_pixels = 0  # width * height of every atlas's largest mipmap
+        self.bin_bytes = 0  # anim.bin + build.bin
+
+
+def _map(path, name):
+    # Read-only mapping of a whole file
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise AnimError(f"{name} is empty")
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        raise AnimError(f"no {name}")
+    except OSError as e:
+        raise AnimError(f"cannot read {name}: {e.strerror}")
+
+
+def _string(data, offset, what):
+    # uint32 length followed by that many bytes
+    if offset + 4 > len(data):
+        raise AnimError(f"build.bin truncated in {what}")
+    (length,) = _UINT.unpack_from(data, offset)
+    end = offset + 4 + length
+    if end > len(data):
+        raise AnimError(f"build.bin truncated in {what}")
+    return data[offset + 4:end].decode("utf-8", errors="replace"), end
+
+
+def _highest_atlas(data, start, end):
+    # Largest w of the vertices in data[start:end]. Native-order floats, as
+    # every platform krane runs on is little-endian. The view is released
+    # before returning, or the mmap could not be closed.
+    floats = memoryview(data)[start:end].cast("f")
+    try:
+        return max(floats[VERTEX_FLOATS - 1::VERTEX_FLOATS])
+    finally:
+        floats.release()
+
+
+def check_anim(data, info):
+    if len(data) < _ANIM_HEADER.size:
+        raise AnimError("anim.bin header truncated")
+    magic, version, _, _, _, animations = _ANIM_HEADER.unpack_from(data)
+    if magic != ANIM_MAGIC:
+        raise AnimError("anim.bin is not an ANIM file")
+    if version not in ANIM_VERSIONS:
+        raise AnimError(f"anim.bin version {version} not supported")
+    if animations * MIN_ANIM_SIZE > len(data) - _ANIM_HEADER.size:
+        raise AnimError(f"anim.bin claims {animations} animations but is too short")
+    info.animations = animations
+
+
+def check_build(data, info):
+    if len(data) < _BUILD_HEADER.size:
+        raise AnimError("build.bin header truncated")
+    magic, version, symbols, frames = _BUILD_HEADER.unpack_from(data)
+    if magic != BUILD_MAGIC:
+        raise AnimError("build.bin is not a BILD file")
+    if version not in BUILD_VERSIONS:
+        raise AnimError(f"build.bin version {version} not supported")
+    info.build_name, offset = _string(data, _BUILD_HEADER.size, "the build name")
+    if offset + 4 > len(data):
+        raise AnimError("build.bin truncated before the atlas list")
+    (atlas_count,) = _UINT.unpack_from(data, offset)
+    offset += 4
+    if atlas_count == 0:
+        raise AnimError("build.bin lists no atlases")
+    atlas_names = []
+    for i in range(atlas_count):
+        name, offset = _string(data, offset, f"atlas name {i}")
+        atlas_names.append(name)
+
+    # Symbols are skipped by their frame counts, which must add up to the header's
+    frame_total = 0
+    for i in range(symbols):
+        if offset + _SYMBOL.size > len(data):
+            raise AnimError(f"build.bin truncated in symbol {i} of {symbols}")
+        _, symbol_frames = _SYMBOL.unpack_from(data, offset)
+        offset += _SYMBOL.size + symbol_frames * FRAME_SIZE
+        frame_total += symbol_frames
+    if offset + 4 > len(data):
+        raise AnimError("build.bin truncated in its symbol frames")
+    if frame_total != frames:
+        raise AnimError(f"build.bin symbols have {frame_total} frames, header says {frames}")
+    (vertices,) = _UINT.unpack_from(data, offset)
+    offset += 4
+    end = offset + vertices * VERTEX_SIZE
+    if end > len(data):
+        raise AnimError(f"build.bin truncated in its {vertices} vertices")
+    if vertices:
+        highest = _highest_atlas(data, offset, end)
+        if not 0 <= highest < atlas_count:  # Also rejects NaN
+            raise AnimError(f"build.bin uses atlas {highest:g} but lists {atlas_count}")
+    info.symbols = symbols
+    info.frames = frames
+    info.vertices = vertices
+    return atlas_names
+
+
+def check_atlases(folder, atlas_names, info):
+    files = {name.lower(): name for name in os.listdir(folder)}
+    for name in atlas_names:
+        actual = files.get(os.path.basename(name).lower())
+        if actual is None:
+            raise AnimError(f"missing {name}")
+        path = os.path.join(folder, actual)
+        try:
+            with open(path, "rb") as f:
+                header = f.read(_TEX_HEADER.size)
+        except OSError as e:
+            raise AnimError(f"cannot read {name}: {e.strerror}")
+        if len(header) < _TEX_HEADER.size or header[:4] != KTEX_MAGIC:
+            raise AnimError(f"{name} is not a KTEX file")
+        _, _, width, height = _TEX_HEADER.unpack(header)
+        info.atlases.append(path)
+        info.atlas_pixels += width * height
+
+
+def preflight(folder):
+    """AnimInfo for an anim folder krane can read; raises AnimError with the
+    reason otherwise."""
+    info = AnimInfo(folder)
+    for name, check in (("anim.bin", check_anim), ("build.bin", check_build)):
+        data = _map(os.path.join(folder, name), name)
+        try:
+            info.bin_bytes += len(data)
+            atlas_names = check(data, info)
+        finally:
+            data.close()
+    check_atlases(folder, atlas_names, info)
+    return info
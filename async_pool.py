@@ -0,0 +1,136 @@
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from subprocess import DEVNULL, PIPE
+
+from process_pool import STDERR_LIMIT, Cancelled, ProcessPool
+
+
+def _kill_group(proc):
+    # The child leads its own process group, so this also kills anything it started
+    if proc.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class AsyncProcessPool(ProcessPool):
+    """ProcessPool whose children all run on one asyncio event loop thread.
+
+    Each child starts in a new session, so a timeout or cancel kills its whole
+    process group and leaves no orphans behind. stderr is read line by line
+    as the tool writes it, into ChildStats and the job's log file. CPU time
+    and peak RSS are not measured, because the event loop reaps the children.
+    """
+
+    def __init__(self, workers=None, memory_limit=None):
+        super().__init__(workers, memory_limit)
+        self._loop = None
+        self._thread = None
+
+    def _start_loop(self):
+        # Started by the first run, so a batch that never runs leaves no thread behind
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, argv, timeout=None, cost=0, stats=None, log_path=None, unscheduled=None):
+        # Blocks the calling worker thread; the child itself is driven by the loop
+        if self._cancelled:
+            raise Cancelled()
+        self._acquire_memory(cost, unscheduled)
+        try:
+            loop = self._start_loop()
+            future = asyncio.run_coroutine_threadsafe(self._run(argv, timeout, stats, log_path), loop)
+            returncode = future.result()
+        finally:
+            self._release_memory(cost)
+        if self._cancelled:
+            raise Cancelled()
+        return returncode
+
+    async def _run(self, argv, timeout, stats, log_path):
+        started = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdout=DEVNULL, stderr=PIPE, start_new_session=os.name != 'nt'
+        )
+        with self._lock:
+            self._procs.add(proc)
+            cancelled = self._cancelled
+        if cancelled:
+            _kill_group(proc)
+        log = None
+        if log_path:
+            try:
+                log = open(log_path, "w", encoding="utf-8")
+            except OSError:
+                pass
+        try:
+            try:
+                return await asyncio.wait_for(self._stream_stderr(proc, stats, log), timeout)
+            except asyncio.TimeoutError:
+                _kill_group(proc)
+                await proc.wait()
+                raise subprocess.TimeoutExpired(argv, timeout)
+        finally:
+            with self._lock:
+                self._procs.discard(proc)
+            if log is not None:
+                log.close()
+            if stats is not None:
+                stats.wall = time.monotonic() - started
+
+    async def _stream_stderr(self, proc, stats, log):
+        tail = deque()
+        tail_size = 0
+        while True:
+            try:
+                line = await proc.stderr.readline()
+            except ValueError:
+                # A line longer than the stream buffer; take it in pieces
+                line = await proc.stderr.read(65536)
+            if not line:
+                break
+            text = line.decode("utf-8", errors="replace")
+            if log is not None:
+                log.write(text)
+            tail.append(text)
+            tail_size += len(text)
+            while tail_size > STDERR_LIMIT and len(tail) > 1:
+                tail_size -= len(tail.popleft())
+            if stats is not None:
+                stats.stderr = "".join(tail)[-STDERR_LIMIT:]
+        return await proc.wait()
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+    def cancel(self):
+        with self._memory_cond:
+            self._cancelled = True
+            procs = list(self._procs)
+            loop = self._loop
+            self._memory_cond.notify_all()
+        for proc in procs:
+            try:
+                loop.call_soon_threadsafe(_kill_group, proc)
+            except (AttributeError, RuntimeError):
+                pass  # Loop already closed, so the child has exited
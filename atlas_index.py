@@ -0,0 +1,199 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from PIL import Image
+
+from build_cache import CACHE_DIR
+
+try:
+    import tex_decoder
+except ImportError:  # numpy missing, atlases must be converted to png first
+    tex_decoder = None
+
+INDEX_VERSION = 2
+DEFAULT_ATLAS_CACHE_BYTES = 512 * 1024 * 1024
+
+_MAGIC = re.compile(r"[*?[]")
+
+
+def is_pattern(name):
+    return _MAGIC.search(name) is not None
+
+
+def parse_atlas_xml(xml_path):
+    # (texture file name, {"icon.tex": (u1, u2, v1, v2)}) for a Klei <Atlas> file
+    elements = {}
+    root_xml = ET.parse(xml_path).getroot()
+    texture = root_xml.find('Texture')
+    texture = texture.attrib.get("filename", "") if texture is not None else ""
+    for elem in root_xml.find('Elements'):
+        elements[elem.attrib["name"].lower()] = (
+            float(elem.attrib["u1"]),
+            float(elem.attrib["u2"]),
+            float(elem.attrib["v1"]),
+            float(elem.attrib["v2"]),
+        )
+    return texture, elements
+
+
+class AtlasIndex:
+    """Icon name -> (atlas xml, u1, u2, v1, v2) for every atlas in a folder.
+
+    The index is saved under CACHE_DIR and refreshed on load: only XML files
+    whose mtime or size changed since the last run are parsed again.
+    """
+
+    def __init__(self, source_dir, cache_dir=CACHE_DIR):
+        self.source_dir = os.path.abspath(source_dir)
+        key = hashlib.sha1(os.path.normcase(self.source_dir).encode("utf-8")).hexdigest()
+        self.index_path = os.path.join(cache_dir, "atlas_index", key + ".json")
+        self.atlases = {}
+        self._names = {}
+        self._sorted_names = []
+        self.load()
+
+    def load(self):
+        stored = {}
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION and data.get("source_dir") == self.source_dir:
+                stored = data["atlases"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        changed = False
+        atlases = {}
+        with os.scandir(self.source_dir) as entries:
+            xml_entries = sorted(
+                (e for e in entries if e.name.endswith(".xml") and e.is_file()), key=lambda e: e.name
+            )
+        for entry in xml_entries:
+            st = entry.stat()
+            old = stored.get(entry.name)
+            if old and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+                atlases[entry.name] = old
+                continue
+            try:
+                texture, elements = parse_atlas_xml(entry.path)
+            except (ET.ParseError, KeyError, TypeError, ValueError, OSError):
+                texture, elements = "", {}
+            atlases[entry.name] = {
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "texture": texture,
+                "elements": {name: list(uv) for name, uv in elements.items()},
+            }
+            changed = True
+        self.atlases = atlases
+        if changed or len(atlases) != len(stored):
+            try:
+                self.save()
+            except OSError:
+                pass  # Cache folder not writable, the index still works for this run
+        self._build_lookup()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "source_dir": self.source_dir, "atlases": self.atlases}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _build_lookup(self):
+        # An icon may exist in several atlases; keep them in file name order
+        self._names = {}
+        for xml_name, atlas in self.atlases.items():
+            for name, uv in atlas["elements"].items():
+                self._names.setdefault(name, []).append((xml_name, tuple(uv)))
+        self._sorted_names = sorted(self._names)
+
+    def lookup(self, name):
+        # [(xml file name, (u1, u2, v1, v2)), ...] for an icon name like "log.tex"
+        return self._names.get(name, [])
+
+    def glob(self, pattern):
+        # Names matching a shell-style pattern such as "armor_*.tex", sorted
+        prefix = _MAGIC.split(pattern, 1)[0]
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        matches = []
+        for name in self._sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            if fnmatchcase(name, pattern):
+                matches.append(name)
+        return matches
+
+    def xml_path(self, xml_name):
+        return os.path.join(self.source_dir, xml_name)
+
+    def image_paths(self, xml_name):
+        # Where the atlas image may be, best first: a png converted by ktech,
+        # else the .tex itself, decoded in memory
+        stem = os.path.splitext(self.xml_path(xml_name))[0]
+        paths = [stem + ".png"]
+        if tex_decoder is not None:
+            texture = self.atlases[xml_name].get("texture")
+            if texture:
+                paths.append(os.path.join(self.source_dir, os.path.basename(texture)))
+            paths.append(stem + ".tex")
+        return paths
+
+
+def load_atlas_image(path):
+    if path.lower().endswith(".tex"):
+        # Icon UVs are relative, but force64 works in full-size pixels, so use the top mip
+        return tex_decoder.read_tex(path).image(0)
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class AtlasImageCache:
+    """Decoded atlas images, evicting the least recently used once max_bytes is exceeded.
+
+    Entries are keyed by path, mtime and size, so an atlas that changed on disk
+    is decoded again.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_ATLAS_CACHE_BYTES, loader=load_atlas_image):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key][0]
+        image = self.loader(path)
+        size = image_bytes(image)
+        if size > self.max_bytes:
+            return image  # Too big to keep, the caller still gets it for this run
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = (image, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, old_size) = self._images.popitem(last=False)
+                self._bytes -= old_size
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
@@ -0,0 +1,92 @@
+# Throughput of the old sequential ktech loop vs ProcessPool.
+# Uses a stand-in ktech that sleeps for --latency seconds and writes an empty png,
+# so it runs without KTools installed:
+#   python benchmarks/bench_ktech_pool.py --files 200 --latency 0.05
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from subprocess import DEVNULL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from process_pool import ProcessPool, default_workers
+
+FAKE_KTECH = """import os, sys, time
+time.sleep(float(os.environ.get("FAKE_KTECH_LATENCY", "0")))
+base = os.path.splitext(os.path.basename(sys.argv[1]))[0]
+open(os.path.join(sys.argv[2], base + ".png"), "wb").close()
+"""
+
+
+def make_fake_ktech(tmp):
+    path = os.path.join(tmp, "ktech")
+    with open(path, "w") as f:
+        f.write("#!" + sys.executable + "\n" + FAKE_KTECH)
+    os.chmod(path, 0o755)
+    return path
+
+
+def make_tex_files(tmp, count):
+    src = os.path.join(tmp, "src")
+    os.makedirs(src)
+    files = []
+    for i in range(count):
+        path = os.path.join(src, f"tex_{i:05d}.tex")
+        open(path, "wb").close()
+        files.append(path)
+    return files
+
+
+def run_sequential(ktech_exe, tex_files, output_dir):
+    # Same shape as the loop KtechTab.convert used before ProcessPool
+    for tex_file in tex_files:
+        cmd = f'"{ktech_exe}" "{tex_file}" "{output_dir}"'
+        proc = subprocess.Popen(cmd, shell=True, stdout=DEVNULL)
+        proc.wait()
+
+
+def run_pool(ktech_exe, tex_files, output_dir, workers):
+    pool = ProcessPool(workers)
+    for _ in pool.map(lambda idx, tex_file: pool.run([ktech_exe, tex_file, output_dir]), tex_files):
+        pass
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    args = parser.parse_args()
+    if os.name == 'nt':
+        sys.exit("The stand-in ktech script needs a POSIX shebang.")
+
+    os.environ["FAKE_KTECH_LATENCY"] = str(args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        ktech_exe = make_fake_ktech(tmp)
+        tex_files = make_tex_files(tmp, args.files)
+        results = []
+        for label, func, extra in (
+            ("sequential (shell)", run_sequential, ()),
+            (f"pool x{args.workers}", run_pool, (args.workers,)),
+        ):
+            output_dir = os.path.join(tmp, label.split()[0])
+            os.makedirs(output_dir)
+            elapsed = timed(func, ktech_exe, tex_files, output_dir, *extra)
+            results.append((label, elapsed))
+
+    print(f"{args.files} files, {args.latency * 1000:.0f} ms simulated ktech latency")
+    base = results[0][1]
+    for label, elapsed in results:
+        print(f"  {label:<20} {elapsed:7.2f} s  {args.files / elapsed:8.1f} files/s  x{base / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# Throughput of the ktech, krane and crop pipelines on synthetic assets.
+#
+#   python benchmarks/bench_pipelines.py
+#   python benchmarks/bench_pipelines.py --pipelines crop --sizes 100,1000 --workers 1,4,8
+#   python benchmarks/bench_pipelines.py --latency 0.05 --failure-rate 0.02 --json results.json
+#
+# ktech and krane are stand-in scripts that sleep for --latency seconds and
+# fail --failure-rate of their runs, so the suite runs offline without KTools
+# (Linux/macOS). Crop runs on generated atlases: noise pngs with Klei-style
+# <Atlas><Elements> xml. Every configuration runs in a fresh process, so its
+# peak memory is its own. Latency is per job: one ktech or krane run, or one
+# cropped png saved.
+import argparse
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from process_pool import default_workers
+
+PIPELINES = ("ktech", "krane", "crop")
+
+FAKE_TOOL = """import os, random, sys, time
+time.sleep(float(os.environ.get("FAKE_TOOL_LATENCY", "0")))
+if random.random() < float(os.environ.get("FAKE_TOOL_FAILURE_RATE", "0")):
+    sys.stderr.write("fake failure\\n")
+    sys.exit(1)
+source, output = sys.argv[1], sys.argv[2]
+os.makedirs(output, exist_ok=True)
+if os.path.basename(sys.argv[0]) == "krane":
+    open(os.path.join(output, os.path.basename(source) + ".scml"), "w").close()
+else:
+    base = os.path.splitext(os.path.basename(source))[0]
+    open(os.path.join(output, base + ".png"), "wb").close()
+"""
+
+
+def make_fake_tools(tools_dir):
+    os.makedirs(tools_dir)
+    for name in ("ktech", "krane"):
+        path = os.path.join(tools_dir, name)
+        with open(path, "w") as f:
+            f.write("#!" + sys.executable + "\n" + FAKE_TOOL)
+        os.chmod(path, 0o755)
+
+
+def make_tex_files(src, count):
+    os.makedirs(src)
+    for i in range(count):
+        with open(os.path.join(src, f"tex_{i:05d}.tex"), "wb") as f:
+            f.write(b"KTEX" + bytes(60))
+
+
+def fake_anim_files(atlas_size):
+    # Smallest anim.bin, build.bin and atlas that pass KraneBatch's preflight:
+    # no animations, one symbol with one frame drawn from atlas-0.tex
+    anim = struct.pack("<4siIIII", b"ANIM", 4, 0, 0, 0, 0)
+    name = b"fake"
+    atlas = b"atlas-0.tex"
+    build = (struct.pack("<4siII", b"BILD", 6, 1, 1) + struct.pack("<I", len(name)) + name
+             + struct.pack("<I", 1) + struct.pack("<I", len(atlas)) + atlas
+             + struct.pack("<II", 0, 1) + bytes(32)
+             + struct.pack("<I", 6) + struct.pack("<6f", 0, 0, 0, 0, 0, 0) * 6 + struct.pack("<I", 0))
+    tex = b"KTEX" + struct.pack("<IHHHI", 0, atlas_size, atlas_size, atlas_size * 4, 0)
+    return {"anim.bin": anim, "build.bin": build, atlas.decode(): tex}
+
+
+def make_anim_folders(src, count, atlas_size):
+    files = fake_anim_files(atlas_size)
+    for i in range(count):
+        folder = os.path.join(src, f"anim_{i:05d}")
+        os.makedirs(folder)
+        for name, data in files.items():
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(data)
+
+
+def make_atlases(src, count, atlas_size, icons_per_atlas):
+    # Noise pngs, so encoding the crops costs what real art costs
+    from PIL import Image
+
+    os.makedirs(src)
+    grid = 1
+    while grid * grid < icons_per_atlas:
+        grid += 1
+    cell = 1.0 / grid
+    names = []
+    for atlas in range((count + icons_per_atlas - 1) // icons_per_atlas):
+        stem = f"atlas_{atlas:04d}"
+        Image.frombytes("RGBA", (atlas_size, atlas_size), os.urandom(atlas_size * atlas_size * 4)).save(
+            os.path.join(src, stem + ".png"), compress_level=1)
+        elements = []
+        for i in range(min(icons_per_atlas, count - len(names))):
+            x, y = i % grid, i // grid
+            name = f"icon_{len(names):05d}"
+            names.append(name)
+            elements.append(
+                f'<Element name="{name}.tex" u1="{x * cell}" u2="{(x + 1) * cell}" '
+                f'v1="{1 - (y + 1) * cell}" v2="{1 - y * cell}"/>'
+            )
+        with open(os.path.join(src, stem + ".xml"), "w") as f:
+            f.write(f'<Atlas><Texture filename="{stem}.tex"/><Elements>{"".join(elements)}</Elements></Atlas>')
+    with open(os.path.join(src, "names.txt"), "w") as f:
+        f.write("\n".join(names))
+
+
+def make_assets(pipeline, tmp, size, args):
+    src = os.path.join(tmp, f"{pipeline}_{size}")
+    if os.path.exists(src):
+        return src
+    if pipeline == "ktech":
+        make_tex_files(src, size)
+    elif pipeline == "krane":
+        make_anim_folders(src, size, args.atlas_size)
+    else:
+        make_atlases(src, size, args.atlas_size, args.icons_per_atlas)
+    return src
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[round(q * (len(values) - 1))]
+
+
+def run_one(pipeline, src, workers, tools_dir, output_dir):
+    # Runs in the child process; prints one JSON line
+    from engine import CropBatch, KraneBatch, KtechBatch
+
+    if pipeline == "ktech":
+        tex_files = sorted(os.path.join(src, name) for name in os.listdir(src))
+        batch = KtechBatch(tex_files, output_dir, tools_dir, workers=workers)
+        kind = "ktech"
+    elif pipeline == "krane":
+        folders = sorted(os.path.join(src, name) for name in os.listdir(src))
+        batch = KraneBatch(folders, tools_dir, workers=workers, timeout=None)
+        kind = "krane"
+    else:
+        with open(os.path.join(src, "names.txt")) as f:
+            names = f.read().splitlines()
+        batch = CropBatch(src, output_dir, names, workers=workers)
+        kind = "crop"
+    start = time.perf_counter()
+    result = batch.run()
+    elapsed = time.perf_counter() - start
+
+    jobs = [record for record in result.report.records if record.kind == kind]
+    walls = [record.wall for record in jobs]
+    child_rss = [record.max_rss for record in jobs if record.max_rss is not None]
+    own_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        own_rss *= 1024
+    print(json.dumps({
+        "files": result.done,
+        "failed": len(result.failed),
+        "seconds": elapsed,
+        "files_per_s": result.done / elapsed if elapsed else 0.0,
+        "p50": percentile(walls, 0.50),
+        "p95": percentile(walls, 0.95),
+        "peak_rss": own_rss,
+        "child_peak_rss": max(child_rss) if child_rss else None,
+    }))
+
+
+def run_config(pipeline, src, workers, tools_dir, tmp, env):
+    output_dir = tempfile.mkdtemp(dir=tmp)
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--one", pipeline, src, str(workers), tools_dir, output_dir],
+        cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"{pipeline} x{workers} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def megabytes(value):
+    return "-" if value is None else f"{value / (1024 * 1024):.0f} MB"
+
+
+def int_list(text):
+    return [int(part) for part in text.split(",") if part]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pipelines", default=",".join(PIPELINES), help="comma separated, from ktech,krane,crop")
+    parser.add_argument("--sizes", type=int_list, default=[50, 200], help="batch sizes, comma separated")
+    parser.add_argument("--workers", type=int_list, default=sorted({1, default_workers()}),
+                        help="worker counts, comma separated")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stand-in ktech/krane run")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of stand-in runs that fail")
+    parser.add_argument("--atlas-size", type=int, default=1024)
+    parser.add_argument("--icons-per-atlas", type=int, default=64)
+    parser.add_argument("--json", help="also save the results to this file")
+    parser.add_argument("--one", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        pipeline, src, workers, tools_dir, output_dir = args.one
+        run_one(pipeline, src, int(workers), tools_dir, output_dir)
+        return
+    if os.name == 'nt':
+        sys.exit("The stand-in ktech/krane scripts need a POSIX shebang.")
+    pipelines = [p for p in args.pipelines.split(",") if p]
+    for pipeline in pipelines:
+        if pipeline not in PIPELINES:
+            parser.error(f"unknown pipeline {pipeline}")
+
+    env = dict(os.environ, FAKE_TOOL_LATENCY=str(args.latency), FAKE_TOOL_FAILURE_RATE=str(args.failure_rate))
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    results = []
+    print(f"stand-in latency {args.latency * 1000:.0f} ms, failure rate {args.failure_rate:.0%}")
+    print(f"{'pipeline':<8} {'files':>6} {'workers':>7} {'files/s':>9} {'p50':>8} {'p95':>8} "
+          f"{'failed':>6} {'peak mem':>9} {'child mem':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tools_dir = os.path.join(tmp, "tools")
+        make_fake_tools(tools_dir)
+        for pipeline in pipelines:
+            for size in args.sizes:
+                src = make_assets(pipeline, tmp, size, args)
+                for workers in args.workers:
+                    row = run_config(pipeline, src, workers, tools_dir, tmp, env)
+                    row.update(pipeline=pipeline, size=size, workers=workers)
+                    results.append(row)
+                    print(f"{pipeline:<8} {size:>6} {workers:>7} {row['files_per_s']:>9.1f} "
+                          f"{row['p50'] * 1000:>6.1f}ms {row['p95'] * 1000:>6.1f}ms {row['failed']:>6} "
+                          f"{megabytes(row['peak_rss']):>9} {megabytes(row['child_peak_rss']):>9}", flush=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
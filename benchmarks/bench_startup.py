@@ -0,0 +1,130 @@
+# Cold start of the UI: interpreter start, importing ktools_ui, and building
+# the window up to its first paint.
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --runs 10 --json startup.json
+#   python benchmarks/bench_startup.py --baseline startup.json --tolerance 0.25
+#
+# Every run is a fresh process in an empty folder, so no config file or job
+# journal is read and nothing is written next to the repo. First paint needs
+# a display; without one only the import is measured. The run fails when a
+# module that should only load on demand (Pillow, numpy, the xml parsers,
+# zipfile, ...) is imported at startup, or with --baseline, when the best
+# import or first paint got slower than the baseline by more than --tolerance.
+# The best of several runs is compared, as it varies far less than the median
+# on a busy machine.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by the code paths that need them, never at startup
+DEFERRED_MODULES = (
+    "PIL", "numpy", "tex_decoder", "atlas_index", "build_frames", "async_pool", "asyncio",
+    "xml", "zipfile", "tarfile", "idlelib", "thumbnails", "icon_preview",
+)
+METRICS = ("interpreter", "import", "paint", "process")
+
+
+def child():
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import configparser
+
+    import ktools_ui
+
+    imported = time.perf_counter()
+    row = {"import": imported - started, "paint": None}
+    try:
+        root = ktools_ui.create_main_window(configparser.ConfigParser())
+    except ktools_ui.tk.TclError as e:
+        row["error"] = str(e)
+    else:
+        root.wait_visibility()
+        root.update_idletasks()
+        root.update()
+        row["paint"] = time.perf_counter() - started
+        root.destroy()
+    row["deferred"] = sorted(
+        name for name in sys.modules if any(name == m or name.startswith(m + ".") for m in DEFERRED_MODULES))
+    print(json.dumps(row))
+
+
+def run_child(args, cwd):
+    started = time.perf_counter()
+    out = subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return time.perf_counter() - started, out
+
+
+def measure(runs):
+    rows = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(runs):
+            interpreter, _ = run_child([sys.executable, "-c", "pass"], cwd)
+            process, out = run_child([sys.executable, os.path.abspath(__file__), "--child"], cwd)
+            row = json.loads(out.splitlines()[-1])
+            row.update(interpreter=interpreter, process=process)
+            rows.append(row)
+    return rows
+
+
+def summarize(rows):
+    summary = {}
+    for metric in METRICS:
+        values = [row[metric] for row in rows if row.get(metric) is not None]
+        if values:
+            summary[metric] = {"best": min(values), "median": statistics.median(values), "max": max(values)}
+    summary["deferred"] = sorted({name for row in rows for name in row["deferred"]})
+    summary["error"] = next((row["error"] for row in rows if "error" in row), None)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10, help="fresh processes to time (default: %(default)s)")
+    parser.add_argument("--json", help="also save the results to this file, to use as a later --baseline")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="slowdown of the best run allowed against --baseline (default: %(default)s)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return 0
+
+    summary = summarize(measure(max(1, args.runs)))
+    print(f"{'':<12} {'best':>9} {'median':>9} {'max':>9}")
+    for metric in METRICS:
+        if metric in summary:
+            print(f"{metric:<12}" + "".join(f" {summary[metric][k] * 1000:>7.1f}ms" for k in ("best", "median", "max")))
+    if summary["error"]:
+        print(f"first paint not measured: {summary['error']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=1)
+
+    failed = False
+    if summary["deferred"]:
+        print("imported at startup: " + ", ".join(summary["deferred"]))
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for metric in ("import", "paint"):
+            if metric not in summary or metric not in baseline:
+                continue
+            before, now = baseline[metric]["best"], summary[metric]["best"]
+            if now > before * (1 + args.tolerance):
+                print(f"{metric} regressed: {before * 1000:.1f}ms -> {now * 1000:.1f}ms")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# Correctness and throughput of the built-in TEX decoder.
+#
+#   python benchmarks/bench_tex_decoder.py
+#       Decodes random DXT1/DXT3/DXT5 textures, checks every pixel against a
+#       plain per-block reference decoder and reports decode throughput.
+#   python benchmarks/bench_tex_decoder.py --ktech /path/to/ktech --tex-dir DIR
+#       Also converts every .tex in DIR with ktech and compares the pngs with
+#       the built-in decoder, and times both backends.
+import argparse
+import glob
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from subprocess import DEVNULL
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tex_decoder import BLOCK_BYTES, DXT1, DXT3, DXT5, PIXEL_FORMAT_NAMES, TexFile, read_tex
+
+
+def make_tex(pixel_format, width, height, seed=0):
+    # Post-caves KTEX with one mipmap of random block data; any bytes are valid DXT
+    block_bytes = BLOCK_BYTES[pixel_format]
+    blocks = ((width + 3) // 4) * ((height + 3) // 4)
+    data = np.random.default_rng(seed).integers(0, 256, blocks * block_bytes, np.uint8).tobytes()
+    bits = (0xFFF << 20) | (1 << 13) | (pixel_format << 4)
+    pitch = ((width + 3) // 4) * block_bytes
+    return b"KTEX" + struct.pack("<I", bits) + struct.pack("<HHHI", width, height, pitch, len(data)) + data
+
+
+def _565(c):
+    r, g, b = (c >> 11) & 0x1F, (c >> 5) & 0x3F, c & 0x1F
+    return [(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)]
+
+
+def reference_block(block, pixel_format):
+    # 16 RGBA pixels of one block, straight from the DXT specification
+    color = block if pixel_format == DXT1 else block[8:]
+    c0, c1, bits = struct.unpack("<HHI", bytes(color[:8]))
+    p0, p1 = _565(c0), _565(c1)
+    if c0 > c1 or pixel_format != DXT1:
+        palette = [p0 + [255], p1 + [255],
+                   [(2 * a + b) // 3 for a, b in zip(p0, p1)] + [255],
+                   [(a + 2 * b) // 3 for a, b in zip(p0, p1)] + [255]]
+    else:
+        palette = [p0 + [255], p1 + [255], [(a + b) // 2 for a, b in zip(p0, p1)] + [255], [0, 0, 0, 0]]
+    pixels = [list(palette[(bits >> (2 * i)) & 3]) for i in range(16)]
+    if pixel_format == DXT3:
+        for i in range(16):
+            pixels[i][3] = ((block[i // 2] >> (4 * (i % 2))) & 0xF) * 17
+    elif pixel_format == DXT5:
+        a0, a1 = block[0], block[1]
+        if a0 > a1:
+            alphas = [a0, a1] + [((7 - i) * a0 + i * a1) // 7 for i in range(1, 7)]
+        else:
+            alphas = [a0, a1] + [((5 - i) * a0 + i * a1) // 5 for i in range(1, 5)] + [0, 255]
+        abits = int.from_bytes(bytes(block[2:8]), "little")
+        for i in range(16):
+            pixels[i][3] = alphas[(abits >> (3 * i)) & 7]
+    return pixels
+
+
+def reference_decode(tex):
+    mipmap = tex.mipmaps[0]
+    block_bytes = BLOCK_BYTES[tex.pixel_format]
+    blocks_x = (mipmap.width + 3) // 4
+    blocks_y = (mipmap.height + 3) // 4
+    out = np.zeros((blocks_y * 4, blocks_x * 4, 4), np.uint8)
+    for by in range(blocks_y):
+        for bx in range(blocks_x):
+            start = mipmap.offset + (by * blocks_x + bx) * block_bytes
+            pixels = reference_block(tex.data[start:start + block_bytes], tex.pixel_format)
+            for i, pixel in enumerate(pixels):
+                out[by * 4 + i // 4, bx * 4 + i % 4] = pixel
+    return out[:mipmap.height, :mipmap.width][::-1]
+
+
+def check_reference():
+    ok = True
+    for pixel_format in (DXT1, DXT3, DXT5):
+        for width, height in ((64, 64), (30, 18), (4, 4), (1, 1)):
+            tex = TexFile(make_tex(pixel_format, width, height, seed=width * height))
+            same = np.array_equal(tex.pixels(), reference_decode(tex))
+            ok = ok and same
+            print(f"  {PIXEL_FORMAT_NAMES[pixel_format]} {width}x{height}: {'ok' if same else 'MISMATCH'}")
+    return ok
+
+
+def bench_decode(size, repeat):
+    for pixel_format in (DXT1, DXT3, DXT5):
+        tex = TexFile(make_tex(pixel_format, size, size))
+        tex.pixels()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            tex.pixels()
+        elapsed = (time.perf_counter() - start) / repeat
+        mpix = size * size / elapsed / 1e6
+        print(f"  {PIXEL_FORMAT_NAMES[pixel_format]} {size}x{size}: {elapsed * 1000:7.1f} ms  {mpix:7.1f} Mpixel/s")
+
+
+def check_ktech(ktech, tex_dir):
+    tex_files = sorted(glob.glob(os.path.join(tex_dir, "*.tex")))
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for tex_file in tex_files:
+            subprocess.run([ktech, tex_file, tmp], stdout=DEVNULL, check=True)
+        ktech_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decoded = {}
+        for tex_file in tex_files:
+            decoded[tex_file] = read_tex(tex_file).image()
+        builtin_time = time.perf_counter() - start
+
+        worst = 0
+        for tex_file in tex_files:
+            base = os.path.splitext(os.path.basename(tex_file))[0]
+            expected = np.asarray(Image.open(os.path.join(tmp, base + ".png")).convert("RGBA"), np.int16)
+            actual = np.asarray(decoded[tex_file], np.int16)
+            if expected.shape != actual.shape:
+                print(f"  {base}: size {actual.shape} != ktech {expected.shape}")
+                worst = 255
+                continue
+            diff = int(np.abs(expected - actual).max()) if expected.size else 0
+            worst = max(worst, diff)
+            if diff:
+                print(f"  {base}: max channel difference {diff}")
+    count = len(tex_files)
+    print(f"  {count} files, worst channel difference {worst}")
+    if count:
+        print(f"  ktech (incl. png write): {count / ktech_time:7.1f} files/s")
+        print(f"  built-in (decode only):  {count / builtin_time:7.1f} files/s")
+    return worst == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ktech", help="ktech executable to compare against")
+    parser.add_argument("--tex-dir", help="folder with real .tex files for the ktech comparison")
+    args = parser.parse_args()
+
+    print("Vectorized decoder vs reference decoder:")
+    ok = check_reference()
+    print("Decode throughput:")
+    bench_decode(args.size, args.repeat)
+    if args.ktech and args.tex_dir:
+        print("Built-in decoder vs ktech:")
+        ok = check_ktech(args.ktech, args.tex_dir) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
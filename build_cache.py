@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CACHE_DIR = "ktools_ui_cache"
+MANIFEST_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+# Seconds between saves during a run, so a crash only loses the last few records
+SAVE_INTERVAL = 5.0
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Linux ioctl that makes a file share another's blocks (btrfs, xfs, bcachefs)
+FICLONE = 0x40049409
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+COPY = "copy"
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def link_or_copy(src, dst):
+    # Makes dst a copy of src without writing the bytes again where the
+    # filesystem allows. Returns HARDLINK, REFLINK or COPY.
+    tmp_path = dst + ".tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+        method = HARDLINK
+    except OSError:
+        try:
+            _reflink(src, tmp_path)
+            method = REFLINK
+        except (ImportError, OSError):
+            shutil.copyfile(src, tmp_path)
+            method = COPY
+    os.replace(tmp_path, dst)
+    return method
+
+
+def unlink_shared(path):
+    # A tool rewriting a hardlinked output in place would change every link,
+    # so such an output is removed before it is built again
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def lock_file(f):
+    # Blocks until this process holds f's exclusive lock, released when f is closed
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def tool_identity(exe):
+    # ktech and krane have no version flag, so the binary's path, mtime and
+    # size stand in for its version: replacing the tool rebuilds everything
+    path = shutil.which(exe) or exe
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class BuildManifest:
+    """Output path -> the sources, tool and options it was last built from.
+
+    Sources are compared by mtime and size first; only a file whose stat
+    changed is hashed, so touching a file without editing it does not
+    rebuild its output. Saved under CACHE_DIR, one manifest per tool, which
+    batches of the same tool running at once share: each save merges this
+    run's changes into the entries on disk.
+    """
+
+    def __init__(self, name, cache_dir=CACHE_DIR):
+        self.path = os.path.join(cache_dir, "build_manifest", name + ".json")
+        self.entries = {}
+        self._hashes = {}  # (path, mtime_ns, size) -> sha1 computed this run
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._pending = {}  # output -> entry, or None once forgotten, until saved
+        self._last_save = time.monotonic()
+        self.load()
+
+    def load(self):
+        self.entries = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                return data["outputs"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+                self._last_save = time.monotonic()
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + ".lock", "a") as lock:
+                    lock_file(lock)
+                    # Another batch may have saved since: only this run's outputs are replaced
+                    entries = self._read()
+                    for key, entry in pending.items():
+                        if entry is None:
+                            entries.pop(key, None)
+                        else:
+                            entries[key] = entry
+                    self._write({"version": MANIFEST_VERSION, "outputs": entries})
+            except OSError:
+                with self._lock:
+                    for key, entry in pending.items():
+                        self._pending.setdefault(key, entry)
+                raise
+            with self._lock:
+                for key, entry in entries.items():
+                    if key not in self._pending:
+                        self.entries[key] = entry
+
+    def _write(self, data):
+        folder = os.path.dirname(self.path)
+        # A name of its own, so two processes saving at once never write the same file
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _maybe_save(self):
+        if time.monotonic() - self._last_save >= SAVE_INTERVAL:
+            try:
+                self.save()
+            except OSError:
+                pass  # Kept for the next save
+
+    def _fingerprint(self, path, old=None):
+        # [mtime_ns, size, sha1]; the hash of `old` is reused when the stat matches
+        st = os.stat(path)
+        if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+            return old
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            digest = file_hash(path)
+            with self._lock:
+                self._hashes[key] = digest
+        return [st.st_mtime_ns, st.st_size, digest]
+
+    def is_current(self, output, sources, tool, options):
+        # True if output was built from exactly these source contents, tool and options
+        key = os.path.abspath(output)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None or entry["tool"] != tool or entry["options"] != options:
+            return False
+        sources = [os.path.abspath(s) for s in sources]
+        if sorted(sources) != sorted(entry["sources"]):
+            return False
+        if not all(os.path.exists(p) for p in entry["outputs"]):
+            return False
+        refreshed = {}
+        try:
+            for path in sources:
+                old = entry["sources"][path]
+                new = self._fingerprint(path, old)
+                if new[2] != old[2]:
+                    return False
+                refreshed[path] = new
+        except OSError:
+            return False
+        if refreshed != entry["sources"]:
+            # Same contents with a new mtime: remember the stat for the fast path next time
+            with self._lock:
+                entry["sources"] = refreshed
+                self._pending[key] = entry
+        return True
+
+    def record(self, output, sources, tool, options, outputs=None):
+        try:
+            fingerprints = {os.path.abspath(s): self._fingerprint(os.path.abspath(s)) for s in sources}
+        except OSError:
+            self.forget(output)
+            return
+        entry = {
+            "sources": fingerprints,
+            "tool": tool,
+            "options": options,
+            "outputs": [os.path.abspath(p) for p in (outputs or [output])],
+        }
+        key = os.path.abspath(output)
+        with self._lock:
+            self.entries[key] = entry
+            self._pending[key] = entry
+        self._maybe_save()
+
+    def forget(self, output):
+        key = os.path.abspath(output)
+        with self._lock:
+            # Also dropped from disk, where another batch may have recorded it
+            self.entries.pop(key, None)
+            self._pending[key] = None
+        self._maybe_save()
@@ -0,0 +1,178 @@
+import math
+import os
+import struct
+
+from PIL import Image, ImageChops, ImageDraw
+
+from anim_preflight import BUILD_MAGIC, BUILD_VERSIONS, VERTEX_FLOATS, AnimError
+from atlas_index import load_atlas_image, tex_decoder
+
+# Cuts every symbol frame of a build.bin out of its atlases, without krane.
+# Each frame is a set of triangles whose u/v select atlas pixels and whose
+# x/y place them in the frame's bounding box. The pngs match the frame
+# images of a krane scml project: <symbol>/<symbol>-<frame number>.png.
+
+_HEADER = struct.Struct("<4siII")  # magic, version, symbols, frames
+_UINT = struct.Struct("<I")
+_FRAME = struct.Struct("<II4fII")  # frame number, duration, x, y, w, h, first vertex, vertex count
+_VERTEX = struct.Struct(f"<{VERTEX_FLOATS}f")
+
+
+class Frame:
+    def __init__(self, number, duration, x, y, w, h, vertices):
+        self.number = number
+        self.duration = duration
+        self.x, self.y, self.w, self.h = x, y, w, h  # bounding box center and size
+        self.vertices = vertices  # [(x, y, z, u, v, atlas index)]
+
+
+class Symbol:
+    def __init__(self, name_hash):
+        self.name_hash = name_hash
+        self.name = f"symbol_{name_hash:08x}"  # Replaced by the build's string table
+        self.frames = []
+
+
+class Build:
+    def __init__(self, name, atlases, symbols):
+        self.name = name
+        self.atlases = atlases
+        self.symbols = symbols
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt):
+        if self.offset + fmt.size > len(self.data):
+            raise AnimError("build.bin is truncated")
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def uint(self):
+        return self.unpack(_UINT)[0]
+
+    def string(self):
+        length = self.uint()
+        end = self.offset + length
+        if end > len(self.data):
+            raise AnimError("build.bin is truncated")
+        text = self.data[self.offset:end].decode("utf-8", errors="replace")
+        self.offset = end
+        return text
+
+
+def parse_build(data):
+    reader = _Reader(data)
+    magic, version, symbol_count, _ = reader.unpack(_HEADER)
+    if magic != BUILD_MAGIC:
+        raise AnimError("build.bin is not a BILD file")
+    if version not in BUILD_VERSIONS:
+        raise AnimError(f"build.bin version {version} not supported")
+    name = reader.string()
+    atlases = [reader.string() for _ in range(reader.uint())]
+    symbols = []
+    spans = []  # (frame, first vertex, vertex count), filled in once the vertices are read
+    for _ in range(symbol_count):
+        symbol = Symbol(reader.uint())
+        for _ in range(reader.uint()):
+            number, duration, x, y, w, h, first, count = reader.unpack(_FRAME)
+            frame = Frame(number, duration, x, y, w, h, [])
+            symbol.frames.append(frame)
+            spans.append((frame, first, count))
+        symbols.append(symbol)
+    vertices = [reader.unpack(_VERTEX) for _ in range(reader.uint())]
+    for frame, first, count in spans:
+        if first + count > len(vertices):
+            raise AnimError(f"frame {frame.number} uses vertices past the end of build.bin")
+        frame.vertices = vertices[first:first + count]
+    names = {}
+    if reader.offset < len(data):
+        for _ in range(reader.uint()):
+            name_hash = reader.uint()
+            names[name_hash] = reader.string()
+    for symbol in symbols:
+        if symbol.name_hash in names:
+            symbol.name = names[symbol.name_hash]
+    return Build(name, atlases, symbols)
+
+
+def read_build(path):
+    with open(path, "rb") as f:
+        return parse_build(f.read())
+
+
+def atlas_path(folder, name):
+    # The atlas .tex, or the png ktech made of it when numpy is not installed
+    stem = os.path.splitext(os.path.join(folder, os.path.basename(name)))[0]
+    if tex_decoder is not None and os.path.exists(stem + ".tex"):
+        return stem + ".tex"
+    if os.path.exists(stem + ".png"):
+        return stem + ".png"
+    if tex_decoder is None:
+        raise AnimError(f"decoding {os.path.basename(name)} needs numpy, or convert it to png first")
+    raise AnimError(f"missing {os.path.basename(name)}")
+
+
+def cut_frame(frame, atlases):
+    # The frame as an RGBA image the size of its bounding box
+    width = max(1, round(frame.w))
+    height = max(1, round(frame.h))
+    canvas = Image.new("RGBA", (width, height))
+    if len(frame.vertices) < 3:
+        return canvas
+    atlas = atlases[int(frame.vertices[0][5])]
+    aw, ah = atlas.size
+    # Triangle corners in atlas pixels; v runs up from the bottom of the atlas
+    points = [(u * aw, (1 - v) * ah) for _, _, _, u, v, _ in frame.vertices]
+    left = max(0, math.floor(min(p[0] for p in points)))
+    top = max(0, math.floor(min(p[1] for p in points)))
+    right = min(aw, math.ceil(max(p[0] for p in points)))
+    bottom = min(ah, math.ceil(max(p[1] for p in points)))
+    if right <= left or bottom <= top:
+        return canvas
+    piece = atlas.crop((left, top, right, bottom)).convert("RGBA")
+
+    # Only the pixels inside the triangles belong to this frame; the rest of
+    # the box may hold neighbouring sprites of the atlas
+    mask = Image.new("L", piece.size, 0)
+    draw = ImageDraw.Draw(mask)
+    for i in range(0, len(points) - 2, 3):
+        draw.polygon([(x - left, y - top) for x, y in points[i:i + 3]], fill=255)
+    piece.putalpha(ImageChops.multiply(piece.getchannel("A"), mask))
+
+    # x/y of the same corners, relative to the top left of the bounding box
+    xs = [x - (frame.x - frame.w / 2) for x, _, _, _, _, _ in frame.vertices]
+    ys = [y - (frame.y - frame.h / 2) for _, y, _, _, _, _ in frame.vertices]
+    size = (max(1, round(max(xs) - min(xs))), max(1, round(max(ys) - min(ys))))
+    if size != piece.size:
+        # The build was exported at a different scale than its atlas
+        piece = piece.resize(size, Image.LANCZOS)
+    canvas.paste(piece, (round(min(xs)), round(min(ys))))
+    return canvas
+
+
+def extract_frames(folder, output_dir, save=None):
+    """Writes every frame of folder's build.bin to output_dir and returns the
+    png paths. save(image, path) writes one png, Image.save by default."""
+    build = read_build(os.path.join(folder, "build.bin"))
+    # Every atlas is decoded once, however many frames it holds
+    atlases = [load_atlas_image(atlas_path(folder, name)) for name in build.atlases]
+    written = []
+    for symbol in build.symbols:
+        symbol_dir = os.path.join(output_dir, symbol.name)
+        os.makedirs(symbol_dir, exist_ok=True)
+        for frame in symbol.frames:
+            if frame.vertices and int(frame.vertices[0][5]) >= len(atlases):
+                raise AnimError(f"{symbol.name} frame {frame.number} uses a missing atlas")
+            path = os.path.join(symbol_dir, f"{symbol.name}-{frame.number}.png")
+            image = cut_frame(frame, atlases)
+            if save is None:
+                image.save(path)
+            else:
+                save(image, path)
+            written.append(path)
+    return written
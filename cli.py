@@ -0,0 +1,375 @@
+import argparse
+import signal
+import sys
+import threading
+import time
+
+from engine import (
+    BACKEND_BUILTIN, BACKEND_KRANE, BACKEND_KTECH, CONVERTING, DEFAULT_KRANE_TIMEOUT, DEFAULT_PNG_LEVEL, NOT_FOUND,
+    RETRY_STATUSES, RUNNER_THREADS, RUNNERS, SUCCESS, CropBatch, EngineError, KraneBatch, KtechBatch,
+    resume_batch, scan_anim_folders, scan_tex_files, watch_tree,
+)
+from job_journal import JOURNAL_FILE, JobJournal
+from run_report import DEFAULT_SLOWEST
+from process_pool import default_workers
+from scheduler import SCHEDULER
+from crop_pack import DEFAULT_PACK_NAME, PACK_FILES, PACKINGS
+from tree_watch import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL
+from spool import DEFAULT_CHUNK, Spool, SpoolBatch, SpoolWorker
+
+# Headless front end: python -m ktools_ui ktech|krane|crop|jobs|resume|worker|spool ...
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m ktools_ui", description="Batch ktech/krane/crop without the UI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ktech = commands.add_parser("ktech", help="convert .tex files to png")
+    ktech.add_argument("tex_files", nargs="*", help=".tex files to convert")
+    ktech.add_argument("--scan", metavar="FOLDER",
+                       help="convert every .tex under FOLDER, mirroring its subfolders in the output folder")
+    ktech.add_argument("-o", "--output", required=True, help="output folder")
+    ktech.add_argument("--ktech-dir", default="", help="folder containing ktech (default: ktech on PATH)")
+    ktech.add_argument("--backend", choices=(BACKEND_KTECH, BACKEND_BUILTIN), default=BACKEND_KTECH)
+    ktech.add_argument("--dedup", action="store_true",
+                       help="convert identical .tex files once and link the other pngs to that output")
+
+    krane = commands.add_parser("krane", help="convert anim folders to scml")
+    krane.add_argument("anim_folders", nargs="*", help="folders with anim.bin, build.bin and .tex")
+    krane.add_argument("--scan", metavar="FOLDER", help="convert every anim folder under FOLDER")
+    krane.add_argument("-o", "--output",
+                       help="with --scan, output folder mirroring FOLDER (default: output/ in each anim folder)")
+    krane.add_argument("--krane-dir", default="", help="folder containing krane (default: krane on PATH)")
+    krane.add_argument("--backend", choices=(BACKEND_KRANE, BACKEND_BUILTIN), default=BACKEND_KRANE,
+                       help="built-in writes each build.bin symbol frame as a png, without krane or an scml")
+    krane.add_argument("--no-preflight", action="store_true",
+                       help="start krane on every folder without checking its .bin and .tex files first")
+    krane.add_argument("--timeout", type=int, default=DEFAULT_KRANE_TIMEOUT,
+                       help="seconds before one folder is killed, 0 for no limit (default: %(default)s)")
+
+    crop = commands.add_parser("crop", help="crop icons out of atlases")
+    crop.add_argument("names", nargs="*", help="icon names or patterns such as armor_*")
+    crop.add_argument("--names-file", help="file with one icon name or pattern per line")
+    crop.add_argument("-s", "--source", required=True, help="folder with atlas xml and png/tex files")
+    crop.add_argument("-o", "--output", required=True, help="output folder")
+    crop.add_argument("--force64", action="store_true", help="crop a 64x64 window around each icon's center")
+    crop.add_argument("--png-level", type=int, choices=range(10), default=DEFAULT_PNG_LEVEL, metavar="0-9")
+    crop.add_argument("--optimize", action="store_true", help="optimize png files for size")
+    crop.add_argument("--pack", choices=PACKINGS, default=PACK_FILES,
+                      help="write a png per icon, one zip or tar of them, or a new atlas png and xml "
+                           "(default: %(default)s)")
+    crop.add_argument("--pack-name", default=DEFAULT_PACK_NAME,
+                      help="file name of the zip, tar or atlas, without extension (default: %(default)s)")
+
+    jobs = commands.add_parser("jobs", help="list recent ktech/krane batches in the job journal")
+    jobs.add_argument("-n", "--limit", type=int, default=20, help="batches to list (default: %(default)s)")
+
+    resume = commands.add_parser("resume", help="continue a cancelled or crashed ktech/krane batch")
+    resume.add_argument("job_id", type=int, help="batch number from the jobs command")
+    resume.add_argument("--failed", action="store_true", help="only convert the items that failed or timed out")
+    resume.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+
+    worker = commands.add_parser("worker", help="run ktech/krane/crop jobs other machines put in a spool folder")
+    worker.add_argument("spool", help="spool folder shared with the coordinator and the other workers")
+    worker.add_argument("-j", "--workers", type=int, default=default_workers(),
+                        help="parallel jobs on this machine, raising --cpu-budget to match (default: %(default)s)")
+    worker.add_argument("--ktech-dir", help="folder containing ktech here (default: the coordinator's)")
+    worker.add_argument("--krane-dir", help="folder containing krane here (default: the coordinator's)")
+    worker.add_argument("--runner", choices=RUNNERS, help="runner for ktech/krane here (default: the coordinator's)")
+    worker.add_argument("--log-dir", metavar="DIR", help="write each job's full stderr to DIR/<name>.log")
+    worker.add_argument("--name", help="worker name in the spool folder (default: host-pid)")
+    worker.add_argument("--exit-idle", type=float, metavar="SECONDS",
+                        help="exit once no job has been queued or running for SECONDS (default: keep waiting)")
+    worker.add_argument("-q", "--quiet", action="store_true", help="only print the jobs taken")
+
+    status = commands.add_parser("spool", help="list the jobs and workers of a spool folder")
+    status.add_argument("spool", help="spool folder")
+
+    for command in (ktech, krane):
+        command.add_argument("-i", "--incremental", action="store_true",
+                             help="only convert inputs whose content, tool or options changed since the last run")
+        command.add_argument("--no-journal", action="store_true",
+                             help="do not record the batch in %s, so it cannot be resumed" % JOURNAL_FILE)
+        command.add_argument("--runner", choices=RUNNERS, default=RUNNER_THREADS,
+                             help="run the tools from worker threads or one asyncio loop (default: %(default)s)")
+        command.add_argument("--log-dir", metavar="DIR", help="write each job's full stderr to DIR/<name>.log")
+        command.add_argument("--watch", action="store_true",
+                             help="with --scan, keep converting what is added or changed under FOLDER until Ctrl+C")
+        command.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, metavar="SECONDS",
+                             help="with --watch, seconds between polls of FOLDER (default: %(default)s)")
+        command.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE, metavar="SECONDS",
+                             help="with --watch, seconds a file must stay unchanged before it is converted "
+                                  "(default: %(default)s)")
+
+    for command in (ktech, crop):
+        command.add_argument("--variants", default="", metavar="PROFILE",
+                             help="also write every png at other sizes, each in its own subfolder of the output, "
+                                  "from the same decoded image, e.g. \"64=64+square 32=32+square+nearest trim\"")
+
+    for command in (ktech, krane, crop, resume, worker):
+        command.add_argument("--cpu-budget", type=int, metavar="N",
+                             help="jobs that may run at once in this process, whatever -j asks for "
+                                  "(default: the larger of -j and the CPU count, %d)" % default_workers())
+
+    for command in (ktech, krane, crop, resume):
+        command.add_argument("--report", metavar="FILE",
+                             help="save the time, CPU, memory and stderr of every job as .json or .csv")
+        command.add_argument("--slowest", type=int, default=0, metavar="N", help="print the N slowest jobs")
+
+    for command in (ktech, krane, crop):
+        command.add_argument("--skip", action="store_true", help="skip inputs whose output already exists")
+        command.add_argument("-j", "--workers", type=int, default=default_workers(),
+                             help="parallel jobs, raising --cpu-budget to match (default: %(default)s)")
+        command.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+        command.add_argument("--spool", metavar="DIR",
+                             help="queue the jobs in DIR for worker processes, on this or other machines, "
+                                  "and wait for their results")
+        command.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, metavar="N",
+                             help="with --spool, inputs per queued job (default: %(default)s)")
+    return parser
+
+
+def journal_path(args):
+    return None if args.no_journal else JOURNAL_FILE
+
+
+def list_jobs(limit):
+    journal = JobJournal()
+    try:
+        jobs = journal.jobs(limit=limit)
+    finally:
+        journal.close()
+    for job in jobs:
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(job.created))
+        line = (f"{job.id:>5}  {job.kind:<5}  {created}  {job.state:<9}  "
+                f"{job.total - job.pending}/{job.total} done")
+        failed = job.count(*RETRY_STATUSES)
+        if failed:
+            line += f", {failed} failed"
+        if not job.scan_complete:
+            line += ", scan unfinished"
+        print(line)
+
+
+def make_batch(args, on_progress, changed=None):
+    # changed: the inputs a --watch poll found, converted incrementally and
+    # left out of the journal instead of the inputs args names or scans
+    if args.command == "resume":
+        return resume_batch(args.job_id, failed_only=args.failed, on_progress=on_progress)
+    if args.command in ("ktech", "krane"):
+        incremental = args.incremental or changed is not None
+        journal = None if changed is not None else journal_path(args)
+    if args.command == "ktech":
+        tex_files = changed if changed is not None else args.tex_files
+        if args.scan and changed is None:
+            # Converting starts while the scan is still walking the tree
+            tex_files = scan_tex_files(args.scan, exclude=[args.output])
+        return KtechBatch(
+            tex_files, args.output, args.ktech_dir, skip_existing=args.skip,
+            workers=args.workers, backend=args.backend, incremental=incremental,
+            source_root=args.scan, runner=args.runner, log_dir=args.log_dir, dedup=args.dedup,
+            variants=args.variants, on_progress=on_progress, journal_path=journal
+        )
+    if args.command == "krane":
+        anim_folders = changed if changed is not None else args.anim_folders
+        if args.scan and changed is None:
+            anim_folders = scan_anim_folders(args.scan, exclude=[args.output])
+        return KraneBatch(
+            anim_folders, args.krane_dir, skip_existing=args.skip,
+            workers=args.workers, timeout=args.timeout, incremental=incremental,
+            source_root=args.scan, output_dir=args.output, runner=args.runner, log_dir=args.log_dir,
+            preflight=not args.no_preflight, backend=args.backend, on_progress=on_progress,
+            journal_path=journal
+        )
+    names = list(args.names)
+    if args.names_file:
+        with open(args.names_file, encoding="utf-8") as f:
+            names.extend(f.read().splitlines())
+    return CropBatch(
+        args.source, args.output, names, force64=args.force64, skip_existing=args.skip,
+        workers=args.workers, png_level=args.png_level, png_optimize=args.optimize,
+        packing=args.pack, pack_name=args.pack_name, variants=args.variants, on_progress=on_progress
+    )
+
+
+def spooled(args, batch, on_progress):
+    # batch itself, or with --spool, a coordinator queuing its inputs for workers
+    if not getattr(args, "spool", None):
+        return batch
+    return SpoolBatch(Spool(args.spool), batch, args.chunk, on_progress)
+
+
+def apply_cpu_budget(args, workers):
+    # Every job holds one of SCHEDULER's slots, which default to the CPU
+    # count; I/O or memory bound jobs may ask for more with -j
+    SCHEDULER.set_slots(args.cpu_budget or max(SCHEDULER.slots, int(workers or 1)))
+
+
+def run_worker(args):
+    spool = Spool(args.spool)
+    apply_cpu_budget(args, args.workers)
+    overrides = {"workers": args.workers, "ktech_dir": args.ktech_dir, "krane_dir": args.krane_dir,
+                 "runner": args.runner, "log_dir": args.log_dir}
+    lock = threading.Lock()
+
+    def on_progress(idx, text):
+        if args.quiet or text.endswith(CONVERTING):
+            return
+        with lock:
+            print(text, flush=True)
+
+    def on_job(job):
+        print(f"{job['id']}: {len(job['items'])} {job['kind']} inputs", flush=True)
+
+    worker = SpoolWorker(spool, args.name, overrides, on_progress, on_job)
+    # Ctrl+C stops the worker; its unfinished job goes back to the queue
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    print(f"Worker {worker.name} waiting for jobs in {args.spool}, Ctrl+C to stop.", flush=True)
+    worker.run(idle_exit=args.exit_idle)
+    print(f"{worker.jobs} jobs done.")
+    return 0
+
+
+def spool_status(path):
+    spool = Spool(path)
+    now = spool.now("status")
+    counts = {folder: len(spool.names(folder)) for folder in ("queue", "claimed", "done")}
+    print(f"{counts['queue']} queued, {counts['claimed']} running, "
+          f"{counts['done']} finished but not collected by their coordinator")
+    for worker, age, job in spool.workers(now):
+        state = "dead" if age > spool.dead_after else "idle" if job is None else f"running {job}"
+        print(f"{worker:<30} {state}, heartbeat {age:.0f}s ago")
+    spool.leave("status")
+    return 0
+
+
+def print_result(args, batch, result):
+    # Summary of one finished batch; returns the exit code it deserves
+    summary = (f"{result.count(SUCCESS)} succeeded, {len(result.failed)} failed, "
+               f"{len(result.timed_out)} timed out, {result.skipped} skipped")
+    if result.up_to_date:
+        summary += f", {result.up_to_date} up to date"
+    if result.invalid:
+        summary += f", {len(result.invalid)} invalid"
+    if result.count(NOT_FOUND):
+        summary += f", {result.count(NOT_FOUND)} not found"
+    print(summary, flush=True)
+    if result.duplicates:
+        print(result.dedup_summary())
+    if args.slowest > 0 and result.report.records:
+        print("Slowest jobs:")
+        for line in result.report.summary_lines(args.slowest):
+            print(line)
+    if args.report:
+        try:
+            result.report.save(args.report, slowest=args.slowest or DEFAULT_SLOWEST)
+        except OSError as e:
+            print(f"Cannot save report: {e}", file=sys.stderr)
+    if result.failed:
+        print("Failed: " + ", ".join(result.failed))
+    if result.timed_out:
+        print("Timed out: " + ", ".join(result.timed_out))
+    for name in result.invalid:
+        print(f"Invalid: {name} ({result.reasons[name]})")
+    if result.cancelled:
+        if batch.job_id is not None:
+            print(f"Cancelled. Continue with: python -m ktools_ui resume {batch.job_id}")
+        else:
+            print("Cancelled.")
+        return 130
+    return 1 if result.failed or result.timed_out or result.invalid else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "ktech" and bool(args.tex_files) == bool(args.scan):
+        parser.error("ktech needs either .tex files or --scan")
+    if args.command == "krane" and bool(args.anim_folders) == bool(args.scan):
+        parser.error("krane needs either anim folders or --scan")
+    if args.command == "krane" and args.output and not args.scan:
+        parser.error("krane --output needs --scan")
+    watch = getattr(args, "watch", False)
+    if watch and not args.scan:
+        parser.error("--watch needs --scan")
+    if getattr(args, "spool", None) and args.command == "crop" and args.pack != PACK_FILES:
+        parser.error("crop --pack needs one machine to write the file, it cannot be used with --spool")
+    if args.command == "jobs":
+        list_jobs(args.limit)
+        return 0
+    try:
+        if args.command == "worker":
+            return run_worker(args)
+        if args.command == "spool":
+            return spool_status(args.spool)
+    except EngineError as e:
+        print(e, file=sys.stderr)
+        return 2
+    lock = threading.Lock()
+
+    def on_progress(idx, text):
+        if args.quiet or text.endswith(CONVERTING):
+            return
+        with lock:
+            print(text, flush=True)
+
+    def changed_batch(changed):
+        return spooled(args, make_batch(args, on_progress, changed), on_progress)
+
+    session = None
+    try:
+        if watch:
+            # The snapshot is taken first, so files changed during the first batch are picked up after it
+            session = watch_tree(
+                args.command, args.scan, changed_batch,
+                exclude=[args.output], interval=args.interval, debounce=args.debounce
+            )
+        batch = make_batch(args, on_progress)
+        if args.command == "crop" and not batch.names:
+            print("No icon names given.", file=sys.stderr)
+            return 2
+        if args.command == "resume":
+            apply_cpu_budget(args, batch.options().get("workers"))
+        else:
+            apply_cpu_budget(args, args.workers)
+        batch = spooled(args, batch, on_progress)
+    except EngineError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    # Ctrl+C cancels the running batch, which kills every running ktech/krane
+    # child, and ends a --watch
+    running = [batch]
+
+    def interrupt(signum, frame):
+        if session is not None:
+            session.stop()
+        running[0].cancel()
+
+    signal.signal(signal.SIGINT, interrupt)
+    try:
+        result = batch.run()
+    except EngineError as e:
+        print(e, file=sys.stderr)
+        return 2
+    code = print_result(args, batch, result)
+    if args.command == "crop" and batch.pack_paths:
+        print("Wrote " + ", ".join(batch.pack_paths))
+    if session is None or result.cancelled:
+        return code
+
+    print(f"Watching {args.scan} for changes, Ctrl+C to stop.", flush=True)
+    for batch in session.batches():
+        running[0] = batch
+        if session.stopped:
+            break  # Ctrl+C came while the changes were being collected
+        print(f"{batch.total} changed, converting...", flush=True)
+        try:
+            result = batch.run()
+        except EngineError as e:
+            print(e, file=sys.stderr)
+            continue
+        code = print_result(args, batch, result)
+        if result.cancelled:
+            return code
+    return 0
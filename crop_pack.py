@@ -0,0 +1,216 @@
+import io
+import os
+import time
+
+# Crop outputs written as one file instead of a png per icon: a zip or tar
+# of the pngs, streamed entry by entry with no temporary files, or a new
+# atlas png and Klei xml with every icon packed into it. zipfile, tarfile
+# and xml.sax pull in much of the standard library, so they are imported
+# by the writers that use them, not when the UI starts.
+
+PACK_FILES = "files"
+PACK_ZIP = "zip"
+PACK_TAR = "tar"
+PACK_ATLAS = "atlas"
+PACKINGS = (PACK_FILES, PACK_ZIP, PACK_TAR, PACK_ATLAS)
+DEFAULT_PACK_NAME = "icons"
+# Transparent pixels between packed icons, so texture filtering does not bleed neighbours in
+ATLAS_PADDING = 2
+MAX_ATLAS_SIZE = 4096
+
+
+class MaxRects:
+    """Maximal rectangles bin packer, placing each rectangle by best short side fit."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = [(0, 0, width, height)]  # x, y, w, h; may overlap each other
+
+    def insert(self, w, h):
+        # Top left corner of a w x h rectangle, or None if it does not fit
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw and h <= fh:
+                key = (min(fw - w, fh - h), max(fw - w, fh - h), fy, fx)
+                if best is None or key < best:
+                    best = key
+        if best is None:
+            return None
+        x, y = best[3], best[2]
+        self._place(x, y, w, h)
+        return x, y
+
+    def _place(self, x, y, w, h):
+        kept = []
+        added = []
+        for free in self.free:
+            fx, fy, fw, fh = free
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                kept.append(free)
+                continue
+            # The parts of the free rectangle left, right, above and below the placed one
+            if x > fx:
+                added.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                added.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                added.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                added.append((fx, y + h, fw, fy + fh - y - h))
+        # No kept rectangle was inside another before, and each new one is
+        # inside the rectangle it was split from, so only new ones can be
+        # redundant: inside a kept one, or inside (or equal to) another new one
+        free = kept
+        for i, (x, y, w, h) in enumerate(added):
+            right, bottom = x + w, y + h
+            if not any(ox <= x and oy <= y and right <= ox + ow and bottom <= oy + oh
+                       for ox, oy, ow, oh in free):
+                if not any(ox <= x and oy <= y and right <= ox + ow and bottom <= oy + oh
+                           for ox, oy, ow, oh in added[i + 1:]):
+                    free.append((x, y, w, h))
+        self.free = free
+
+
+def _atlas_sizes(min_width, min_height, area):
+    # Power of two sizes that could hold everything, smallest and squarest first
+    sizes = []
+    width = 1
+    while width <= MAX_ATLAS_SIZE:
+        height = 1
+        while height <= MAX_ATLAS_SIZE:
+            if width >= min_width and height >= min_height and width * height >= area:
+                sizes.append((width, height))
+            height *= 2
+        width *= 2
+    return sorted(sizes, key=lambda s: (s[0] * s[1], abs(s[0] - s[1]), -s[0]))
+
+
+def pack_rects(sizes, padding=ATLAS_PADDING):
+    """((width, height), [(x, y)]) of the smallest power of two atlas holding
+    every (w, h) in sizes, at least `padding` pixels apart."""
+    if not sizes:
+        return (1, 1), []
+    padded = [(w + padding, h + padding) for w, h in sizes]
+    # Big rectangles first leave the small ones to fill the gaps
+    order = sorted(range(len(sizes)), key=lambda i: (max(padded[i]), padded[i][0] * padded[i][1]), reverse=True)
+    area = sum(w * h for w, h in padded)
+    for width, height in _atlas_sizes(max(w for w, _ in sizes), max(h for _, h in sizes), area):
+        # Padding is only needed between icons, not after the last one on an edge
+        packer = MaxRects(width + padding, height + padding)
+        positions = [None] * len(sizes)
+        for i in order:
+            positions[i] = packer.insert(*padded[i])
+            if positions[i] is None:
+                break
+        else:
+            return (width, height), positions
+    raise ValueError(f"icons do not fit in one {MAX_ATLAS_SIZE}x{MAX_ATLAS_SIZE} atlas")
+
+
+def encode_png(image, compress_level, optimize):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=compress_level, optimize=optimize)
+    return buffer.getvalue()
+
+
+class ArchiveWriter:
+    """Every png streamed into one zip or tar as it is added."""
+
+    def __init__(self, path, packing, compress_level, optimize):
+        self.paths = [path]
+        self.packing = packing
+        self.compress_level = compress_level
+        self.optimize = optimize
+        self.count = 0
+        if packing == PACK_ZIP:
+            import zipfile
+
+            # pngs are already deflated, storing them is as small and much faster
+            self._archive = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+        else:
+            import tarfile
+
+            self._archive = tarfile.open(path, "w")
+
+    def encode(self, image):
+        # Pool threads: the png bytes of one icon
+        return encode_png(image, self.compress_level, self.optimize)
+
+    def add(self, name, data):
+        # One thread at a time, in the order icons were cropped
+        if self.packing == PACK_ZIP:
+            import zipfile
+
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            self._archive.writestr(info, data)
+        else:
+            import tarfile
+
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def close(self):
+        self._archive.close()
+
+
+class AtlasWriter:
+    """Icons repacked into a new atlas png and its Klei xml when closed."""
+
+    def __init__(self, png_path, compress_level, optimize):
+        self.png_path = png_path
+        self.xml_path = os.path.splitext(png_path)[0] + ".xml"
+        self.paths = [png_path, self.xml_path]
+        self.compress_level = compress_level
+        self.optimize = optimize
+        self.icons = []  # (element name, image)
+        self.count = 0
+
+    def encode(self, image):
+        # Cropping is lazy in some Pillow versions; load it off the atlas here
+        image.load()
+        return image
+
+    def add(self, name, image):
+        self.icons.append((os.path.splitext(name)[0] + ".tex", image))
+        self.count += 1
+
+    def close(self):
+        from xml.sax.saxutils import quoteattr
+        from PIL import Image
+
+        if not self.icons:
+            self.paths = []
+            return
+        sizes = [(max(1, image.width), max(1, image.height)) for _, image in self.icons]
+        (width, height), positions = pack_rects(sizes)
+        atlas = Image.new("RGBA", (width, height))
+        lines = [
+            "<Atlas>",
+            "  <Texture filename=%s />" % quoteattr(os.path.splitext(os.path.basename(self.png_path))[0] + ".tex"),
+            "  <Elements>",
+        ]
+        for (name, image), (w, h), (x, y) in zip(self.icons, sizes, positions):
+            atlas.paste(image.convert("RGBA"), (x, y))
+            # Power of two sizes make these exact, so cropping the atlas again gives the same pixels
+            lines.append("    <Element name=%s u1=\"%r\" u2=\"%r\" v1=\"%r\" v2=\"%r\" />" % (
+                quoteattr(name), x / width, (x + w) / width, 1 - (y + h) / height, 1 - y / height))
+        lines += ["  </Elements>", "</Atlas>", ""]
+        atlas.save(self.png_path, compress_level=self.compress_level, optimize=self.optimize)
+        with open(self.xml_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+
+def open_pack(packing, output_dir, name, compress_level, optimize):
+    """Writer for every icon of a crop batch; None writes a png per icon."""
+    if packing == PACK_FILES:
+        return None
+    if packing == PACK_ATLAS:
+        return AtlasWriter(os.path.join(output_dir, name + ".png"), compress_level, optimize)
+    if packing in (PACK_ZIP, PACK_TAR):
+        return ArchiveWriter(os.path.join(output_dir, f"{name}.{packing}"), packing, compress_level, optimize)
+    raise ValueError(f"Unknown packing: {packing}")
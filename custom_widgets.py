@@ -1,8 +1,13 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import filedialog
+from tkinter import font as tkfont
 
 CONFIG_FILE = "ktools_ui_config.ini"
 
+def save_config(config):
+    with open(CONFIG_FILE, "w") as f:
+        config.write(f)
+
 class AutoScrollbar(tk.Scrollbar):
     def set(self, lo, hi):
         if float(lo) <= 0.0 and float(hi) >= 1.0:
@@ -15,6 +20,85 @@ class AutoScrollbar(tk.Scrollbar):
     def place(self, **kw):
         raise tk.TclError("cannot use place with this widget")
 
+class VirtualList(tk.Frame):
+    """Read-only list of text rows that only renders the rows in view.
+
+    Rows live in a Python list and the Text widget holds just the visible
+    window, so 20,000 rows cost no more to show or update than 7.
+    """
+
+    def __init__(self, parent, height=7):
+        super().__init__(parent)
+        self.rows = []
+        self.first = 0
+        self.height = height
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.text = tk.Text(self, height=height, wrap='none', state='disabled')
+        self.text.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar = AutoScrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self._font = tkfont.Font(font=self.text.cget("font"))
+
+        self.text.bind("<Configure>", lambda event: self.refresh())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.text.bind(sequence, self._on_wheel)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def visible_rows(self):
+        height = self.text.winfo_height()
+        if height <= 1:  # Not mapped yet
+            return self.height
+        padding = 2 * (int(self.text.cget("pady")) + int(self.text.cget("borderwidth")))
+        return max(1, (height - padding) // self._font.metrics("linespace"))
+
+    def set_items(self, rows):
+        self.rows = list(rows)
+        self.first = 0
+        self.refresh()
+
+    def set_row(self, idx, text):
+        # Call refresh() once after a burst of updates. Rows past the end are
+        # added, for batches that discover their items while running.
+        if idx >= len(self.rows):
+            self.rows.extend([""] * (idx + 1 - len(self.rows)))
+        self.rows[idx] = text
+
+    def refresh(self):
+        visible = self.visible_rows()
+        total = len(self.rows)
+        self.first = max(0, min(self.first, total - visible))
+        self.text.config(state='normal')
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "\n".join(self.rows[self.first:self.first + visible]))
+        self.text.config(state='disabled')
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        visible = self.visible_rows()
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.first += step * visible if args[2] == "pages" else step
+        self.refresh()
+
+    def _on_wheel(self, event):
+        if event.num == 4:
+            step = -3
+        elif event.num == 5:
+            step = 3
+        else:
+            step = -3 if event.delta > 0 else 3
+        self.yview("scroll", step, "units")
+        return "break"
+
 class CustomTooltip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -93,5 +177,4 @@ class FileFolderSelector():
         if not self.config.has_section("folders"):
             self.config.add_section("folders")
         self.config.set("folders", self.key, self.var.get())
-        with open(CONFIG_FILE, "w") as f:
-            self.config.write(f)
\ No newline at end of file
+        save_config(self.config)
\ No newline at end of file
@@ -0,0 +1,1247 @@
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+
+from anim_preflight import AnimError, preflight
+from crop_pack import DEFAULT_PACK_NAME, PACK_ATLAS, PACK_FILES, PACKINGS, open_pack
+from build_cache import COPY, BuildManifest, file_hash, link_or_copy, tool_identity, unlink_shared
+from job_journal import CANCELLED, DONE, JOURNAL_FILE, RUNNING, JobJournal
+from process_pool import Cancelled, ChildStats, ProcessPool, available_memory, default_workers
+from run_report import JobRecord, RunReport, file_size, folder_size
+from scheduler import SCHEDULER
+from tree_watch import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL, TreeWatcher, WatchSession
+from variants import format_variants, parse_variants, variant_path
+
+# ktech/krane/crop batches without any Tk dependency. The tabs in ktools_ui
+# and the command line in cli both drive these classes.
+
+log = logging.getLogger(__name__)
+
+BACKEND_KTECH = "ktech"
+BACKEND_KRANE = "krane"
+# In-process ktech decode, or krane's symbol frames cut straight to pngs
+BACKEND_BUILTIN = "built-in"
+DEFAULT_KRANE_TIMEOUT = 600
+# Rough peak memory of one krane run: the decoded atlases dominate. Their
+# size is read from the .tex headers; without a preflight, a DXT-compressed
+# .tex is taken to expand to several times its size once decoded to RGBA
+KRANE_MEMORY_FACTOR = 8
+KRANE_MEMORY_BASE = 64 * 1024 * 1024
+# Copies of every atlas krane holds as RGBA: the atlas and the frames cut from it
+KRANE_RGBA_COPIES = 2
+# Share of the currently available memory krane runs may use together
+MEMORY_HEADROOM = 0.8
+DEFAULT_PNG_LEVEL = 6
+# How ktech/krane children are run: a thread blocked on each child, or one
+# asyncio loop driving them all (async_pool)
+RUNNER_THREADS = "threads"
+RUNNER_ASYNCIO = "asyncio"
+RUNNERS = (RUNNER_THREADS, RUNNER_ASYNCIO)
+
+CONVERTING = "Converting..."
+SUCCESS = "Success!"
+FAILED = "Failed!"
+SKIPPED = "Skipped"
+UP_TO_DATE = "Up to date"
+TIMED_OUT = "Timed out!"
+NOT_FOUND = "File not found"
+INVALID = "Invalid!"
+# Statuses "Retry failed" converts again
+RETRY_STATUSES = (FAILED, TIMED_OUT, INVALID)
+
+
+class EngineError(Exception):
+    pass
+
+
+class BatchResult:
+    def __init__(self):
+        self.items = []  # (input line index, name, status)
+        self.reasons = {}  # name -> why an INVALID input was rejected
+        self.counts = {}  # status -> items, cheap to read while the batch runs
+        self.report = RunReport()  # cost of every job that actually ran
+        self.cancelled = False
+        # Outputs linked or copied from the output of an identical source,
+        # and the conversion time and disk space that saved
+        self.duplicates = 0
+        self.saved_seconds = 0.0
+        self.saved_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, idx, name, status):
+        self.items.append((idx, name, status))
+        self.counts[status] = self.counts.get(status, 0) + 1
+
+    def add_duplicate(self, seconds, size):
+        with self._lock:
+            self.duplicates += 1
+            self.saved_seconds += seconds
+            self.saved_bytes += size
+
+    def dedup_summary(self):
+        # "12 duplicates linked, saving 3.2s of conversion and 14.1 MB of disk"
+        return (f"{self.duplicates} duplicates linked, saving {self.saved_seconds:.1f}s of conversion "
+                f"and {self.saved_bytes / (1024 * 1024):.1f} MB of disk")
+
+    @property
+    def done(self):
+        return len(self.items)
+
+    def names(self, status):
+        return [name for _, name, item_status in sorted(self.items) if item_status == status]
+
+    def count(self, status):
+        return self.counts.get(status, 0)
+
+    @property
+    def failed(self):
+        return self.names(FAILED)
+
+    @property
+    def timed_out(self):
+        return self.names(TIMED_OUT)
+
+    @property
+    def invalid(self):
+        return self.names(INVALID)
+
+    @property
+    def skipped(self):
+        return self.count(SKIPPED)
+
+    @property
+    def up_to_date(self):
+        return self.count(UP_TO_DATE)
+
+
+class Batch:
+    """One run over a list of inputs.
+
+    With a journal_path, the batch and the status of each input are recorded
+    in a JobJournal, so resume_batch() can pick it up after a crash or cancel.
+
+    Every job runs under one of SCHEDULER's CPU slots, which all batches of
+    the application share.
+
+    on_progress(idx, text) is called with the input line index and a status
+    line such as "log.tex - Success!". It may be called from worker threads.
+    `total` is the number of items the result will hold once the batch is
+    done, or None until it is known.
+    """
+
+    kind = None
+
+    def __init__(self, on_progress=None, journal_path=None):
+        self.on_progress = on_progress
+        self.journal_path = journal_path
+        self.job_id = None
+        self._journal = None
+        self._scan_complete = None  # Only changed in the journal by a streamed scan
+        self.result = BatchResult()
+        self.manifest = None
+        self.total = None
+        self.started = None
+        self.scheduler = SCHEDULER
+        self._client = None
+        self._slot = threading.local()  # .held: this worker thread holds a slot
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+        client = self._client
+        if client is not None:
+            self.scheduler.cancel(client)
+
+    def join_scheduler(self):
+        self._client = self.scheduler.register(self.kind, self)
+        if self._cancelled:
+            self.scheduler.cancel(self._client)
+
+    def leave_scheduler(self):
+        if self._client is not None:
+            self.scheduler.unregister(self._client)
+
+    def scheduled(self, func):
+        # func, run under one of the scheduler's CPU slots; raises Cancelled
+        # if the batch is cancelled while waiting for one
+        def run(*args):
+            if not self.scheduler.acquire(self._client):
+                raise Cancelled()
+            self._slot.held = True
+            try:
+                return func(*args)
+            finally:
+                if self._slot.held:
+                    self._slot.held = False
+                    self.scheduler.release(self._client)
+
+        return run
+
+    @contextmanager
+    def unscheduled(self):
+        # Gives a scheduled job's slot back for a wait on something else, so
+        # waiting jobs cannot hold every slot the others need; raises
+        # Cancelled if the batch is cancelled before it gets one again
+        self._slot.held = False
+        self.scheduler.release(self._client)
+        try:
+            yield
+        finally:
+            if not self.scheduler.acquire(self._client):
+                raise Cancelled()
+            self._slot.held = True
+
+    def wait_unscheduled(self, event):
+        if not event.is_set():
+            with self.unscheduled():
+                event.wait()
+
+    def progress(self, idx, text):
+        if self.on_progress:
+            self.on_progress(idx, text)
+
+    def track_items(self, items):
+        # Lists are counted up front. Other iterables, such as a folder scan,
+        # are consumed while the batch runs and counted once exhausted.
+        if hasattr(items, "__len__"):
+            items = list(items)
+            self.total = len(items)
+            return items
+        return self._count_items(items)
+
+    def _count_items(self, items):
+        count = 0
+        for item in items:
+            count += 1
+            yield item
+        self.total = count
+
+    def options(self):
+        # Constructor keyword arguments that recreate this batch on resume
+        return {}
+
+    def open_journal(self, items):
+        # Returns items, recording each one in the journal as it is taken
+        if not self.journal_path:
+            return items
+        try:
+            self._journal = JobJournal(self.journal_path)
+            if self.job_id is None:
+                self.job_id = self._journal.create(self.kind, self.options())
+            else:
+                self._journal.set_state(self.job_id, RUNNING)
+            if isinstance(items, list):
+                self._journal.add_items(self.job_id, items)
+                return items
+            self._scan_complete = False
+            self._journal.set_state(self.job_id, RUNNING, scan_complete=False)
+        except sqlite3.Error as e:
+            self.journal_failed(e)
+            return items
+        return self._journal_stream(items)
+
+    def journal_failed(self, error):
+        # A journal that cannot be written only costs resuming, never the batch
+        log.warning("Job journal %s not updated, this batch cannot be resumed: %s", self.journal_path, error)
+        journal, self._journal = self._journal, None
+        if journal is not None:
+            try:
+                journal.conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _journal_stream(self, items):
+        for item in items:
+            if self._journal is not None:
+                try:
+                    self._journal.add_items(self.job_id, [item])
+                except sqlite3.Error as e:
+                    self.journal_failed(e)
+            yield item
+        self._scan_complete = True
+
+    def record(self, item, status):
+        if self._journal is not None:
+            try:
+                self._journal.set_status(self.job_id, item, status)
+            except sqlite3.Error as e:
+                self.journal_failed(e)
+
+    def close_journal(self):
+        if self._journal is None:
+            return
+        state = CANCELLED if self.cancelled else DONE
+        try:
+            self._journal.set_state(self.job_id, state, scan_complete=self._scan_complete)
+            self._journal.close()
+        except sqlite3.Error as e:
+            self.journal_failed(e)
+        self._journal = None
+
+    def save_manifest(self):
+        if self.manifest is not None:
+            try:
+                self.manifest.save()
+            except OSError:
+                pass  # Cache folder not writable, the next run converts again
+
+
+def walk_tree(root, exclude=()):
+    # Depth-first os.scandir walk yielding (folder, file entries) in name
+    # order, so a scan converts in the same order every run
+    exclude = {os.path.normcase(os.path.abspath(path)) for path in exclude if path}
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            if folder is root:
+                # A mistyped scan folder is an error, not an empty batch
+                raise EngineError(f"Cannot scan {root}: {e.strerror}")
+            continue
+        files = []
+        subfolders = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.normcase(os.path.abspath(entry.path)) not in exclude:
+                        subfolders.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry)
+            except OSError:
+                continue
+        yield folder, files
+        stack.extend(reversed(subfolders))
+
+
+def scan_tex_files(root, exclude=()):
+    for _, files in walk_tree(root, exclude):
+        for entry in files:
+            if entry.name.lower().endswith(".tex"):
+                yield entry.path
+
+
+def is_anim_names(names):
+    # Lowercased file names of a folder krane can convert: anim.bin, build.bin and at least one atlas
+    return "anim.bin" in names and "build.bin" in names and any(n.endswith(".tex") for n in names)
+
+
+def scan_anim_folders(root, exclude=()):
+    for folder, files in walk_tree(root, exclude):
+        if is_anim_names({entry.name.lower() for entry in files}):
+            yield folder
+
+
+def changed_anim_folders(paths):
+    # Anim folders holding any of the changed .bin/.tex paths
+    folders = []
+    for folder in sorted({os.path.dirname(path) for path in paths}):
+        try:
+            names = {name.lower() for name in os.listdir(folder)}
+        except OSError:
+            continue
+        if is_anim_names(names):
+            folders.append(folder)
+    return folders
+
+
+def watch_tree(kind, root, make_batch, exclude=(), interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+    """WatchSession yielding make_batch(items) for the .tex files (ktech) or
+    anim folders (krane) created or changed under root from now on."""
+    if kind == KtechBatch.kind:
+        watcher = TreeWatcher(root, lambda name: name.lower().endswith(".tex"), exclude)
+        to_items = list
+    elif kind == KraneBatch.kind:
+        watcher = TreeWatcher(root, lambda name: name.lower().endswith((".bin", ".tex")), exclude)
+        to_items = changed_anim_folders
+    else:
+        raise EngineError(f"Cannot watch {kind} inputs")
+    watcher.prime()
+    return WatchSession(watcher, to_items, make_batch, interval, debounce)
+
+
+def load_variants(text):
+    # [Variant] of a batch's export profile text
+    try:
+        return parse_variants(text)
+    except ValueError as e:
+        raise EngineError(f"Bad extra sizes: {e}")
+
+
+def mirrored_dir(path, source_root, output_root):
+    # Folder under output_root at the same place as path's folder under source_root
+    relative = os.path.relpath(os.path.dirname(path), source_root)
+    return os.path.normpath(os.path.join(output_root, relative))
+
+
+def make_pool(runner, workers, memory_limit=None):
+    if runner == RUNNER_ASYNCIO:
+        from async_pool import AsyncProcessPool
+
+        return AsyncProcessPool(workers, memory_limit)
+    if runner != RUNNER_THREADS:
+        raise EngineError(f"Unknown runner: {runner}")
+    return ProcessPool(workers, memory_limit)
+
+
+def log_file(log_dir, name):
+    # Per-job log of the tool's stderr, named after the item
+    if not log_dir:
+        return None
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    return os.path.join(log_dir, safe + ".log")
+
+
+def tool_path(tool_dir, name):
+    # Blank folder means the tool is on PATH
+    if not tool_dir:
+        return name
+    exe = os.path.join(tool_dir, name)
+    if os.name == 'nt':
+        exe += ".exe"
+    return exe
+
+
+class _Original:
+    # The first job of a batch for one source hash; jobs for identical
+    # sources wait for it and link its png instead of converting again
+    def __init__(self, png):
+        self.png = png
+        self.status = None
+        self.wall = 0.0
+        self.done = threading.Event()
+
+
+class KtechBatch(Batch):
+    """Converts tex_files to png. With a source_root, each png goes to the
+    folder under output_dir that mirrors its .tex's folder under source_root;
+    tex_files may then be a generator such as scan_tex_files(source_root).
+    With dedup, byte-identical .tex files are converted once and the other
+    pngs are hardlinked, reflinked or copied from that output. variants is
+    an export profile (see variants.py): each png is also written at those
+    sizes, under output_dir/<variant>/, from the same decoded texture."""
+
+    kind = "ktech"
+
+    def __init__(self, tex_files, output_dir, ktech_dir="", skip_existing=False, workers=None,
+                 backend=BACKEND_KTECH, incremental=False, source_root=None, runner=RUNNER_THREADS,
+                 log_dir=None, dedup=False, variants="", on_progress=None, journal_path=None):
+        super().__init__(on_progress, journal_path)
+        self.tex_files = self.track_items(tex_files)
+        self.output_dir = output_dir
+        self.source_root = source_root
+        self.ktech_dir = ktech_dir
+        self.ktech_exe = tool_path(ktech_dir, "ktech")
+        self.skip_existing = skip_existing
+        self.backend = backend
+        self.incremental = incremental
+        self.runner = runner
+        self.log_dir = log_dir
+        self.dedup = dedup
+        self.variants = variants or ""
+        self._variants = load_variants(self.variants)
+        self._originals = {}  # source sha1 -> _Original
+        self._originals_lock = threading.Lock()
+        self.pool = make_pool(runner, workers)
+        self._tex_decoder = None
+        self._tool = None
+
+    def cancel(self):
+        super().cancel()
+        self.pool.cancel()
+
+    def options(self):
+        return {
+            "output_dir": self.output_dir, "ktech_dir": self.ktech_dir, "skip_existing": self.skip_existing,
+            "workers": self.pool.workers, "backend": self.backend, "incremental": self.incremental,
+            "source_root": self.source_root, "runner": self.runner, "log_dir": self.log_dir, "dedup": self.dedup,
+            "variants": self.variants,
+        }
+
+    def item_name(self, tex_file):
+        if self.source_root:
+            return os.path.relpath(tex_file, self.source_root)
+        return os.path.splitext(os.path.basename(tex_file))[0] + ".tex"
+
+    def convert_one(self, idx, tex_file):
+        output_dir = self.output_dir
+        if self.source_root:
+            output_dir = mirrored_dir(tex_file, self.source_root, self.output_dir)
+        base = os.path.splitext(os.path.basename(tex_file))[0]
+        out_png = os.path.join(output_dir, base + ".png")
+        if self.skip_existing and all(os.path.exists(path) for path in self.output_pngs(out_png)):
+            return SKIPPED
+        options = {"backend": self.backend}
+        if self._variants:
+            options["variants"] = format_variants(self._variants)
+        if self.manifest and self.manifest.is_current(out_png, [tex_file], self._tool, options):
+            return UP_TO_DATE
+        self.progress(idx, f"{self.item_name(tex_file)} - {CONVERTING}")
+        if self.source_root:
+            try:
+                os.makedirs(output_dir, exist_ok=True)
+            except OSError:
+                return FAILED
+        original, is_first = self.claim_original(tex_file, out_png)
+        if original is not None and not is_first:
+            status = self.link_duplicate(tex_file, out_png, original)
+        else:
+            unlink_shared(out_png)
+            job = JobRecord(self.backend, self.item_name(tex_file), file_size(tex_file))
+            status = None
+            try:
+                status, image = self.convert_tex(tex_file, out_png, job)
+                job.status = status
+                if status == SUCCESS and self._variants:
+                    status = self.write_variants(tex_file, out_png, image)
+            finally:
+                if original is not None:
+                    # Wakes the duplicates even when this job was cancelled
+                    original.status = status
+                    original.wall = job.wall
+                    original.done.set()
+            job.output_bytes = file_size(out_png)
+            self.result.report.add(job)
+        if self.manifest:
+            if status == SUCCESS:
+                self.manifest.record(out_png, [tex_file], self._tool, options, self.output_pngs(out_png))
+            else:
+                self.manifest.forget(out_png)
+        return status
+
+    def output_pngs(self, out_png):
+        # out_png and the png of every variant
+        return [out_png] + [variant_path(out_png, self.output_dir, variant) for variant in self._variants]
+
+    def convert_tex(self, tex_file, out_png, job):
+        # (status, the decoded image when the built-in decoder has it in memory)
+        if self._tex_decoder:
+            started, cpu_started = time.monotonic(), time.thread_time()
+            try:
+                image = self._tex_decoder.read_tex(tex_file).image(0)
+                image.save(out_png)
+            except (OSError, ValueError) as e:
+                job.stderr = str(e)
+                return FAILED, None
+            finally:
+                job.wall = time.monotonic() - started
+                job.cpu = time.thread_time() - cpu_started
+            return SUCCESS, image
+        stats = ChildStats()
+        try:
+            returncode = self.pool.run(
+                [self.ktech_exe, tex_file, os.path.dirname(out_png)], stats=stats,
+                log_path=log_file(self.log_dir, job.name)
+            )
+        except (OSError, ValueError) as e:
+            job.stderr = str(e)
+            return FAILED, None
+        job.add_child_stats(stats)
+        return SUCCESS if returncode == 0 else FAILED, None
+
+    def write_variants(self, tex_file, out_png, image):
+        # Every variant of out_png, as one job of the report. After ktech,
+        # the png it wrote is read once for all of them
+        job = JobRecord("variants", self.item_name(tex_file), file_size(out_png))
+        started, cpu_started = time.monotonic(), time.thread_time()
+        try:
+            if image is None:
+                from PIL import Image
+
+                with Image.open(out_png) as png:
+                    png.load()
+                    image = png.copy()
+            for variant, path in zip(self._variants, self.output_pngs(out_png)[1:]):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                unlink_shared(path)
+                save_png(variant.apply(image), path)
+                job.output_bytes += file_size(path)
+            job.status = SUCCESS
+        except (OSError, ValueError) as e:
+            job.status = FAILED
+            job.stderr = str(e)
+        job.wall = time.monotonic() - started
+        job.cpu = time.thread_time() - cpu_started
+        self.result.report.add(job)
+        return job.status
+
+    def claim_original(self, tex_file, out_png):
+        # (the _Original for tex_file's contents, whether this job converts it)
+        if not self.dedup:
+            return None, True
+        try:
+            digest = file_hash(tex_file)
+        except OSError:
+            return None, True
+        with self._originals_lock:
+            original = self._originals.get(digest)
+            if original is None:
+                original = self._originals[digest] = _Original(out_png)
+                return original, True
+        return original, False
+
+    def link_duplicate(self, tex_file, out_png, original):
+        self.wait_unscheduled(original.done)
+        if original.status != SUCCESS:
+            if self.cancelled:
+                raise Cancelled()
+            return original.status or FAILED
+        job = JobRecord("link", self.item_name(tex_file), file_size(tex_file))
+        started = time.monotonic()
+        saved_bytes = 0
+        if os.path.normcase(os.path.abspath(out_png)) != os.path.normcase(os.path.abspath(original.png)):
+            try:
+                # The original's variants were written before it finished, so they are linked too
+                for source, target in zip(self.output_pngs(original.png), self.output_pngs(out_png)):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    method = link_or_copy(source, target)
+                    if method != COPY:
+                        saved_bytes += file_size(target)
+            except OSError as e:
+                job.stderr = str(e)
+                job.status = FAILED
+                self.result.report.add(job)
+                return FAILED
+        job.wall = time.monotonic() - started
+        job.status = SUCCESS
+        job.output_bytes = file_size(out_png)
+        self.result.report.add(job)
+        self.result.add_duplicate(original.wall, saved_bytes)
+        return SUCCESS
+
+    def run(self):
+        self.started = time.monotonic()
+        if self.backend == BACKEND_BUILTIN:
+            try:
+                import tex_decoder
+            except ImportError:
+                raise EngineError("The built-in decoder needs numpy: pip install numpy")
+            self._tex_decoder = tex_decoder
+            os.makedirs(self.output_dir, exist_ok=True)
+            # The decoder's own source is its version
+            self._tool = tool_identity(tex_decoder.__file__)
+        else:
+            self._tool = tool_identity(self.ktech_exe)
+        if self.incremental:
+            self.manifest = BuildManifest("ktech")
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+        tex_files = self.open_journal(self.tex_files)
+        self.join_scheduler()
+        try:
+            for idx, tex_file, status in self.pool.map(self.scheduled(self.convert_one), tex_files):
+                if status is None:
+                    continue
+                name = self.item_name(tex_file)
+                self.result.add(idx, name, status)
+                self.record(tex_file, status)
+                self.progress(idx, f"{name} - {status}")
+        finally:
+            self.leave_scheduler()
+            self.pool.close()
+            self.save_manifest()
+            self.close_journal()
+        self.result.cancelled = self.cancelled
+        return self.result
+
+
+def anim_sources(folder):
+    # Files krane reads: anim.bin, build.bin and the atlases next to them
+    return sorted(
+        entry.path for entry in os.scandir(folder)
+        if entry.is_file() and os.path.splitext(entry.name)[1] in (".bin", ".tex")
+    )
+
+
+def estimate_krane_memory(folder, info=None):
+    # info is the folder's AnimInfo from preflight(), when there is one
+    if info is not None:
+        return KRANE_MEMORY_BASE + info.bin_bytes + info.atlas_pixels * 4 * KRANE_RGBA_COPIES
+    total = 0
+    for entry in os.scandir(folder):
+        if entry.is_file() and (entry.name.endswith(".tex") or entry.name.endswith(".bin")):
+            total += entry.stat().st_size
+    return KRANE_MEMORY_BASE + total * KRANE_MEMORY_FACTOR
+
+
+class KraneBatch(Batch):
+    """Converts anim_folders to scml in each folder's output/ subfolder. With
+    an output_dir and a source_root, the scml goes to the folder under
+    output_dir that mirrors the anim folder under source_root instead.
+
+    With preflight, each folder's anim.bin, build.bin and atlases are checked
+    before krane starts, and broken folders are INVALID with the reason in
+    result.reasons. A list of folders is then converted biggest first, so a
+    large build does not start last and hold up the end of the batch.
+
+    The built-in backend skips krane and writes each build.bin symbol frame
+    as <symbol>/<symbol>-<frame>.png, like the images of krane's scml project.
+    """
+
+    kind = "krane"
+
+    def __init__(self, anim_folders, krane_dir="", skip_existing=False, workers=None,
+                 timeout=DEFAULT_KRANE_TIMEOUT, incremental=False, source_root=None, output_dir=None,
+                 runner=RUNNER_THREADS, log_dir=None, preflight=True, backend=BACKEND_KRANE, on_progress=None,
+                 journal_path=None):
+        super().__init__(on_progress, journal_path)
+        self.anim_folders = self.track_items(anim_folders)
+        self.source_root = source_root
+        self.output_dir = output_dir
+        self.krane_dir = krane_dir
+        self.krane_exe = tool_path(krane_dir, "krane")
+        self.skip_existing = skip_existing
+        self.timeout = timeout or None
+        self.incremental = incremental
+        self.runner = runner
+        self.log_dir = log_dir
+        self.preflight = preflight
+        self.backend = backend
+        self._build_frames = None
+        self._checked = {}  # folder -> AnimInfo or AnimError from the up-front preflight
+        self._tool = None
+        memory = available_memory()
+        memory_limit = int(memory * MEMORY_HEADROOM) if memory else None
+        self.pool = make_pool(runner, workers, memory_limit)
+
+    def cancel(self):
+        super().cancel()
+        self.pool.cancel()
+
+    def options(self):
+        return {
+            "krane_dir": self.krane_dir, "skip_existing": self.skip_existing, "workers": self.pool.workers,
+            "timeout": self.timeout, "incremental": self.incremental, "source_root": self.source_root,
+            "output_dir": self.output_dir, "runner": self.runner, "log_dir": self.log_dir,
+            "preflight": self.preflight, "backend": self.backend,
+        }
+
+    def item_name(self, folder):
+        if self.source_root:
+            return os.path.relpath(folder, self.source_root)
+        return os.path.basename(folder)
+
+    def folder_output_dir(self, folder):
+        if self.source_root and self.output_dir:
+            return os.path.normpath(os.path.join(self.output_dir, os.path.relpath(folder, self.source_root)))
+        return os.path.join(folder, "output")
+
+    def check_folder(self, folder):
+        # AnimInfo, or the AnimError saying why krane cannot convert folder
+        try:
+            return preflight(folder)
+        except AnimError as e:
+            return e
+
+    def convert_one(self, idx, folder):
+        base_name = self.item_name(folder)
+        output_dir = self.folder_output_dir(folder)
+        if self.skip_existing and self.has_output(output_dir):
+            return SKIPPED
+        info = None
+        if self.preflight:
+            info = self._checked.pop(folder, None) or self.check_folder(folder)
+            if isinstance(info, AnimError):
+                self.result.reasons[base_name] = str(info)
+                if self.manifest:
+                    self.manifest.forget(output_dir)
+                return INVALID
+        os.makedirs(output_dir, exist_ok=True)
+        sources = anim_sources(folder)
+        options = {} if self.backend == BACKEND_KRANE else {"backend": self.backend}
+        if self.manifest and self.manifest.is_current(output_dir, sources, self._tool, options):
+            return UP_TO_DATE
+        self.progress(idx, f"{base_name} - {CONVERTING}")
+        if self._build_frames:
+            job = JobRecord("frames", base_name, sum(file_size(path) for path in sources))
+            status, outputs = self.extract_frames(folder, output_dir, job)
+            self.result.report.add(job)
+            if self.manifest:
+                if status == SUCCESS:
+                    self.manifest.record(output_dir, sources, self._tool, options, outputs)
+                else:
+                    self.manifest.forget(output_dir)
+            return status
+        job = JobRecord("krane", base_name, sum(file_size(path) for path in sources))
+        stats = ChildStats()
+        try:
+            cost = estimate_krane_memory(folder, info)
+            returncode = self.pool.run(
+                [self.krane_exe, folder, output_dir], timeout=self.timeout, cost=cost, stats=stats,
+                log_path=log_file(self.log_dir, base_name), unscheduled=self.unscheduled,
+            )
+        except subprocess.TimeoutExpired:
+            status = TIMED_OUT
+        except (OSError, ValueError) as e:
+            stats.stderr = str(e)
+            status = FAILED
+        else:
+            status = SUCCESS if returncode == 0 else FAILED
+        job.add_child_stats(stats)
+        job.status = status
+        job.output_bytes = folder_size(output_dir)
+        self.result.report.add(job)
+        if self.manifest:
+            if status == SUCCESS:
+                outputs = [e.path for e in os.scandir(output_dir) if e.is_file()]
+                self.manifest.record(output_dir, sources, self._tool, options, outputs)
+            else:
+                self.manifest.forget(output_dir)
+        return status
+
+    def has_output(self, output_dir):
+        if not os.path.isdir(output_dir):
+            return False
+        if self._build_frames:
+            return any(os.scandir(output_dir))
+        return any(f.endswith(".scml") for f in os.listdir(output_dir))
+
+    def extract_frames(self, folder, output_dir, job):
+        # (status, pngs written); the built-in backend has no timeout, as a
+        # frame cut cannot hang the way a krane process can
+        started, cpu_started = time.monotonic(), time.thread_time()
+        outputs = []
+        try:
+            outputs = self._build_frames.extract_frames(folder, output_dir, save=save_png)
+            status = SUCCESS
+        except (OSError, ValueError) as e:
+            job.stderr = str(e)
+            status = FAILED
+        finally:
+            job.wall = time.monotonic() - started
+            job.cpu = time.thread_time() - cpu_started
+        job.status = status
+        job.output_bytes = sum(file_size(path) for path in outputs)
+        return status, outputs
+
+    def biggest_first(self, anim_folders):
+        # (idx, folder) pairs: invalid folders first, as they finish at once,
+        # then by estimated krane memory, which grows with the atlas pixels
+        def size(pair):
+            info = self._checked[pair[1]]
+            return float("inf") if isinstance(info, AnimError) else estimate_krane_memory(pair[1], info)
+
+        for folder in anim_folders:
+            self._checked[folder] = self.check_folder(folder)
+        return sorted(enumerate(anim_folders), key=size, reverse=True)
+
+    def run(self):
+        self.started = time.monotonic()
+        if self.backend == BACKEND_BUILTIN:
+            import build_frames
+
+            self._build_frames = build_frames
+            self._tool = tool_identity(build_frames.__file__)
+        else:
+            self._tool = tool_identity(self.krane_exe)
+        if self.incremental:
+            self.manifest = BuildManifest("krane")
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+        anim_folders = self.open_journal(self.anim_folders)
+        indexed = False
+        if self.preflight and isinstance(anim_folders, list):
+            anim_folders = self.biggest_first(anim_folders)
+            indexed = True
+        self.join_scheduler()
+        try:
+            jobs = self.pool.map(self.scheduled(self.convert_one), anim_folders, indexed=indexed)
+            for idx, folder, status in jobs:
+                if status is None:
+                    continue
+                base_name = self.item_name(folder)
+                self.result.add(idx, base_name, status)
+                self.record(folder, status)
+                if status == INVALID:
+                    self.progress(idx, f"{base_name} - {status} {self.result.reasons[base_name]}")
+                else:
+                    self.progress(idx, f"{base_name} - {status}")
+        finally:
+            self.leave_scheduler()
+            self.pool.close()
+            self.save_manifest()
+            self.close_journal()
+        self.result.cancelled = self.cancelled
+        return self.result
+
+
+def crop_box(uv, size, force64=False):
+    u1, u2, v1, v2 = uv
+    width, height = size
+    if force64:
+        center_x = int(((u1 + u2) / 2) * width)
+        center_y = int(((2 - v1 - v2) / 2) * height)
+        half = 32
+        left = max(center_x - half, 0)
+        top = max(center_y - half, 0)
+        right = min(center_x + half, width)
+        bottom = min(center_y + half, height)
+    else:
+        left = int(u1 * width)
+        right = int(u2 * width)
+        top = int((1 - v2) * height)
+        bottom = int((1 - v1) * height)
+    return left, top, right, bottom
+
+
+def save_png(image, output_file, compress_level=DEFAULT_PNG_LEVEL, optimize=False):
+    # Pillow releases the GIL while zlib compresses, so saves scale across threads
+    image.save(output_file, compress_level=compress_level, optimize=optimize)
+
+
+def measured_save_png(job, image, output_file, compress_level=DEFAULT_PNG_LEVEL, optimize=False, variants=()):
+    # variants: (Variant, output file) of the same image at other sizes
+    started, cpu_started = time.monotonic(), time.thread_time()
+    try:
+        save_png(image, output_file, compress_level, optimize)
+        for variant, variant_file in variants:
+            save_png(variant.apply(image), variant_file, compress_level, optimize)
+    finally:
+        job.wall = time.monotonic() - started
+        job.cpu = time.thread_time() - cpu_started
+    job.output_bytes = file_size(output_file) + sum(file_size(path) for _, path in variants)
+
+
+def measured_encode(job, writer, image, variants=()):
+    # Pack modes: the icon encoded for writer, and for each (Variant, its
+    # writer, folder) in variants, which add them from the crop thread
+    started, cpu_started = time.monotonic(), time.thread_time()
+    try:
+        payloads = [writer.encode(image)]
+        payloads += [variant_writer.encode(variant.apply(image)) for variant, variant_writer, _ in variants]
+    finally:
+        job.wall = time.monotonic() - started
+        job.cpu = time.thread_time() - cpu_started
+    job.output_bytes = sum(len(payload) for payload in payloads if isinstance(payload, bytes))
+    return payloads
+
+
+def normalize_icon_names(lines):
+    return [
+        n.strip().lower().replace(".tex", "") + ".tex"
+        for n in lines
+        if n.strip()
+    ]
+
+
+class CropBatch(Batch):
+    """Crops icons named in `icon_names` (one name or glob pattern per line) from the
+    atlases in source_dir. Pass the same atlas_cache to later batches to reuse
+    decoded atlases. packing other than PACK_FILES writes every icon into one
+    zip, tar or new atlas named pack_name in output_dir. variants is an export
+    profile (see variants.py): every icon is also saved at those sizes, in
+    output_dir/<variant>/, under <variant>/ in the archive, or in one more
+    atlas named pack_name_<variant>."""
+
+    kind = "crop"
+
+    def __init__(self, source_dir, output_dir, icon_names, force64=False, skip_existing=False,
+                 workers=None, png_level=DEFAULT_PNG_LEVEL, png_optimize=False, atlas_cache=None,
+                 packing=PACK_FILES, pack_name=DEFAULT_PACK_NAME, variants="", on_progress=None):
+        super().__init__(on_progress)
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.names = normalize_icon_names(icon_names)
+        self.force64 = force64
+        self.skip_existing = skip_existing
+        self.workers = max(1, int(workers or default_workers()))
+        self.png_level = png_level
+        self.png_optimize = png_optimize
+        self.atlas_cache = atlas_cache
+        if packing not in PACKINGS:
+            raise EngineError(f"Unknown packing: {packing}")
+        self.packing = packing
+        self.pack_name = pack_name
+        self.pack_paths = []  # Files the pack mode wrote
+        self.variants = variants or ""
+        self._variants = load_variants(self.variants)
+
+    def options(self):
+        # Keyword arguments that, with icon_names, recreate this batch elsewhere
+        return {
+            "source_dir": self.source_dir, "output_dir": self.output_dir, "force64": self.force64,
+            "skip_existing": self.skip_existing, "workers": self.workers, "png_level": self.png_level,
+            "png_optimize": self.png_optimize, "packing": self.packing, "pack_name": self.pack_name,
+            "variants": self.variants,
+        }
+
+    def output_files(self, output_file):
+        # output_file and the png of every variant
+        return [output_file] + [variant_path(output_file, self.output_dir, variant) for variant in self._variants]
+
+    def resolve_icon(self, index, name, image_exists):
+        # (atlas image path, uv) of the first atlas with a png or tex that has this icon
+        for xml_name, uv in index.lookup(name):
+            for image_path in index.image_paths(xml_name):
+                if image_path not in image_exists:
+                    image_exists[image_path] = os.path.exists(image_path)
+                if image_exists[image_path]:
+                    return image_path, uv
+        return None
+
+    def line_status(self, name, pattern, icons, results):
+        label = name.replace('.tex', '')
+        if not pattern:
+            return f"{label} - {results[name] or NOT_FOUND}"
+        if not icons:
+            return f"{label} - No matching icons"
+        counts = {}
+        for icon in icons:
+            counts[results[icon]] = counts.get(results[icon], 0) + 1
+        text = f"{label} - {counts.get(SUCCESS, 0)} cropped, {counts.get(SKIPPED, 0)} skipped"
+        if counts.get(FAILED):
+            text += f", {counts[FAILED]} failed"
+        if counts.get(None):
+            text += f", {counts[None]} not found"
+        return text
+
+    def decode_atlas(self, image_path, job):
+        # The atlas image, or None if it cannot be read
+        started, cpu_started = time.monotonic(), time.thread_time()
+        try:
+            image = self.atlas_cache.get(image_path)
+            job.status = SUCCESS
+        except (OSError, ValueError) as e:
+            image = None
+            job.status = FAILED
+            job.stderr = str(e)
+        job.wall = time.monotonic() - started
+        job.cpu = time.thread_time() - cpu_started
+        return image
+
+    def close_pack(self, writer):
+        # Ends the archive, or packs and saves the atlas, as one job of the report
+        job = JobRecord("pack", os.path.basename(writer.paths[0]))
+        started, cpu_started = time.monotonic(), time.thread_time()
+        try:
+            writer.close()
+            job.status = SUCCESS
+        except (OSError, ValueError) as e:
+            job.status = FAILED
+            job.stderr = str(e)
+        job.wall = time.monotonic() - started
+        job.cpu = time.thread_time() - cpu_started
+        job.output_bytes = sum(file_size(path) for path in writer.paths)
+        self.result.report.add(job)
+        if job.status == FAILED:
+            raise EngineError(f"Cannot write {os.path.basename(writer.paths[0])}: {job.stderr}")
+        self.pack_paths += writer.paths
+
+    def run(self):
+        self.started = time.monotonic()
+        # Pillow is only needed for cropping, not for ktech/krane batches
+        from atlas_index import AtlasImageCache, AtlasIndex, is_pattern
+
+        if self.atlas_cache is None:
+            self.atlas_cache = AtlasImageCache()
+        try:
+            index = AtlasIndex(self.source_dir)
+        except OSError as e:
+            raise EngineError(f"Cannot read source folder: {e.strerror}")
+        if not index.atlases:
+            raise EngineError("No XML files found in source folder.")
+
+        # Resolve every line up front: (idx, name, is pattern, icons it crops)
+        lines = []
+        done_names = set()
+        for idx, name in enumerate(self.names):
+            if name in done_names:
+                continue
+            if is_pattern(name):
+                # One line such as "armor_*" crops every matching icon
+                icons = [m for m in index.glob(name) if m not in done_names]
+                done_names.update(icons)
+                lines.append((idx, name, True, icons))
+            else:
+                lines.append((idx, name, False, [name]))
+            done_names.add(name)
+        self.total = sum(len(icons) for _, _, _, icons in lines)
+
+        # Bucket icons by atlas, so each png or tex is decoded once for all its icons
+        results = {}
+        buckets = {}
+        image_exists = {}
+        for _, _, _, icons in lines:
+            for icon in icons:
+                location = self.resolve_icon(index, icon, image_exists)
+                if location is None:
+                    results[icon] = None
+                    continue
+                # Packed icons are named the same inside the archive or atlas
+                output_file = os.path.join(self.output_dir, os.path.splitext(icon)[0] + ".png")
+                if self.skip_existing and self.packing == PACK_FILES and all(
+                        os.path.exists(path) for path in self.output_files(output_file)):
+                    results[icon] = SKIPPED
+                    continue
+                image_path, uv = location
+                buckets.setdefault(image_path, []).append((icon, uv, output_file))
+
+        icon_lines = {}
+        pending = {}
+        for line in lines:
+            idx, name, pattern, icons = line
+            pending[idx] = sum(1 for icon in icons if icon not in results)
+            for icon in icons:
+                icon_lines[icon] = line
+
+        def report(line):
+            idx, name, pattern, icons = line
+            for icon in icons:
+                self.result.add(idx, os.path.splitext(icon)[0], results[icon] or NOT_FOUND)
+            self.progress(idx, self.line_status(name, pattern, icons, results))
+
+        for line in lines:
+            if pending[line[0]] == 0:
+                report(line)
+
+        def finish(icon, result):
+            results[icon] = result
+            line = icon_lines[icon]
+            pending[line[0]] -= 1
+            if pending[line[0]] == 0:
+                report(line)
+
+        # Crops are cut here and encoded on the pool; results are collected
+        # in submission order so line statuses come out the same every run
+        saves = deque()
+        writer = None
+        variant_writers = []  # (Variant, writer, folder in the archive) in pack modes
+
+        def drain(block):
+            while saves and (block or saves[0][2].done()):
+                icon, job, future = saves.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    payloads = future.result()
+                    if writer is not None:
+                        # One sequential write, in the same order every run
+                        name = os.path.splitext(icon)[0] + ".png"
+                        writer.add(name, payloads[0])
+                        for (_, variant_writer, folder), payload in zip(variant_writers, payloads[1:]):
+                            variant_writer.add(folder + name, payload)
+                    job.status = SUCCESS
+                except Cancelled:
+                    continue
+                except (OSError, ValueError) as e:
+                    job.status = FAILED
+                    job.stderr = str(e)
+                self.result.report.add(job)
+                finish(icon, job.status)
+
+        if buckets:
+            os.makedirs(self.output_dir, exist_ok=True)
+            try:
+                writer = open_pack(self.packing, self.output_dir, self.pack_name, self.png_level, self.png_optimize)
+                for variant in self._variants:
+                    if writer is None:
+                        os.makedirs(os.path.join(self.output_dir, variant.name), exist_ok=True)
+                    elif self.packing == PACK_ATLAS:
+                        variant_writers.append((variant, open_pack(
+                            self.packing, self.output_dir, f"{self.pack_name}_{variant.name}",
+                            self.png_level, self.png_optimize), ""))
+                    else:
+                        variant_writers.append((variant, writer, variant.name + "/"))
+            except OSError as e:
+                raise EngineError(f"Cannot create {self.pack_name}: {e}")
+        self.join_scheduler()
+        try:
+            save = self.scheduled(measured_save_png if writer is None else measured_encode)
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for image_path, icons in buckets.items():
+                    if self._cancelled:
+                        break
+                    # Decoding the atlas is its own job, so slow atlases show up in the report
+                    atlas_job = JobRecord("atlas", os.path.basename(image_path), file_size(image_path))
+                    try:
+                        image = self.scheduled(self.decode_atlas)(image_path, atlas_job)
+                    except Cancelled:
+                        break
+                    self.result.report.add(atlas_job)
+                    for icon, uv, output_file in icons:
+                        if self._cancelled:
+                            break
+                        if image is None:
+                            drain(True)
+                            finish(icon, FAILED)
+                            continue
+                        cropped = image.crop(crop_box(uv, image.size, self.force64))
+                        job = JobRecord("crop", os.path.splitext(icon)[0])
+                        if writer is None:
+                            variants = list(zip(self._variants, self.output_files(output_file)[1:]))
+                            future = executor.submit(
+                                save, job, cropped, output_file, self.png_level, self.png_optimize, variants)
+                        else:
+                            future = executor.submit(save, job, writer, cropped, variant_writers)
+                        saves.append((icon, job, future))
+                    drain(False)
+                if self._cancelled:
+                    for _, _, future in saves:
+                        future.cancel()
+                drain(True)
+        finally:
+            self.leave_scheduler()
+            if writer is not None:
+                # Icons finished before a cancel are kept, as they are in png files mode
+                self.close_pack(writer)
+                for _, variant_writer, _ in variant_writers:
+                    if variant_writer is not writer:
+                        self.close_pack(variant_writer)
+        self.result.cancelled = self.cancelled
+        return self.result
+
+
+BATCH_KINDS = {KtechBatch.kind: KtechBatch, KraneBatch.kind: KraneBatch}
+SCANNERS = {KtechBatch.kind: scan_tex_files, KraneBatch.kind: scan_anim_folders}
+
+
+def latest_job(kind, journal_path=JOURNAL_FILE):
+    # Newest journaled ktech or krane batch, or None
+    journal = JobJournal(journal_path)
+    try:
+        jobs = journal.jobs(kind, limit=1)
+    finally:
+        journal.close()
+    return jobs[0] if jobs else None
+
+
+def resume_batch(job_id, failed_only=False, journal_path=JOURNAL_FILE, on_progress=None):
+    """A batch that continues journaled job `job_id` with the same options.
+
+    It converts the items that never finished, and finishes an interrupted
+    folder scan. With failed_only, it converts only the items that failed or
+    timed out instead.
+    """
+    journal = JobJournal(journal_path)
+    try:
+        job = journal.job(job_id)
+        if job is None or job.kind not in BATCH_KINDS:
+            raise EngineError(f"No ktech or krane batch {job_id} in {journal_path}.")
+        if failed_only:
+            items = list(chain.from_iterable(journal.items(job_id, status) for status in RETRY_STATUSES))
+            journal.reset(job_id, RETRY_STATUSES)
+        else:
+            items = journal.items(job_id)
+            if not job.scan_complete and job.options.get("source_root"):
+                # Scan again, skipping what the journal already has
+                known = journal.item_statuses(job_id)
+                scan = SCANNERS[job.kind](job.options["source_root"], exclude=[job.options.get("output_dir")])
+                items = chain(items, (item for item in scan if item not in known))
+    finally:
+        journal.close()
+    batch = BATCH_KINDS[job.kind](items, on_progress=on_progress, journal_path=journal_path, **job.options)
+    batch.job_id = job_id
+    return batch
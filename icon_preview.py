@@ -0,0 +1,229 @@
+import base64
+import os
+import threading
+import tkinter as tk
+from collections import deque
+from fnmatch import fnmatchcase
+
+from atlas_index import AtlasIndex, is_pattern
+from custom_widgets import AutoScrollbar
+from thumbnails import THUMB_SIZE
+
+# Browses the icons of a folder's atlases for the Crop tab. Like the file
+# lists, only the rows in view are drawn, so only their thumbnails exist as
+# Tk images; a loader thread reads them from a ThumbnailCache, newest
+# request first, and never decodes an atlas whose thumbnails are on disk.
+
+ROW_HEIGHT = THUMB_SIZE + 6
+SEARCH_DELAY_MS = 150
+POLL_MS = 50
+
+
+class IconPreview(tk.Toplevel):
+    """Searchable icon list of source_dir with thumbnails; clicking a row
+    calls on_pick with the icon's name."""
+
+    def __init__(self, parent, source_dir, cache, on_pick):
+        super().__init__(parent)
+        self.title(f"Icons - {os.path.basename(os.path.normpath(source_dir))}")
+        self.geometry("460x520")
+        self.source_dir = source_dir
+        self.cache = cache
+        self.on_pick = on_pick
+        self.index = None
+        self.names = []  # Every icon name, sorted
+        self.shown = []  # Names matching the search
+        self.first = 0
+        self.photos = {}  # name -> PhotoImage, for rows in view only
+        self.visible = set()
+        self._failed = set()
+        self._requested = set()
+        # (names to load, names in view) of each redraw, for the loader thread
+        self._requests = deque()
+        self._ui_calls = deque()  # Functions the loader thread left for the Tk thread
+        self._wake = threading.Event()
+        self._closed = False
+        self._search_job = None
+        self._dirty = False
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        search_frame = tk.Frame(self)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky='we', padx=5, pady=5)
+        tk.Label(search_frame, text="Search").pack(side='left')
+        self.search_var = tk.StringVar()
+        search = tk.Entry(search_frame, textvariable=self.search_var)
+        search.pack(side='left', fill='x', expand=True, padx=5)
+        search.focus_set()
+        self.count_label = tk.Label(search_frame, text="Reading atlases...", fg="gray")
+        self.count_label.pack(side='left')
+        self.search_var.trace_add("write", lambda *_: self.schedule_search())
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, background="white")
+        self.canvas.grid(row=1, column=0, sticky='nsew')
+        self.scrollbar = AutoScrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.grid(row=1, column=1, sticky='ns')
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<Button-1>", self.pick)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self._on_wheel)
+        self.bind("<Destroy>", self._on_destroy)
+
+        threading.Thread(target=self.load, daemon=True).start()
+        self.after(POLL_MS, self.poll)
+
+    # Loader thread
+
+    def post_ui(self, func):
+        self._ui_calls.append(func)
+
+    def load(self):
+        try:
+            index = AtlasIndex(self.source_dir)
+        except OSError as e:
+            message = f"Cannot read folder: {e.strerror}"
+            self.post_ui(lambda: self.count_label.config(text=message, fg="red"))
+            return
+        self.post_ui(lambda: self.show_index(index))
+        todo = []  # Names to load, newest last
+        visible = frozenset()
+        while not self._closed:
+            if not todo:
+                self._wake.wait()
+                self._wake.clear()
+            # Every redraw since the last icon; the newest one says what is in view
+            while self._requests:
+                names, visible = self._requests.popleft()
+                todo.extend(names)
+            if not todo or self._closed:
+                continue
+            name = todo.pop()
+            if name not in visible:
+                # Scrolled away before its turn; asked for again if it comes back
+                self.post_ui(lambda name=name: self._requested.discard(name))
+                continue
+            data = self.thumbnail(index, name)
+            self.post_ui(lambda name=name, data=data: self.show_thumbnail(name, data))
+
+    def thumbnail(self, index, name):
+        # png bytes, or None when no atlas image of the icon can be read
+        try:
+            xml_name, _ = index.lookup(name)[0]
+            for image_path in index.image_paths(xml_name):
+                if os.path.exists(image_path):
+                    return self.cache.get(image_path, index.atlases[xml_name]["elements"], name)
+        except Exception:
+            # A broken atlas only costs its own icons, never the loader thread
+            return None
+        return None
+
+    # Tk thread
+
+    def poll(self):
+        if self._closed:
+            return
+        while self._ui_calls:
+            self._ui_calls.popleft()()
+        if self._dirty:
+            # One redraw for every thumbnail that arrived since the last poll
+            self._dirty = False
+            self.redraw()
+        self.after(POLL_MS, self.poll)
+
+    def show_index(self, index):
+        self.index = index
+        self.names = sorted({name for atlas in index.atlases.values() for name in atlas["elements"]})
+        self.search()
+
+    def schedule_search(self):
+        # Typing restarts the delay, so a long list is filtered once per pause
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self.search)
+
+    def search(self):
+        self._search_job = None
+        text = self.search_var.get().strip().lower()
+        if not text:
+            self.shown = self.names
+        elif is_pattern(text):
+            pattern = text if text.endswith(".tex") else text + ".tex"
+            self.shown = [name for name in self.names if fnmatchcase(name, pattern)]
+        else:
+            self.shown = [name for name in self.names if text in name]
+        self.count_label.config(text=f"{len(self.shown)} of {len(self.names)} icons", fg="gray")
+        self.first = 0
+        self.redraw()
+
+    def visible_rows(self):
+        height = self.canvas.winfo_height()
+        return max(1, height // ROW_HEIGHT + 1) if height > 1 else 10
+
+    def redraw(self):
+        rows = self.visible_rows()
+        total = len(self.shown)
+        self.first = max(0, min(self.first, total - rows + 1))
+        names = self.shown[self.first:self.first + rows]
+        self.visible = set(names)
+        # Tk images of rows scrolled away are dropped; their bytes stay in the cache
+        self.photos = {name: photo for name, photo in self.photos.items() if name in self.visible}
+        self.canvas.delete("all")
+        requests = []
+        for row, name in enumerate(names):
+            y = row * ROW_HEIGHT
+            if row % 2:
+                self.canvas.create_rectangle(0, y, self.canvas.winfo_width(), y + ROW_HEIGHT,
+                                             fill="#f4f4f4", outline="")
+            photo = self.photos.get(name)
+            if photo is not None:
+                self.canvas.create_image(3 + THUMB_SIZE // 2, y + ROW_HEIGHT // 2, image=photo)
+            elif name not in self._failed and name not in self._requested:
+                self._requested.add(name)
+                requests.append(name)
+            self.canvas.create_text(THUMB_SIZE + 12, y + ROW_HEIGHT // 2, anchor='w', text=name[:-4])
+        if requests or self._requested:
+            # Sent with what is in view, so the loader skips rows scrolled away
+            self._requests.append((requests, frozenset(self.visible)))
+            self._wake.set()
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def show_thumbnail(self, name, data):
+        self._requested.discard(name)
+        if data is None:
+            self._failed.add(name)
+            return
+        if name in self.visible:
+            self.photos[name] = tk.PhotoImage(data=base64.b64encode(data))
+            self._dirty = True
+
+    def yview(self, *args):
+        rows = self.visible_rows()
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.shown))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.first += step * (rows - 1) if args[2] == "pages" else step
+        self.redraw()
+
+    def _on_wheel(self, event):
+        if event.num == 4:
+            step = -3
+        elif event.num == 5:
+            step = 3
+        else:
+            step = -3 if event.delta > 0 else 3
+        self.yview("scroll", step, "units")
+        return "break"
+
+    def pick(self, event):
+        row = self.first + event.y // ROW_HEIGHT
+        if row < len(self.shown):
+            self.on_pick(self.shown[row][:-4])
+
+    def _on_destroy(self, event):
+        if event.widget is self:
+            self._closed = True
+            self._wake.set()
@@ -0,0 +1,189 @@
+import json
+import sqlite3
+import time
+
+JOURNAL_FILE = "ktools_ui_jobs.db"
+# Status updates are buffered and written in one short transaction at least
+# this often, so a crash loses at most a second of progress; those items are
+# simply converted again on resume. No transaction stays open between
+# writes, so the ktech and krane tabs can journal at the same time
+COMMIT_INTERVAL = 1.0
+# Seconds a write waits for another batch's transaction to end
+BUSY_TIMEOUT = 30.0
+
+# Jobs kept per kind; older ones are deleted when a new job starts
+KEEP_JOBS = 50
+
+RUNNING = "running"
+CANCELLED = "cancelled"
+DONE = "done"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    created REAL NOT NULL,
+    options TEXT NOT NULL,
+    state TEXT NOT NULL,
+    scan_complete INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    status TEXT,
+    PRIMARY KEY (job_id, item)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (job_id, status);
+"""
+
+
+class Job:
+    def __init__(self, row, counts):
+        self.id, self.kind, self.created, options, self.state, scan_complete = row
+        self.options = json.loads(options)
+        self.scan_complete = bool(scan_complete)
+        self.counts = counts  # status -> items, None for not yet converted
+
+    @property
+    def pending(self):
+        return self.counts.get(None, 0)
+
+    def count(self, *statuses):
+        return sum(self.counts.get(status, 0) for status in statuses)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    @property
+    def resumable(self):
+        return self.pending > 0 or not self.scan_complete
+
+
+class JobJournal:
+    """Every ktech/krane batch and the status of each of its items, in SQLite.
+
+    A batch that crashed or was cancelled can be resumed from its pending
+    items, or run again with only its failed items. A connection belongs to
+    the thread that made it, so batches open their own JobJournal.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+        self._last_commit = time.monotonic()
+        self._next_seq = {}
+        self._new_items = []  # (job_id, seq, item) not written yet
+        self._statuses = []  # (status, job_id, item) not written yet
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+    def flush(self):
+        # Buffered items and statuses, written and committed in one transaction
+        if self._new_items or self._statuses:
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO items (job_id, seq, item) VALUES (?, ?, ?)",
+                                      self._new_items)
+                self.conn.executemany("UPDATE items SET status = ? WHERE job_id = ? AND item = ?", self._statuses)
+            self._new_items = []
+            self._statuses = []
+        self._last_commit = time.monotonic()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_commit >= COMMIT_INTERVAL:
+            self.flush()
+
+    def create(self, kind, options, scan_complete=True):
+        self.flush()
+        self.conn.execute(
+            "DELETE FROM jobs WHERE kind = ? AND id NOT IN "
+            "(SELECT id FROM jobs WHERE kind = ? ORDER BY id DESC LIMIT ?)",
+            (kind, kind, KEEP_JOBS - 1),
+        )
+        cursor = self.conn.execute(
+            "INSERT INTO jobs (kind, created, options, state, scan_complete) VALUES (?, ?, ?, ?, ?)",
+            (kind, time.time(), json.dumps(options), RUNNING, int(scan_complete)),
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def add_items(self, job_id, items):
+        # Items already in the job (a resumed scan finding them again) keep their status
+        items = list(items)
+        if job_id not in self._next_seq:
+            last = self.conn.execute("SELECT MAX(seq) FROM items WHERE job_id = ?", (job_id,)).fetchone()[0]
+            self._next_seq[job_id] = 0 if last is None else last + 1
+        seq = self._next_seq[job_id]
+        self._new_items.extend((job_id, seq + n, item) for n, item in enumerate(items))
+        self._next_seq[job_id] = seq + len(items)
+        self._maybe_flush()
+
+    def set_status(self, job_id, item, status):
+        self._statuses.append((status, job_id, item))
+        self._maybe_flush()
+
+    def reset(self, job_id, statuses):
+        # Marks items with any of these statuses as pending again
+        self.flush()
+        self.conn.executemany(
+            "UPDATE items SET status = NULL WHERE job_id = ? AND status = ?",
+            ((job_id, status) for status in statuses),
+        )
+        self.conn.commit()
+
+    def set_state(self, job_id, state, scan_complete=None):
+        self.flush()
+        if scan_complete is None:
+            self.conn.execute("UPDATE jobs SET state = ? WHERE id = ?", (state, job_id))
+        else:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, scan_complete = ? WHERE id = ?", (state, int(scan_complete), job_id)
+            )
+        self.conn.commit()
+
+    def job(self, job_id):
+        self.flush()
+        row = self.conn.execute(
+            "SELECT id, kind, created, options, state, scan_complete FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        return Job(row, counts)
+
+    def jobs(self, kind=None, limit=20):
+        # Newest first
+        if kind is None:
+            rows = self.conn.execute("SELECT id FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        else:
+            rows = self.conn.execute("SELECT id FROM jobs WHERE kind = ? ORDER BY id DESC LIMIT ?", (kind, limit))
+        return [self.job(job_id) for job_id, in rows.fetchall()]
+
+    def items(self, job_id, status=None):
+        # Items in the order they were added; status None gives the pending ones
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT item FROM items WHERE job_id = ? AND status IS ? ORDER BY seq", (job_id, status)
+        )
+        return [item for item, in rows.fetchall()]
+
+    def item_statuses(self, job_id):
+        self.flush()
+        return dict(self.conn.execute("SELECT item, status FROM items WHERE job_id = ?", (job_id,)).fetchall())
+
+    def delete(self, job_id):
+        self.flush()
+        self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self.conn.commit()
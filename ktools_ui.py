@@ -1,14 +1,28 @@
+import sys
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Command line mode runs without importing Tk, so it works on headless servers
+    from cli import main
+    sys.exit(main())
+
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import subprocess
-from subprocess import DEVNULL
+from tkinter import ttk, filedialog
 import os
 import threading
+import time
 import configparser
-from idlelib.tooltip import Hovertip
-from PIL import Image
-import xml.etree.ElementTree as ET
-from custom_widgets import AutoScrollbar, FileFolderSelector
+import sqlite3
+from collections import deque
+from custom_widgets import AutoScrollbar, FileFolderSelector, VirtualList, save_config
+from engine import (
+    BACKEND_BUILTIN, BACKEND_KRANE, BACKEND_KTECH, DEFAULT_KRANE_TIMEOUT, DEFAULT_PNG_LEVEL, RETRY_STATUSES,
+    RUNNER_THREADS, RUNNERS, CropBatch, EngineError, KraneBatch, KtechBatch, latest_job, resume_batch,
+    scan_anim_folders, scan_tex_files, watch_tree,
+)
+from crop_pack import PACK_ATLAS, PACK_FILES, PACK_TAR, PACK_ZIP, PACKINGS
+from job_journal import JOURNAL_FILE
+from variants import parse_variants
+from scheduler import SCHEDULER
+from process_pool import default_workers
 
 CONFIG_FILE = "ktools_ui_config.ini"
 KTECH_SOURCE = "ktech_source"
@@ -16,6 +30,63 @@ KTECH_OUTPUT = "ktech_output"
 KRANE_SOURCE = "krane_source"
 CROP_SOURCE = "crop_source"
 CROP_OUTPUT = "crop_output"
+KTECH_WORKERS = "ktech_workers"
+KTECH_BACKEND = "ktech_backend"
+KRANE_BACKEND = "krane_backend"
+KRANE_WORKERS = "krane_workers"
+KRANE_TIMEOUT = "krane_timeout"
+KTECH_INCREMENTAL = "ktech_incremental"
+KRANE_INCREMENTAL = "krane_incremental"
+KTECH_DEDUP = "ktech_dedup"
+# Keep converting what changes under a scanned folder until Cancel
+KTECH_WATCH = "ktech_watch"
+KRANE_WATCH = "krane_watch"
+CROP_WORKERS = "crop_workers"
+CROP_PNG_LEVEL = "crop_png_level"
+CROP_PNG_OPTIMIZE = "crop_png_optimize"
+CROP_PACKING = "crop_packing"
+# Export profiles: other sizes written from each decoded texture or icon
+KTECH_VARIANTS = "ktech_variants"
+CROP_VARIANTS = "crop_variants"
+# ktech/krane runner (threads or asyncio) and a folder for per-job stderr logs
+RUNNER = "runner"
+LOG_DIR = "log_dir"
+# Progress is drawn at most this often, however fast files finish
+PROGRESS_FRAME_MS = 100
+# Jobs of all tabs at once, and each tab's share of them
+CPU_BUDGET = "cpu_budget"
+WEIGHT_SUFFIX = "_weight"
+SCHEDULER_KINDS = (KtechBatch.kind, KraneBatch.kind, CropBatch.kind)
+QUEUE_REFRESH_MS = 500
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+def progress_summary(batch):
+    # "120/20000 done, 3 failed, 10 skipped - 45.2 files/s, ETA 7:17"
+    if batch.started is None:
+        return ""
+    result = batch.result
+    done = result.done
+    text = f"{done}/{batch.total} done" if batch.total is not None else f"{done} done"
+    failed = sum(result.count(status) for status in RETRY_STATUSES)
+    if failed:
+        text += f", {failed} failed"
+    skipped = result.skipped + result.up_to_date
+    if skipped:
+        text += f", {skipped} skipped"
+    elapsed = time.monotonic() - batch.started
+    if done and elapsed > 0:
+        rate = done / elapsed
+        text += f" - {rate:.1f} files/s"
+        if batch.total:
+            text += f", ETA {format_duration((batch.total - done) / rate)}"
+    return text
+
 
 class BaseTab(tk.Frame):
     def __init__(self, parent, config):
@@ -27,13 +98,23 @@ class BaseTab(tk.Frame):
         self.parent.grid_columnconfigure(2, weight=0, minsize=80)
         self.parent.grid_rowconfigure(0, minsize=38)
         self.parent.grid_rowconfigure(1, minsize=38)
+        self.file_list = None
+        self._progress = {}
+        self._progress_lock = threading.Lock()
+        self._ui_calls = deque()  # (worker thread, function) waiting for the Tk thread
+        self._watched_batch = None
+        self._watch_args = None  # watch_tree arguments for the next convert, if watching
+        self._watch = None
 
-    def setup_common_ui(self, row, title_text, button_text, browse_command, browse, button_command, cancel_command, force64_option=False):
+    def setup_common_ui(self, row, title_text, button_text, browse_command, browse, button_command, cancel_command, force64_option=False, workers_key=None, timeout_key=None, virtual_list=False, scan_command=None):
         # Select input files row
-        self.setup_input_ui(row, title_text, browse_command, browse)
+        if virtual_list:
+            self.setup_file_list_ui(row, title_text, browse_command, scan_command)
+        else:
+            self.setup_input_ui(row, title_text, browse_command, browse)
 
         # skip, convert, cancel row
-        self.setup_skip_convert_ui(row+1, button_text, button_command, cancel_command, force64_option)
+        self.setup_skip_convert_ui(row+1, button_text, button_command, cancel_command, force64_option, workers_key, timeout_key)
 
         # status row
         self.setup_status_ui(row+2)
@@ -57,10 +138,22 @@ class BaseTab(tk.Frame):
             return
         tk.Button(self.parent, text="Browse", command=command).grid(row=row, column=2, padx=5, pady=5, sticky='n')
 
-    def setup_skip_convert_ui(self, row, text, command, cancel_command, force64_option=False):
+    def setup_file_list_ui(self, row, title, command, scan_command=None):
+        # Picked files are only shown, so a virtual list keeps huge batches responsive
+        tk.Label(self.parent, text=title).grid(row=row, column=0, sticky='ne', padx=2, pady=5)
+        self.file_list = VirtualList(self.parent, height=7)
+        self.file_list.grid(row=row, column=1, sticky='nsew', padx=3, pady=5)
+        button_frame = tk.Frame(self.parent)
+        button_frame.grid(row=row, column=2, padx=5, pady=5, sticky='n')
+        tk.Button(button_frame, text="Browse", command=command).pack(side='top', fill='x')
+        if scan_command:
+            tk.Button(button_frame, text="Scan", command=scan_command).pack(side='top', fill='x', pady=(5, 0))
+
+    def setup_skip_convert_ui(self, row, text, command, cancel_command, force64_option=False, workers_key=None, timeout_key=None):
         # Skip, Convert/Crop, Cancel
         self.skip_var = tk.IntVar(value=0)
         action_frame = tk.Frame(self.parent)
+        self.action_frame = action_frame
         action_frame.grid(row=row, column=1, sticky='we', pady=5)
         action_frame.grid_columnconfigure(0, weight=1)
         inner_row = 0
@@ -78,33 +171,355 @@ class BaseTab(tk.Frame):
         )
         self.skip_checkbox.grid(row=inner_row, column=0, sticky="w")
 
+        # Number of tool processes run at once
+        self.workers_key = workers_key
+        if workers_key:
+            workers = self.config.getint("options", workers_key, fallback=default_workers())
+            self.workers_var = tk.IntVar(value=workers)
+            workers_frame = tk.Frame(action_frame)
+            workers_frame.grid(row=inner_row, column=0, sticky="e")
+            tk.Label(workers_frame, text="Workers").pack(side='left')
+            tk.Spinbox(
+                workers_frame, from_=1, to=256, width=4, textvariable=self.workers_var
+            ).pack(side='left', padx=5)
+
+            # Seconds before a single run is killed, 0 means no limit
+            self.timeout_key = timeout_key
+            if timeout_key:
+                timeout = self.config.getint("options", timeout_key, fallback=DEFAULT_KRANE_TIMEOUT)
+                self.timeout_var = tk.IntVar(value=timeout)
+                tk.Label(workers_frame, text="Timeout (s)").pack(side='left')
+                tk.Spinbox(
+                    workers_frame, from_=0, to=86400, increment=30, width=6, textvariable=self.timeout_var
+                ).pack(side='left', padx=5)
+
         self.convert_btn = tk.Button(action_frame, text=text, command=command)
         self.convert_btn.grid(row=inner_row, column=1, sticky="e", padx=5)
         self.cancel_btn = tk.Button(action_frame, text="Cancel", command=cancel_command, state="disabled")
         self.cancel_btn.grid(row=inner_row, column=2, sticky="e", padx=5)
 
+    def setup_incremental_ui(self, row, key):
+        # Compares sources against the build manifest, so unchanged inputs are not converted again
+        self.incremental_key = key
+        incremental = self.config.getboolean("options", key, fallback=False)
+        self.incremental_var = tk.IntVar(value=int(incremental))
+        tk.Checkbutton(
+            self.action_frame, text="Only convert changed files", variable=self.incremental_var
+        ).grid(row=row, column=0, sticky="w")
+
+    def get_incremental(self):
+        incremental = self.incremental_var.get() == 1
+        self.save_option(self.incremental_key, incremental)
+        return incremental
+
+    def setup_variants_ui(self, row, key):
+        # Export profile such as "64=64+square 32", see variants.py
+        self.variants_key = key
+        self.variants_var = tk.StringVar(value=self.config.get("options", key, fallback=""))
+        variants_frame = tk.Frame(self.action_frame)
+        variants_frame.grid(row=row, column=0, columnspan=3, sticky="we")
+        tk.Label(variants_frame, text="Extra sizes").pack(side='left')
+        tk.Entry(variants_frame, textvariable=self.variants_var).pack(side='left', fill='x', expand=True, padx=5)
+
+    def get_variants(self):
+        # The profile, or None after showing why it cannot be used
+        text = " ".join(self.variants_var.get().split())
+        try:
+            parse_variants(text)
+        except ValueError as e:
+            self.status_label.config(text=f"Extra sizes: {e}", fg="red")
+            return None
+        self.save_option(self.variants_key, text)
+        return text
+
+    def setup_watch_ui(self, row, key):
+        # Only used with a scanned folder: after the first batch, new and
+        # changed inputs under it are converted as they appear
+        self.watch_key = key
+        watch = self.config.getboolean("options", key, fallback=False)
+        self.watch_var = tk.IntVar(value=int(watch))
+        tk.Checkbutton(
+            self.action_frame, text="Watch the scanned folder for changes", variable=self.watch_var
+        ).grid(row=row, column=0, sticky="w")
+
+    def get_watch(self):
+        watch = self.watch_var.get() == 1
+        self.save_option(self.watch_key, watch)
+        return watch
+
+    def start_watch(self):
+        # Convert thread, before the first batch runs, so files changed
+        # while it runs are converted after it
+        if self._watch_args is None:
+            return None
+        kind, root, make_batch, exclude = self._watch_args
+        self._watch = watch_tree(kind, root, make_batch, exclude=exclude)
+        return self._watch
+
+    def stop_watch(self):
+        if self._watch is not None:
+            self._watch.stop()
+
+    def run_convert(self, batch, skipped_message):
+        # Convert thread: the batch, then the watch if one was asked for; the
+        # buttons are given back however it ends
+        try:
+            session = self.start_watch()
+            result = batch.run()
+            self.show_result(result, skipped_message)
+            if session is not None and not result.cancelled:
+                self.run_watch(session, skipped_message)
+            self.post_ui(self.clear_inputs)
+        except (EngineError, OSError, sqlite3.Error) as e:
+            self.stop_watch()
+            self.show_error(str(e))
+        finally:
+            self.post_ui(lambda: self.set_converting_state(False))
+
+    def run_watch(self, session, skipped_message):
+        # Convert thread: one batch for every burst of changes, until Cancel
+        root = session.watcher.root
+        self.post_ui(lambda: self.show_watching(root))
+        for batch in session.batches():
+            if session.stopped:
+                break
+            self._batch = batch
+            # The batch starts once its progress is being drawn, so no line is lost
+            shown = threading.Event()
+            self.post_ui(lambda b=batch: (self.show_watch_batch(b), shown.set()))
+            while not shown.wait(PROGRESS_FRAME_MS / 1000):
+                if session.stopped:
+                    return
+            try:
+                result = batch.run()
+            except EngineError as e:
+                self.post_ui(lambda msg=str(e): self.status_label.config(text=msg, fg="red"))
+                continue
+            self.show_result(result, skipped_message)
+            if result.cancelled:
+                return
+            self.post_ui(lambda: self.show_watching(root))
+
+    def show_watch_batch(self, batch):
+        self.status_label.config(text="Converting changed files...", fg="blue")
+        self.skipped_label.config(text="")
+        self.file_list.set_items([])
+        self.watch_progress(batch, self._convert_thread)
+
+    def show_watching(self, root):
+        text = self.status_label.cget("text")
+        self.status_label.config(text=f"{text}\nWatching {root} for changes ({time.strftime('%H:%M:%S')}).")
+
+    def setup_backend_ui(self, row, key, choices):
+        # choices: (backend, radio button text); the first is the default
+        self.backend_key = key
+        backend = self.config.get("options", key, fallback=choices[0][0])
+        self.backend_var = tk.StringVar(value=backend)
+        backend_frame = tk.Frame(self.action_frame)
+        backend_frame.grid(row=row, column=0, sticky="w")
+        tk.Label(backend_frame, text="Backend").pack(side='left')
+        for value, text in choices:
+            tk.Radiobutton(backend_frame, text=text, value=value, variable=self.backend_var).pack(side='left')
+
+    def get_backend(self):
+        backend = self.backend_var.get()
+        self.save_option(self.backend_key, backend)
+        return backend
+
+    def setup_resume_ui(self, row, kind):
+        # Batches are journaled, so a cancelled or crashed one can continue where it stopped
+        self.job_kind = kind
+        self.resume_btn = tk.Button(self.action_frame, text="Resume", command=self.resume_job, state="disabled")
+        self.resume_btn.grid(row=row, column=1, sticky="e", padx=5)
+        self.retry_btn = tk.Button(
+            self.action_frame, text="Retry failed", command=lambda: self.resume_job(True), state="disabled"
+        )
+        self.retry_btn.grid(row=row, column=2, sticky="e", padx=5)
+        job = self.update_resume_state()
+        if job is not None and job.resumable:
+            self.status_label.config(
+                text=f"The last batch stopped with {job.pending} item(s) left. Click Resume to continue.", fg="blue"
+            )
+
+    def update_resume_state(self):
+        try:
+            job = latest_job(self.job_kind)
+        except sqlite3.Error:
+            job = None
+        resumable = job is not None and job.resumable
+        failed = job is not None and job.count(*RETRY_STATUSES) > 0
+        self.resume_btn.config(state="normal" if resumable else "disabled")
+        self.retry_btn.config(state="normal" if failed else "disabled")
+        return job
+
+    def resume_job(self, failed_only=False):
+        try:
+            job = latest_job(self.job_kind)
+            if job is None:
+                raise EngineError("no batch to resume.")
+            self._batch = resume_batch(job.id, failed_only=failed_only, on_progress=self.post_progress)
+            self._watch_args = None
+        except (EngineError, sqlite3.Error) as e:
+            self.status_label.config(text=f"Cannot resume: {e}", fg="red")
+            return
+        self.status_label.config(text="Retrying failed items..." if failed_only else "Resuming...", fg="blue")
+        self.skipped_label.config(text="")
+        self.file_list.set_items([])
+        self.set_converting_state(True)
+        self._convert_thread = threading.Thread(target=self.convert)
+        self._convert_thread.start()
+        self.watch_progress(self._batch, self._convert_thread)
+
     def setup_status_ui(self, row):
         self.status_frame = tk.Frame(self.parent)
         self.status_frame.grid(row=row, column=1, columnspan=2, sticky='nsew', pady=(5, 0))
 
+        # Time, CPU, memory and stderr of every job of the last batch
+        self.report_btn = tk.Button(self.status_frame, text="Save report", command=self.save_report, state="disabled")
+        self.report_btn.pack(side='right', anchor='n', padx=5)
+
         self.status_label = tk.Label(self.status_frame, text="", fg="green")
         self.status_label.pack(side='top', anchor='w')
 
+        self.progress_label = tk.Label(self.status_frame, text="", fg="gray")
+        self.progress_label.pack(side='top', anchor='w')
+
         self.skipped_label = tk.Label(self.status_frame, text="", fg="gray")
         self.skipped_label.pack(side='top', anchor='w')
         pass
 
+    def get_workers(self):
+        try:
+            workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = default_workers()
+        if not self.config.has_section("options"):
+            self.config.add_section("options")
+        self.config.set("options", self.workers_key, str(workers))
+        save_config(self.config)
+        return workers
+
+    def get_timeout(self):
+        try:
+            timeout = max(0, int(self.timeout_var.get()))
+        except (tk.TclError, ValueError):
+            timeout = DEFAULT_KRANE_TIMEOUT
+        if not self.config.has_section("options"):
+            self.config.add_section("options")
+        self.config.set("options", self.timeout_key, str(timeout))
+        save_config(self.config)
+        return timeout or None
+
+    def save_option(self, key, value):
+        if not self.config.has_section("options"):
+            self.config.add_section("options")
+        self.config.set("options", key, str(value))
+        save_config(self.config)
+
+    def runner_options(self):
+        runner = self.config.get("options", RUNNER, fallback=RUNNER_THREADS)
+        return {
+            "runner": runner if runner in RUNNERS else RUNNER_THREADS,
+            "log_dir": self.config.get("options", LOG_DIR, fallback="") or None,
+        }
+
+    def post_ui(self, func):
+        # The one way worker threads touch Tk: func runs on the Tk thread in
+        # the next progress frame, after that frame's progress lines
+        self._ui_calls.append((threading.current_thread(), func))
+
+    def post_progress(self, idx, text):
+        # Batches report from worker threads. Only the latest text of each line
+        # is kept until the Tk thread draws the next frame.
+        with self._progress_lock:
+            self._progress[idx] = text
+
+    def watch_progress(self, batch, thread):
+        with self._progress_lock:
+            self._progress = {}
+        self._watched_batch = batch
+        self.progress_label.config(text="")
+        self.parent.after(PROGRESS_FRAME_MS, lambda: self.draw_progress(batch, thread))
+
+    def draw_progress(self, batch, thread):
+        if batch is not self._watched_batch:
+            return  # A newer batch was started after this one was cancelled
+        # Checked before draining, so the last frame sees every update of a finished batch
+        running = thread.is_alive()
+        with self._progress_lock:
+            updates, self._progress = self._progress, {}
+        for idx, text in sorted(updates.items()):
+            self.update_progress(idx, text)
+        while self._ui_calls:
+            owner, func = self._ui_calls.popleft()
+            if owner is thread:
+                func()  # Calls left by the thread of an earlier, cancelled batch are dropped
+        if self.file_list is not None:
+            self.file_list.refresh()
+        self.progress_label.config(text=progress_summary(batch))
+        if running:
+            self.parent.after(PROGRESS_FRAME_MS, lambda: self.draw_progress(batch, thread))
+
+    def show_result(self, result, skipped_message):
+        if result.cancelled:
+            self.post_ui(lambda: self.status_label.config(text="Conversion cancelled.", fg="red"))
+        elif result.failed or result.timed_out or result.invalid:
+            messages = []
+            if result.failed:
+                messages.append(f"Some conversions failed: {', '.join(result.failed)}")
+            if result.timed_out:
+                messages.append(f"Some conversions timed out: {', '.join(result.timed_out)}")
+            if result.invalid:
+                invalid = ", ".join(f"{name} ({result.reasons[name]})" for name in result.invalid)
+                messages.append(f"Some folders are invalid: {invalid}")
+            self.post_ui(lambda: self.status_label.config(text="\n".join(messages), fg="red"))
+        else:
+            self.post_ui(lambda: self.status_label.config(text="All conversions completed!", fg="green"))
+        messages = []
+        if result.skipped > 0:
+            messages.append(skipped_message.format(result.skipped))
+        if result.up_to_date > 0:
+            messages.append(f"{result.up_to_date} unchanged since the last conversion.")
+        if result.duplicates > 0:
+            messages.append(result.dedup_summary() + ".")
+        self.post_ui(lambda: self.skipped_label.config(text=" ".join(messages)))
+
     def show_error(self, msg):
-        self.parent.after(0, lambda: self.status_label.config(text=msg, fg="red"))
-        self.parent.after(0, lambda: self.set_converting_state(False))
+        self.post_ui(lambda: self.status_label.config(text=msg, fg="red"))
+        self.post_ui(lambda: self.set_converting_state(False))
+
+    def save_report(self):
+        batch = getattr(self, "_batch", None)
+        if batch is None:
+            return
+        path = filedialog.asksaveasfilename(
+            title="Save run report", defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            batch.result.report.save(path)
+        except OSError as e:
+            self.status_label.config(text=f"Cannot save report: {e}", fg="red")
 
     def set_converting_state(self, is_converting: bool):
         if is_converting:
             self.convert_btn.config(state="disabled")
             self.cancel_btn.config(state="normal")
+            self.report_btn.config(state="disabled")
         else:
             self.convert_btn.config(state="normal")
             self.cancel_btn.config(state="disabled")
+            batch = getattr(self, "_batch", None)
+            if batch is not None and batch.result.report.records:
+                self.report_btn.config(state="normal")
+        if getattr(self, "resume_btn", None) is None:
+            return
+        if is_converting:
+            self.resume_btn.config(state="disabled")
+            self.retry_btn.config(state="disabled")
+        else:
+            self.update_resume_state()
 
 class KtechTab(BaseTab):
     def __init__(self, parent, config):
@@ -124,13 +539,34 @@ class KtechTab(BaseTab):
 
         self.setup_common_ui(
             2, "Tex files", "Convert", self.select_tex_files, 
-            True, self.start_convert, self.cancel_convert
+            True, self.start_convert, self.cancel_convert, workers_key=KTECH_WORKERS, virtual_list=True,
+            scan_command=self.scan_tex_folder
         )
+        # The built-in decoder converts in-process, without starting ktech per file
+        self.setup_backend_ui(1, KTECH_BACKEND, [(BACKEND_KTECH, BACKEND_KTECH), (BACKEND_BUILTIN, BACKEND_BUILTIN)])
+        self.setup_incremental_ui(2, KTECH_INCREMENTAL)
+        self.setup_dedup_ui(3)
+        self.setup_watch_ui(4, KTECH_WATCH)
+        self.setup_variants_ui(5, KTECH_VARIANTS)
+        self.setup_resume_ui(1, KtechBatch.kind)
         self.tex_files = []
+        self.scan_root = None
         
         self._convert_thread = None
-        self._cancel_flag = False
-        self._current_proc = None
+        self._batch = None
+
+    def setup_dedup_ui(self, row):
+        # Mods often ship byte-identical textures; each is converted once and the rest linked
+        dedup = self.config.getboolean("options", KTECH_DEDUP, fallback=False)
+        self.dedup_var = tk.IntVar(value=int(dedup))
+        tk.Checkbutton(
+            self.action_frame, text="Link identical textures", variable=self.dedup_var
+        ).grid(row=row, column=0, sticky="w")
+
+    def get_dedup(self):
+        dedup = self.dedup_var.get() == 1
+        self.save_option(KTECH_DEDUP, dedup)
+        return dedup
 
     def select_tex_files(self):
         paths = filedialog.askopenfilenames(
@@ -138,101 +574,75 @@ class KtechTab(BaseTab):
             filetypes=[("Klei TEX files", "*.tex")])
         if paths:
             self.tex_files = list(paths)
-            self.input_text.config(state='normal')
-            self.input_text.delete("1.0", tk.END)
-            for p in self.tex_files:
-                self.input_text.insert(tk.END, os.path.basename(p) + "\n")
-            self.input_text.config(state='disabled')
+            self.scan_root = None
+            self.file_list.set_items(os.path.basename(p) for p in self.tex_files)
+
+    def scan_tex_folder(self):
+        # Every .tex below the folder, found while converting; subfolders are kept in the output
+        path = filedialog.askdirectory(title="Select a folder to scan for .tex files")
+        if path:
+            self.tex_files = []
+            self.scan_root = path
+            self.file_list.set_items([])
+            self.status_label.config(text=f"Will convert every .tex under {path}", fg="blue")
 
     def start_convert(self):
+        variants = self.get_variants()
+        if variants is None:
+            return
         self.status_label.config(text="Converting...", fg="blue")
         self.skipped_label.config(text="")
         self.set_converting_state(True)
-        self._cancel_flag = False
+        backend = self.get_backend()
+        output_dir = self.output_dir_var.get()
+        tex_files = self.tex_files
+        if self.scan_root:
+            self.file_list.set_items([])
+            tex_files = scan_tex_files(self.scan_root, exclude=[output_dir])
+        options = dict(
+            skip_existing=self.skip_var.get() == 1, workers=self.get_workers(), backend=backend,
+            source_root=self.scan_root, dedup=self.get_dedup(), variants=variants, on_progress=self.post_progress,
+            **self.runner_options()
+        )
+        ktech_dir = self.ktech_dir_var.get()
+        self._batch = KtechBatch(
+            tex_files, output_dir, ktech_dir, incremental=self.get_incremental(),
+            journal_path=JOURNAL_FILE, **options
+        )
+        self._watch_args = None
+        if self.scan_root and self.get_watch():
+            # Changed files are converted incrementally, and not journaled
+            make_batch = lambda changed: KtechBatch(changed, output_dir, ktech_dir, incremental=True, **options)
+            self._watch_args = (KtechBatch.kind, self.scan_root, make_batch, [output_dir])
         self._convert_thread = threading.Thread(target=self.convert)
         self._convert_thread.start()
+        self.watch_progress(self._batch, self._convert_thread)
 
     def cancel_convert(self):
-        self._cancel_flag = True
-        if self._current_proc is not None:
-            try:
-                self._current_proc.terminate()
-            except Exception:
-                pass
+        self.stop_watch()
+        if self._batch is not None:
+            self._batch.cancel()
         self.status_label.config(text="Conversion cancelled.", fg="red")
         self.set_converting_state(False)
 
     def update_progress(self, idx, text):
-        self.input_text.config(state='normal')
-        self.input_text.delete(f"{idx+1}.0", f"{idx+1}.end")
-        self.input_text.insert(f"{idx+1}.0", text)
-        self.input_text.config(state='disabled')
+        self.file_list.set_row(idx, text)
 
     def convert(self):
-        ktech_dir = self.ktech_dir_var.get()
-        output_dir = self.output_dir_var.get()
-        skip_existing = self.skip_var.get()
-        if not output_dir:
+        batch = self._batch
+        if not batch.output_dir:
             self.show_error("Please select output folder.")
             return
-        if not self.tex_files:
+        if not batch.tex_files:
             self.show_error("Please select tex files to convert.")
-            self.input_text.config(state='normal')
-            self.input_text.delete("1.0", tk.END)
-            self.input_text.config(state='disabled')
+            self.post_ui(lambda: self.file_list.set_items([]))
             return
-        if ktech_dir:
-            ktech_exe = os.path.join(ktech_dir, "ktech")
-            if os.name == 'nt':
-                ktech_exe += ".exe"
-        else:
-            ktech_exe = "ktech"
-        errors = []
-        skipped = 0
-        for idx, tex_file in enumerate(self.tex_files):
-            if self._cancel_flag:
-                break
-            base = os.path.splitext(os.path.basename(tex_file))[0]
-            out_png = os.path.join(output_dir, base + ".png")
-            line = f"{base}.tex - Converting..."
-            self.parent.after(0, lambda i=idx, l=line: self.update_progress(i, l))
-            if skip_existing and os.path.exists(out_png):
-                skipped += 1
-                line = f"{base}.tex - Skipped"
-                self.parent.after(0, lambda i=idx, l=line: self.update_progress(i, l))
-                continue
-            cmd = f'"{ktech_exe}" "{tex_file}" "{output_dir}"'
-            try:
-                self._current_proc = subprocess.Popen(cmd, shell=True, stdout=DEVNULL)
-                self._current_proc.wait()
-                if self._current_proc.returncode != 0:
-                    errors.append(base + ".tex")
-                    line = f"{base}.tex - Failed!"
-                else:
-                    line = f"{base}.tex - Success!"
-            except Exception:
-                errors.append(base + ".tex")
-                line = f"{base}.tex - Failed!"
-            finally:
-                self._current_proc = None
-            self.parent.after(0, lambda i=idx, l=line: self.update_progress(i, l))
-        if self._cancel_flag:
-            self.parent.after(0, lambda: self.status_label.config(text="Conversion cancelled.", fg="red"))
-        elif errors:
-            self.parent.after(0, lambda: self.status_label.config(
-                text=f"Some conversions failed: {', '.join(errors)}", fg="red"))
-        else:
-            self.parent.after(0, lambda: self.status_label.config(text="All conversions completed!", fg="green"))
-        if skipped > 0:
-            self.parent.after(0, lambda: self.skipped_label.config(
-                text=f"Skipped {skipped} file(s) because png already exists."))
-        else:
-            self.parent.after(0, lambda: self.skipped_label.config(text=""))
-        self.parent.after(0, self.clear_inputs)
-        self.parent.after(0, lambda: self.set_converting_state(False))
+        skipped_message = "Skipped {} file(s) because png already exists."
+        self.run_convert(batch, skipped_message)
 
     def clear_inputs(self):
         self.tex_files = []
+        self.scan_root = None
 
 class KraneTab(BaseTab):
     def __init__(self, parent, config, ktech_tab_ref):
@@ -249,115 +659,90 @@ class KraneTab(BaseTab):
 
         self.setup_common_ui(
             1, "Anim folders", "Convert", self.select_anim_folder, 
-            True, self.start_convert, self.cancel_convert
+            True, self.start_convert, self.cancel_convert,
+            workers_key=KRANE_WORKERS, timeout_key=KRANE_TIMEOUT, virtual_list=True,
+            scan_command=self.scan_anim_root
+        )
+        self.setup_incremental_ui(1, KRANE_INCREMENTAL)
+        # Built-in cuts the build's symbol frames to pngs in-process, without krane or an scml
+        self.setup_backend_ui(
+            2, KRANE_BACKEND, [(BACKEND_KRANE, "krane (scml)"), (BACKEND_BUILTIN, "built-in (frame pngs)")]
         )
+        self.setup_watch_ui(3, KRANE_WATCH)
+        self.setup_resume_ui(1, KraneBatch.kind)
         self.anim_folders = []
+        self.scan_root = None
 
         self._convert_thread = None
-        self._cancel_flag = False
-        self._current_proc = None
+        self._batch = None
 
     def select_anim_folder(self):
         # path = os.path.basename(filedialog.askdirectory(title="Select an anim folder"))
         path = filedialog.askdirectory(title="Select an anim folder")
         if path and path not in self.anim_folders:
             self.anim_folders.append(path)
-            self.input_text.config(state='normal')
-            self.input_text.delete("1.0", tk.END)
-            for folder in self.anim_folders:
-                self.input_text.insert(tk.END, os.path.basename(folder) + "\n")
-            self.input_text.config(state='disabled')
+            self.scan_root = None
+            self.file_list.set_items(os.path.basename(folder) for folder in self.anim_folders)
+
+    def scan_anim_root(self):
+        # Every folder below with anim.bin, build.bin and a .tex, found while converting
+        path = filedialog.askdirectory(title="Select a folder to scan for anim folders")
+        if path:
+            self.anim_folders = []
+            self.scan_root = path
+            self.file_list.set_items([])
+            self.status_label.config(text=f"Will convert every anim folder under {path}", fg="blue")
 
     def start_convert(self):
         self.status_label.config(text="Converting...", fg="blue")
         self.skipped_label.config(text="")
         self.set_converting_state(True)
-        self._cancel_flag = False
+        anim_folders = self.anim_folders
+        if self.scan_root:
+            self.file_list.set_items([])
+            anim_folders = scan_anim_folders(self.scan_root)
+        options = dict(
+            skip_existing=self.skip_var.get() == 1, workers=self.get_workers(), timeout=self.get_timeout(),
+            source_root=self.scan_root, backend=self.get_backend(), on_progress=self.post_progress,
+            **self.runner_options()
+        )
+        krane_dir = self.krane_dir_var.get()
+        self._batch = KraneBatch(
+            anim_folders, krane_dir, incremental=self.get_incremental(), journal_path=JOURNAL_FILE, **options
+        )
+        self._watch_args = None
+        if self.scan_root and self.get_watch():
+            make_batch = lambda changed: KraneBatch(changed, krane_dir, incremental=True, **options)
+            self._watch_args = (KraneBatch.kind, self.scan_root, make_batch, [])
         self._convert_thread = threading.Thread(target=self.convert)
         self._convert_thread.start()
+        self.watch_progress(self._batch, self._convert_thread)
+
+    def update_progress(self, idx, text):
+        self.update_folder_status(idx, text)
 
     def update_folder_status(self, idx, text):
-        self.input_text.config(state='normal')
-        line_content = self.input_text.get(f"{idx+1}.0", f"{idx+1}.end")
-        if line_content.strip(): 
-            self.input_text.delete(f"{idx+1}.0", f"{idx+1}.end")
-            self.input_text.insert(f"{idx+1}.0", text)
-        self.input_text.config(state='disabled')
+        self.file_list.set_row(idx, text)
 
     def cancel_convert(self):
-        self._cancel_flag = True
-        if self._current_proc is not None:
-            try:
-                self._current_proc.terminate()
-            except Exception:
-                pass
+        self.stop_watch()
+        if self._batch is not None:
+            self._batch.cancel()
         self.status_label.config(text="Conversion cancelled.", fg="red")
         self.set_converting_state(False)
 
     def convert(self):
-        krane_dir = self.krane_dir_var.get()
-        skip_existing = self.skip_var.get()
-        
-        if not self.anim_folders:
+        batch = self._batch
+        if not batch.anim_folders:
             self.show_error("Please select anim folders.")
-            self.input_text.config(state='normal')
-            self.input_text.delete("1.0", tk.END)
-            self.input_text.config(state='disabled')
+            self.post_ui(lambda: self.file_list.set_items([]))
             return
-        if krane_dir:
-            krane_exe = os.path.join(krane_dir, "krane")
-            if os.name == 'nt':
-                krane_exe += ".exe"
-        else:
-            krane_exe = "krane"
-        errors = []
-        skipped = 0
-        for idx, folder in enumerate(self.anim_folders):
-            if self._cancel_flag:
-                break
-            base_name = os.path.basename(folder)
-            output_dir = os.path.join(folder, "output")
-            os.makedirs(output_dir, exist_ok=True)
-
-            line = f"{base_name} - Converting..."
-            self.parent.after(0, lambda i=idx, l=line: self.update_folder_status(i, l))
-            if skip_existing and any(f.endswith(".scml") for f in os.listdir(output_dir)):
-                skipped += 1
-                line = f"{base_name} - Skipped"
-                self.parent.after(0, lambda i=idx, l=line: self.update_folder_status(i, l))
-                continue
-            cmd = f'"{krane_exe}" "{folder}" "{output_dir}"'
-            try:
-                self._current_proc = subprocess.Popen(cmd, shell=True, stdout=DEVNULL)
-                self._current_proc.wait()
-                if self._current_proc.returncode != 0:
-                    errors.append(base_name)
-                    line = f"{base_name} - Failed!"
-                else:
-                    line = f"{base_name} - Success!"
-            except Exception:
-                errors.append(base_name)
-                line = f"{base_name} - Failed!"
-            finally:
-                self._current_proc = None
-            self.parent.after(0, lambda i=idx, l=line: self.update_folder_status(i, l))
-        if self._cancel_flag:
-            self.parent.after(0, lambda: self.status_label.config(text="Conversion cancelled.", fg="red"))
-        elif errors:
-            self.parent.after(0, lambda: self.status_label.config(
-                text=f"Some conversions failed: {', '.join(errors)}", fg="red"))
-        else:
-            self.parent.after(0, lambda: self.status_label.config(text="All conversions completed!", fg="green"))
-        if skipped > 0:
-            self.parent.after(0, lambda: self.skipped_label.config(
-                text=f"Skipped {skipped} folder(s) because scml already exists."))
-        else:
-            self.parent.after(0, lambda: self.skipped_label.config(text=""))
-        self.parent.after(0, self.clear_inputs)
-        self.parent.after(0, lambda: self.set_converting_state(False))
+        skipped_message = "Skipped {} folder(s) because scml already exists."
+        self.run_convert(batch, skipped_message)
 
     def clear_inputs(self):
         self.anim_folders = []
+        self.scan_root = None
 
 class CropTab(BaseTab):
     def __init__(self, parent, config):
@@ -378,19 +763,108 @@ class CropTab(BaseTab):
         )
 
         self.setup_common_ui(
-            2, "Icon names", "Crop", None, False, self.start_crop, self.cancel_crop, force64_option=True
+            2, "Icon names", "Crop", None, False, self.start_crop, self.cancel_crop,
+            force64_option=True, workers_key=CROP_WORKERS
         )
+        self.setup_png_ui()
+        self.setup_packing_ui(2)
+        self.setup_variants_ui(3, CROP_VARIANTS)
+        # Thumbnails of the source folder's icons; clicking one adds it to the names
+        tk.Button(self.parent, text="Icons", command=self.open_preview).grid(
+            row=2, column=2, padx=5, pady=5, sticky='n')
+        self._batch = None
+        # Kept between runs, so cropping again from the same atlases skips decoding
+        self.atlas_cache = None
+        self.thumbnail_cache = None
+        self.preview = None
+
+    def open_preview(self):
+        source_dir = self.source_dir_var.get()
+        if not source_dir or not os.path.isdir(source_dir):
+            self.status_label.config(text="Please select source folder.", fg="red")
+            return
+        if self.preview is not None and self.preview.winfo_exists():
+            if self.preview.source_dir == source_dir:
+                self.preview.lift()
+                return
+            self.preview.destroy()
+        # Pillow and the thumbnail cache are only loaded once the preview is used
+        from icon_preview import IconPreview
+        from thumbnails import ThumbnailCache
+
+        if self.thumbnail_cache is None:
+            self.thumbnail_cache = ThumbnailCache()
+        self.preview = IconPreview(self.parent, source_dir, self.thumbnail_cache, self.add_icon_name)
+
+    def add_icon_name(self, name):
+        lines = self.input_text.get("1.0", tk.END).splitlines()
+        if name in (line.strip() for line in lines):
+            return
+        text = self.input_text.get("1.0", "end-1c")
+        self.input_text.insert(tk.END, ("\n" if text and not text.endswith("\n") else "") + name)
+        self.input_text.see(tk.END)
+
+    def setup_png_ui(self):
+        # PNG compression: low levels save fast while iterating, 9 + optimize gives small release files
+        png_frame = tk.Frame(self.action_frame)
+        png_frame.grid(row=0, column=0, sticky="e")
+        level = self.config.getint("options", CROP_PNG_LEVEL, fallback=DEFAULT_PNG_LEVEL)
+        self.png_level_var = tk.IntVar(value=level)
+        tk.Label(png_frame, text="PNG level").pack(side='left')
+        tk.Spinbox(png_frame, from_=0, to=9, width=2, textvariable=self.png_level_var).pack(side='left', padx=5)
+        optimize = self.config.getboolean("options", CROP_PNG_OPTIMIZE, fallback=False)
+        self.png_optimize_var = tk.IntVar(value=int(optimize))
+        tk.Checkbutton(png_frame, text="Optimize", variable=self.png_optimize_var).pack(side='left')
+
+    def setup_packing_ui(self, row):
+        # Thousands of small pngs are slow on network shares; one archive or atlas is a single write
+        packing = self.config.get("options", CROP_PACKING, fallback=PACK_FILES)
+        self.packing_var = tk.StringVar(value=packing if packing in PACKINGS else PACK_FILES)
+        packing_frame = tk.Frame(self.action_frame)
+        packing_frame.grid(row=row, column=0, sticky="w")
+        tk.Label(packing_frame, text="Output").pack(side='left')
+        for value, text in ((PACK_FILES, "png files"), (PACK_ZIP, "zip"), (PACK_TAR, "tar"),
+                            (PACK_ATLAS, "atlas (png + xml)")):
+            tk.Radiobutton(packing_frame, text=text, value=value, variable=self.packing_var).pack(side='left')
+
+    def get_packing(self):
+        packing = self.packing_var.get()
+        self.save_option(CROP_PACKING, packing)
+        return packing
+
+    def get_png_options(self):
+        try:
+            level = min(9, max(0, int(self.png_level_var.get())))
+        except (tk.TclError, ValueError):
+            level = DEFAULT_PNG_LEVEL
+        optimize = self.png_optimize_var.get() == 1
+        self.save_option(CROP_PNG_LEVEL, level)
+        self.save_option(CROP_PNG_OPTIMIZE, optimize)
+        return level, optimize
 
     def start_crop(self):
+        variants = self.get_variants()
+        if variants is None:
+            return
         self.status_label.config(text="Cropping...", fg="blue")
         self.skipped_label.config(text="")
         self.set_converting_state(True)
-        self._cancel_flag = False
+        png_level, png_optimize = self.get_png_options()
+        self._batch = CropBatch(
+            self.source_dir_var.get(), self.output_dir_var.get(),
+            self.input_text.get("1.0", tk.END).strip().splitlines(),
+            force64=self.force64_var.get() == 1, skip_existing=self.skip_var.get() == 1,
+            workers=self.get_workers(), png_level=png_level, png_optimize=png_optimize,
+            atlas_cache=self.atlas_cache, packing=self.get_packing(), variants=variants,
+            on_progress=self.post_progress
+        )
         self._crop_thread = threading.Thread(target=self.crop_icons)
         self._crop_thread.start()
+        self.watch_progress(self._batch, self._crop_thread)
 
     def cancel_crop(self):
-        self._cancel_flag = True
+        if self._batch is not None:
+            self._batch.cancel()
         self.status_label.config(text="Cropping cancelled.", fg="red")
         self.set_converting_state(False)
         
@@ -399,106 +873,119 @@ class CropTab(BaseTab):
         self.input_text.insert(f"{idx+1}.0", text)
 
     def crop_icons(self):
-        source_dir = self.source_dir_var.get()
-        output_dir = self.output_dir_var.get()
-        icon_names = self.input_text.get("1.0", tk.END).strip().splitlines()
-        force64 = self.force64_var.get() == 1
-        skip_output = self.skip_var.get() == 1
-
-        if not source_dir:
+        batch = self._batch
+        if not batch.source_dir:
             self.show_error("Please select source folder.")
             return
-        if not output_dir:
+        if not batch.output_dir:
             self.show_error("Please select output folder.")
             return
-        if not icon_names:
+        if not batch.names:
             self.show_error("Please enter icon names.")
             return
+        try:
+            result = batch.run()
+            self.atlas_cache = batch.atlas_cache
+            self.show_crop_result(batch, result)
+        except (EngineError, OSError, sqlite3.Error) as e:
+            self.show_error(str(e))
+        finally:
+            self.post_ui(lambda: self.set_converting_state(False))
 
-        xml_files = [os.path.join(source_dir, f) for f in os.listdir(source_dir) if f.endswith(".xml")]
-        if not xml_files:
-            self.show_error("No XML files found in source folder.")
-            return
-
-        names = [
-            n.strip().lower().replace(".tex", "") + ".tex"
-            for n in icon_names 
-            if n.strip()
-        ]
-
-        skipped = 0
-        done_names = set()
-        for idx, name in enumerate(names):
-            if self._cancel_flag:
-                self.parent.after(0, lambda: self.status_label.config(text="Cropping cancelled.", fg="red"))
-                break
-            if name in done_names:
-                continue
-            found = False
-            for xml_path in xml_files:
-                png_path = os.path.splitext(xml_path)[0] + ".png"
-                if not os.path.exists(png_path):
-                    continue  # No png file, skip
-                image = Image.open(png_path)
-                width, height = image.size
-                tree = ET.parse(xml_path)
-                root_xml = tree.getroot()
-                elements = root_xml.find('Elements')
-                for elem in elements:
-                    icon_name = elem.attrib["name"].lower()
-                    if icon_name == name:
-                        base_name = os.path.splitext(name)[0]
-                        output_file = os.path.join(output_dir, base_name + ".png")
-                        if skip_output and os.path.exists(output_file):
-                            line = f"{base_name} - Skipped"
-                            found = True
-                            skipped += 1
-                            break
-                        if force64:
-                            u1 = float(elem.attrib["u1"])
-                            u2 = float(elem.attrib["u2"])
-                            v1 = float(elem.attrib["v1"])
-                            v2 = float(elem.attrib["v2"])
-                            center_x = int(((u1 + u2) / 2) * width)
-                            center_y = int(((2 - v1 - v2) / 2) * height)
-                            half = 32
-                            left = max(center_x - half, 0)
-                            top = max(center_y - half, 0)
-                            right = min(center_x + half, width)
-                            bottom = min(center_y + half, height)
-                        else:
-                            u1 = float(elem.attrib["u1"])
-                            u2 = float(elem.attrib["u2"])
-                            v1 = float(elem.attrib["v1"])
-                            v2 = float(elem.attrib["v2"])
-                            left = int(u1 * width)
-                            right = int(u2 * width)
-                            top = int((1 - v2) * height)
-                            bottom = int((1 - v1) * height)
-                        cropped = image.crop((left, top, right, bottom))
-                        os.makedirs(output_dir, exist_ok=True)
-                        cropped.save(output_file)
-                        line = f"{base_name} - Success!"
-                        found = True
-                        break
-                if found:
-                    break
-            if not found:
-                line = f"{name.replace('.tex', '')} - File not found"
-            self.parent.after(0, lambda i=idx, l=line: self.update_progress(i, l))
-            done_names.add(name)
-        if self._cancel_flag:
-            self.parent.after(0, lambda: self.status_label.config(text="Cropping cancelled.", fg="red"))
+    def show_crop_result(self, batch, result):
+        if result.cancelled:
+            self.post_ui(lambda: self.status_label.config(text="Cropping cancelled.", fg="red"))
         else:
-            self.parent.after(0, lambda: self.status_label.config(text="Cropping completed.", fg="green"))
+            self.post_ui(lambda: self.status_label.config(text="Cropping completed.", fg="green"))
             
-        if skipped > 0:
-            self.parent.after(0, lambda: self.skipped_label.config(
-                text=f"Skipped {skipped} file(s) because already exists."))
+        if result.skipped > 0:
+            self.post_ui(lambda: self.skipped_label.config(
+                text=f"Skipped {result.skipped} file(s) because already exists."))
+        elif batch.pack_paths:
+            written = ", ".join(os.path.basename(path) for path in batch.pack_paths)
+            self.post_ui(lambda: self.skipped_label.config(text=f"Wrote {written}."))
         else:
-            self.parent.after(0, lambda: self.skipped_label.config(text=""))
+            self.post_ui(lambda: self.skipped_label.config(text=""))
+
+def apply_queue_options(config):
+    # At startup, as the Queue tab is only built once it is opened
+    SCHEDULER.set_slots(config.getint("options", CPU_BUDGET, fallback=SCHEDULER.slots))
+    for kind in SCHEDULER_KINDS:
+        SCHEDULER.set_weight(kind, config.getint("options", kind + WEIGHT_SUFFIX, fallback=SCHEDULER.weight(kind)))
+
+
+class QueueTab(tk.Frame):
+    """The shared CPU budget, each tab's weight, and every batch waiting for it."""
+
+    def __init__(self, parent, config):
+        super().__init__(parent)
+        self.parent = parent
+        self.config = config
+        self.parent.grid_columnconfigure(1, weight=1)
+        self.parent.grid_rowconfigure(2, weight=1)
 
-        self.parent.after(0, lambda: self.set_converting_state(False))
+        self.budget_var = tk.IntVar(value=SCHEDULER.slots)
+        tk.Label(self.parent, text="CPU budget").grid(row=0, column=0, sticky='e', padx=2, pady=5)
+        tk.Spinbox(
+            self.parent, from_=1, to=256, width=4, textvariable=self.budget_var
+        ).grid(row=0, column=1, sticky='w', padx=5)
+        self.budget_var.trace_add("write", lambda *_: self.set_budget())
+
+        # A tab of weight 2 gets twice the jobs of a tab of weight 1 while both have work
+        tk.Label(self.parent, text="Weights").grid(row=1, column=0, sticky='e', padx=2, pady=5)
+        weights_frame = tk.Frame(self.parent)
+        weights_frame.grid(row=1, column=1, sticky='w')
+        self.weight_vars = {}
+        for kind in SCHEDULER_KINDS:
+            var = tk.IntVar(value=SCHEDULER.weight(kind))
+            tk.Label(weights_frame, text=kind).pack(side='left')
+            tk.Spinbox(weights_frame, from_=1, to=16, width=3, textvariable=var).pack(side='left', padx=(2, 10))
+            var.trace_add("write", lambda *_, kind=kind: self.set_weight(kind))
+            self.weight_vars[kind] = var
+
+        self.queue_text = tk.Text(self.parent, height=8, state="disabled", wrap="none")
+        self.queue_text.grid(row=2, column=0, columnspan=2, sticky='nsew', padx=5, pady=5)
+        self.refresh()
+
+    def read_int(self, var):
+        try:
+            return max(1, int(var.get()))
+        except (tk.TclError, ValueError):
+            return None  # Half-typed value
+
+    def save_option(self, key, value):
+        if not self.config.has_section("options"):
+            self.config.add_section("options")
+        self.config.set("options", key, str(value))
+        save_config(self.config)
+
+    def set_budget(self):
+        budget = self.read_int(self.budget_var)
+        if budget is not None:
+            SCHEDULER.set_slots(budget)
+            self.save_option(CPU_BUDGET, budget)
+
+    def set_weight(self, kind):
+        weight = self.read_int(self.weight_vars[kind])
+        if weight is not None:
+            SCHEDULER.set_weight(kind, weight)
+            self.save_option(kind + WEIGHT_SUFFIX, weight)
+
+    def refresh(self):
+        lines = []
+        used = 0
+        for kind, weight, running, waiting, batch in SCHEDULER.snapshot():
+            used += running
+            done = batch.result.done if batch is not None else 0
+            total = getattr(batch, "total", None)
+            left = f"{total - done} left" if total is not None else "scanning"
+            lines.append(f"{kind:<6} weight {weight}  {running} running, {waiting} waiting, {done} done, {left}")
+        lines.insert(0, f"{used}/{SCHEDULER.slots} CPU slots in use")
+        self.queue_text.config(state="normal")
+        self.queue_text.delete("1.0", "end")
+        self.queue_text.insert("1.0", "\n".join(lines))
+        self.queue_text.config(state="disabled")
+        self.parent.after(QUEUE_REFRESH_MS, self.refresh)
 
 # Focus management for restoring focus on tab switch, and clear selection on tab change
 last_focus_widget = [None]
@@ -519,7 +1006,29 @@ def on_tab_changed(event):
             notebook.after(30, restore_focus)
     notebook.after(30, restore_focus)
 
-if __name__ == "__main__":
+class LazyTabs:
+    """Notebook pages whose tab is only built the first time it is shown,
+    so startup builds the one tab in view instead of all of them."""
+
+    def __init__(self, notebook):
+        self.notebook = notebook
+        self.builders = {}  # page widget name -> (page, text, builder)
+        self.tabs = {}  # text -> built tab
+        notebook.bind('<<NotebookTabChanged>>', lambda event: self.build_selected(), add="+")
+
+    def add(self, text, builder):
+        page = tk.Frame(self.notebook)
+        self.notebook.add(page, text=text)
+        self.builders[str(page)] = (page, text, builder)
+
+    def build_selected(self):
+        selected = self.notebook.select()
+        if selected in self.builders:
+            page, text, builder = self.builders.pop(selected)
+            self.tabs[text] = builder(page)
+
+
+def create_main_window(config):
     root = tk.Tk()
     root.title("KTools - Multi Converter")
     root.geometry("700x400")
@@ -529,16 +1038,19 @@ if __name__ == "__main__":
     style.configure('TNotebook.Tab', font=('Arial', 12))
     notebook = ttk.Notebook(root)
     notebook.pack(fill='both', expand=True)
+    apply_queue_options(config)
+    tabs = LazyTabs(notebook)
+    tabs.add("ktech", lambda page: KtechTab(page, config))
+    # krane falls back to the ktech folder; the ktech tab is the first one shown, so it exists
+    tabs.add("krane", lambda page: KraneTab(page, config, tabs.tabs.get("ktech")))
+    tabs.add("Crop", lambda page: CropTab(page, config))
+    tabs.add("Queue", lambda page: QueueTab(page, config))
+    tabs.build_selected()
+    notebook.bind('<<NotebookTabChanged>>', on_tab_changed, add="+")
+    return root
+
+
+if __name__ == "__main__":
     config = configparser.ConfigParser()
     config.read(CONFIG_FILE)
-    frame_ktech = tk.Frame(notebook)
-    notebook.add(frame_ktech, text="ktech")
-    ktech_tab = KtechTab(frame_ktech, config)
-    frame_krane = tk.Frame(notebook)
-    notebook.add(frame_krane, text="krane")
-    KraneTab(frame_krane, config, ktech_tab)
-    frame_crop = tk.Frame(notebook)
-    notebook.add(frame_crop, text="Crop")
-    CropTab(frame_crop, config)
-    notebook.bind('<<NotebookTabChanged>>', on_tab_changed)
-    root.mainloop()
+    create_main_window(config).mainloop()
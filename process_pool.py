@@ -0,0 +1,289 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from subprocess import DEVNULL, PIPE
+
+# Bytes of a child's stderr kept in ChildStats; the rest is dropped from the front
+STDERR_LIMIT = 4096
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def available_memory():
+    # Bytes of memory that can be used without swapping, or None if unknown
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if os.name == 'nt':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("sullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class Cancelled(Exception):
+    pass
+
+
+class ChildStats:
+    """Filled in by ProcessPool.run: wall seconds, user+system CPU seconds and
+    peak RSS bytes of the child (None where wait4 is not available), and the
+    last STDERR_LIMIT bytes it wrote to stderr."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = None
+        self.max_rss = None
+        self.stderr = ""
+
+    def set_usage(self, usage):
+        self.cpu = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        self.max_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _read_stderr_tail(stream, stats, log_path=None):
+    tail = b""
+    truncated = False
+    log = None
+    if log_path:
+        try:
+            log = open(log_path, "wb")
+        except OSError:
+            pass  # The pipe must still be drained, or the child blocks on a full pipe
+    while True:
+        chunk = os.read(stream.fileno(), 65536)
+        if not chunk:
+            break
+        if log is not None:
+            log.write(chunk)
+        tail += chunk
+        if len(tail) > STDERR_LIMIT:
+            tail = tail[-STDERR_LIMIT:]
+            truncated = True
+    if log is not None:
+        log.close()
+    text = tail.decode("utf-8", errors="replace")
+    stats.stderr = "..." + text if truncated else text
+
+
+class ProcessPool:
+    """Runs external tools (ktech, krane) on up to `workers` child processes at once.
+
+    Every running child is tracked so that cancel() can kill all of them, not
+    only the most recently started one. With a memory_limit (bytes), a child
+    only starts once the estimated cost of all running children plus its own
+    fits; a child bigger than the whole limit still runs, but alone. A caller
+    that holds a CPU slot passes `unscheduled`, a context manager that gives
+    the slot back for as long as the child waits for memory.
+    """
+
+    def __init__(self, workers=None, memory_limit=None):
+        self.workers = max(1, int(workers or default_workers()))
+        self.memory_limit = memory_limit
+        self._lock = threading.Lock()
+        self._memory_cond = threading.Condition(self._lock)
+        self._memory_used = 0
+        self._procs = set()
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def run(self, argv, timeout=None, cost=0, stats=None, log_path=None, unscheduled=None):
+        # argv is a list, so no shell is started in between us and the tool.
+        # Raises subprocess.TimeoutExpired after killing a child that ran
+        # longer than timeout seconds. A ChildStats passed as stats captures
+        # the child's stderr and resource usage, even if it timed out; with a
+        # log_path the whole stderr is also written there.
+        if self._cancelled:
+            raise Cancelled()
+        self._acquire_memory(cost, unscheduled)
+        try:
+            started = time.monotonic()
+            proc = subprocess.Popen(argv, stdout=DEVNULL, stderr=PIPE if stats is not None else None)
+            with self._lock:
+                self._procs.add(proc)
+                if self._cancelled:
+                    proc.kill()
+            reader = None
+            if stats is not None:
+                reader = threading.Thread(
+                    target=_read_stderr_tail, args=(proc.stderr, stats, log_path), daemon=True
+                )
+                reader.start()
+            try:
+                returncode, usage = self._wait(proc, timeout)
+            finally:
+                with self._lock:
+                    self._procs.discard(proc)
+                if reader is not None:
+                    reader.join()
+                    proc.stderr.close()
+                if stats is not None:
+                    stats.wall = time.monotonic() - started
+            if stats is not None and usage is not None:
+                stats.set_usage(usage)
+        finally:
+            self._release_memory(cost)
+        if self._cancelled:
+            raise Cancelled()
+        return returncode
+
+    def _wait(self, proc, timeout):
+        # (returncode, resource usage or None). wait4 reaps the child itself,
+        # which is the only way to get its own CPU time and peak memory.
+        if not hasattr(os, "wait4"):
+            try:
+                return proc.wait(timeout), None
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                raise
+        reap_lock = threading.Lock()
+        reaped = False
+        timed_out = False
+
+        def expire():
+            nonlocal timed_out
+            with reap_lock:
+                if not reaped:
+                    timed_out = True
+                    proc.kill()
+
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        with reap_lock:
+            reaped = True
+            proc.returncode = _exit_code(status)
+        if timed_out:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        return proc.returncode, usage
+
+    def _memory_full(self, cost):
+        return bool(self.memory_limit and self._memory_used and self._memory_used + cost > self.memory_limit)
+
+    def _acquire_memory(self, cost, unscheduled=None):
+        if unscheduled is not None:
+            with self._memory_cond:
+                if not self._memory_full(cost):
+                    unscheduled = None
+        if unscheduled is None:
+            self._wait_memory(cost)
+            return
+        # Memory first, then a CPU slot again, so a child that cannot start
+        # does not keep a slot from the jobs that could
+        reserved = False
+        try:
+            with unscheduled():
+                self._wait_memory(cost)
+                reserved = True
+        except BaseException:
+            if reserved:
+                self._release_memory(cost)
+            raise
+
+    def _wait_memory(self, cost):
+        with self._memory_cond:
+            while not self._cancelled and self._memory_full(cost):
+                self._memory_cond.wait()
+            if self._cancelled:
+                raise Cancelled()
+            self._memory_used += cost
+
+    def _release_memory(self, cost):
+        with self._memory_cond:
+            self._memory_used -= cost
+            self._memory_cond.notify_all()
+
+    def map(self, func, items, indexed=False):
+        # Yields (idx, item, result) in completion order; result is None for
+        # items that were cancelled while running. Items are taken from the
+        # iterable only a few per worker ahead, so a generator that is still
+        # scanning folders already feeds the workers, and cancel() stops it.
+        # With indexed, items are (idx, item) pairs in the order to run them.
+        items = iter(items) if indexed else enumerate(items)
+        pending = {}
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                while not exhausted and len(pending) < self.workers * 2:
+                    item = next(items, None) if not self._cancelled else None
+                    if item is None:
+                        exhausted = True
+                        break
+                    idx, item = item
+                    pending[executor.submit(self._call, func, idx, item)] = (idx, item)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, item = pending.pop(future)
+                    yield idx, item, future.result()
+
+    def _call(self, func, idx, item):
+        if self._cancelled:
+            return None
+        try:
+            return func(idx, item)
+        except Cancelled:
+            return None
+
+    def close(self):
+        # Nothing to release here; AsyncProcessPool stops its event loop
+        pass
+
+    def cancel(self):
+        with self._memory_cond:
+            self._cancelled = True
+            procs = list(self._procs)
+            self._memory_cond.notify_all()
+        for proc in procs:
+            try:
+                proc.kill()
+            except Exception:
+                pass
@@ -0,0 +1,116 @@
+import csv
+import json
+import os
+import threading
+
+FIELDS = ("kind", "name", "status", "wall", "cpu", "max_rss", "input_bytes", "output_bytes", "stderr")
+DEFAULT_SLOWEST = 10
+
+
+class JobRecord:
+    """Cost of one ktech/krane run, built-in decode, atlas decode or crop save.
+
+    wall and cpu are seconds; cpu and max_rss (bytes) are None where the
+    platform cannot measure them. stderr holds the tail of the tool's output.
+    """
+
+    def __init__(self, kind, name, input_bytes=0):
+        self.kind = kind
+        self.name = name
+        self.status = None
+        self.wall = 0.0
+        self.cpu = None
+        self.max_rss = None
+        self.input_bytes = input_bytes
+        self.output_bytes = 0
+        self.stderr = ""
+
+    def add_child_stats(self, stats):
+        self.wall = stats.wall
+        self.cpu = stats.cpu
+        self.max_rss = stats.max_rss
+        self.stderr = stats.stderr
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def folder_size(folder):
+    total = 0
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+    except OSError:
+        pass
+    return total
+
+
+class RunReport:
+    """JobRecords of one batch, exported as JSON or CSV."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def slowest(self, n=DEFAULT_SLOWEST):
+        with self._lock:
+            records = list(self.records)
+        return sorted(records, key=lambda r: r.wall, reverse=True)[:n]
+
+    def totals(self):
+        with self._lock:
+            records = list(self.records)
+        cpu = [r.cpu for r in records if r.cpu is not None]
+        rss = [r.max_rss for r in records if r.max_rss is not None]
+        return {
+            "jobs": len(records),
+            "wall": sum(r.wall for r in records),
+            "cpu": sum(cpu) if cpu else None,
+            "max_rss": max(rss) if rss else None,
+            "input_bytes": sum(r.input_bytes for r in records),
+            "output_bytes": sum(r.output_bytes for r in records),
+        }
+
+    def summary_lines(self, n=DEFAULT_SLOWEST):
+        # "  12.40s  cpu 11.90s  rss 812.0 MB  wilson (krane, Success!)"
+        lines = []
+        for r in self.slowest(n):
+            line = f"{r.wall:8.2f}s"
+            if r.cpu is not None:
+                line += f"  cpu {r.cpu:.2f}s"
+            if r.max_rss is not None:
+                line += f"  rss {r.max_rss / (1024 * 1024):.1f} MB"
+            lines.append(f"{line}  {r.name} ({r.kind}, {r.status})")
+        return lines
+
+    def save(self, path, slowest=DEFAULT_SLOWEST):
+        # CSV for a .csv path, JSON with totals and the slowest jobs otherwise
+        with self._lock:
+            records = list(self.records)
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                for record in records:
+                    writer.writerow(record.as_dict())
+            return
+        data = {
+            "totals": self.totals(),
+            "slowest": [r.name for r in self.slowest(slowest)],
+            "jobs": [r.as_dict() for r in records],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
@@ -0,0 +1,109 @@
+import threading
+
+from process_pool import default_workers
+
+DEFAULT_WEIGHT = 1
+
+
+class Client:
+    """One running batch's place in the Scheduler."""
+
+    def __init__(self, kind, batch, seq):
+        self.kind = kind
+        self.batch = batch
+        self.seq = seq
+        self.running = 0
+        self.waiting = 0
+        self.cancelled = False
+
+
+class Scheduler:
+    """One CPU budget shared by every batch of the application.
+
+    Each job of a batch (a ktech or krane child, a built-in decode, an atlas
+    decode or a crop save) holds one of `slots` while it runs. A batch's own
+    workers only cap how many of its jobs can ask at once. A free slot goes to
+    the waiting batch that holds the fewest slots for its kind's weight, so a
+    krane batch of weight 2 next to a ktech batch of weight 1 gets two thirds
+    of the CPU, however many small jobs the ktech batch has queued.
+    """
+
+    def __init__(self, slots=None):
+        self.slots = max(1, int(slots or default_workers()))
+        self.weights = {}  # kind -> weight, DEFAULT_WEIGHT for kinds not set
+        self._cond = threading.Condition()
+        self._clients = []
+        self._running = 0
+        self._seq = 0
+
+    def set_slots(self, slots):
+        with self._cond:
+            self.slots = max(1, int(slots))
+            self._cond.notify_all()
+
+    def set_weight(self, kind, weight):
+        with self._cond:
+            self.weights[kind] = max(1, int(weight))
+            self._cond.notify_all()
+
+    def weight(self, kind):
+        return self.weights.get(kind, DEFAULT_WEIGHT)
+
+    def register(self, kind, batch=None):
+        with self._cond:
+            self._seq += 1
+            client = Client(kind, batch, self._seq)
+            self._clients.append(client)
+            return client
+
+    def unregister(self, client):
+        with self._cond:
+            if client in self._clients:
+                self._clients.remove(client)
+            self._cond.notify_all()
+
+    def _next_client(self):
+        # Waiting client with the smallest share of slots for its weight;
+        # ties go to the batch that started first
+        waiting = [c for c in self._clients if c.waiting]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda c: (c.running / self.weight(c.kind), c.seq))
+
+    def acquire(self, client):
+        # Blocks until client may use a slot; False if it was cancelled meanwhile
+        with self._cond:
+            client.waiting += 1
+            try:
+                while not client.cancelled and (
+                        self._running >= self.slots or self._next_client() is not client):
+                    self._cond.wait()
+                if client.cancelled:
+                    return False
+                client.running += 1
+                self._running += 1
+                return True
+            finally:
+                client.waiting -= 1
+                # Another client may be next now that this one stopped waiting
+                self._cond.notify_all()
+
+    def release(self, client):
+        with self._cond:
+            client.running -= 1
+            self._running -= 1
+            self._cond.notify_all()
+
+    def cancel(self, client):
+        with self._cond:
+            client.cancelled = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        # [(kind, weight, running, waiting, batch)] of every registered batch, oldest first
+        with self._cond:
+            return [(c.kind, self.weight(c.kind), c.running, c.waiting, c.batch) for c in self._clients]
+
+
+# Shared by every tab of the application, and by the one batch the command line runs
+SCHEDULER = Scheduler()
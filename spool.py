@@ -0,0 +1,461 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from engine import BATCH_KINDS, CONVERTING, FAILED, BatchResult, CropBatch, EngineError
+from run_report import JobRecord
+
+# ktech/krane/crop batches shared by several machines through one folder
+# they all mount. A coordinator splits a batch's inputs into job files in
+# queue/; any number of workers claim them by renaming a job into claimed/
+# (a rename is atomic, so exactly one worker gets each job), run it as an
+# ordinary batch and write its result to done/, where the coordinator
+# collects it. Workers rewrite their file in workers/ every few seconds; a
+# job whose worker stopped doing so is renamed back into queue/ by whoever
+# notices first. Heartbeat ages are measured against a file the checker
+# touches itself, so they use the file server's clock, not each machine's.
+#
+#   spool/queue/<job>.json             waiting for a worker
+#   spool/claimed/<job>@<worker>.json  being run by that worker
+#   spool/done/<job>.json              result, until its coordinator reads it
+#   spool/workers/<worker>.json        heartbeat
+#   spool/tmp/                         files being written, renamed into place when complete
+
+DEFAULT_CHUNK = 16
+HEARTBEAT_INTERVAL = 5.0
+# A worker whose heartbeat is older than this is taken to be dead
+DEAD_AFTER = 30.0
+POLL_INTERVAL = 1.0
+# A dead worker's heartbeat is kept this long, so the spool command can list it
+FORGET_AFTER = 3600.0
+# Claims of one job that may end with a dead worker before it is given up as failed
+MAX_ATTEMPTS = 3
+
+_FOLDERS = ("queue", "claimed", "done", "workers", "tmp")
+# Keyword arguments holding paths, made absolute so any worker can follow them
+_PATH_OPTIONS = ("output_dir", "source_root", "source_dir", "ktech_dir", "krane_dir", "log_dir")
+# Batch attribute holding the inputs of each kind
+_ITEMS = {"ktech": "tex_files", "krane": "anim_folders", "crop": "names"}
+
+
+def worker_name():
+    # host-pid, safe as a file name and free of the "@" claimed/ names use
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def _job_id(name):
+    # "<job>.json" or "<job>@<worker>.json" -> job id
+    return name[:-5].split("@", 1)[0]
+
+
+class Spool:
+    """The shared folder: job files and the moves between its subfolders."""
+
+    def __init__(self, root, dead_after=DEAD_AFTER):
+        self.root = root
+        self.dead_after = dead_after
+        try:
+            for folder in _FOLDERS:
+                os.makedirs(os.path.join(root, folder), exist_ok=True)
+        except OSError as e:
+            raise EngineError(f"Cannot use spool folder {root}: {e.strerror}")
+
+    def path(self, folder, name=""):
+        return os.path.join(self.root, folder, name)
+
+    def names(self, folder):
+        try:
+            return sorted(name for name in os.listdir(self.path(folder)) if name.endswith(".json"))
+        except OSError:
+            return []
+
+    def write(self, folder, name, data):
+        # Readers never see half a file: it appears complete or not at all
+        tmp_path = self.path("tmp", f"{name}.{worker_name()}.{threading.get_ident()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path(folder, name))
+
+    def read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def now(self, name):
+        # The file server's current time: the mtime of a file just touched
+        path = self.path("tmp", name + ".clock")
+        with open(path, "a"):
+            pass
+        os.utime(path)
+        return os.stat(path).st_mtime
+
+    # Coordinator
+
+    def submit(self, job):
+        self.write("queue", job["id"] + ".json", job)
+
+    def results(self, batch_id):
+        # (job id, result) of every finished job of batch_id, removed from done/
+        found = []
+        for name in self.names("done"):
+            if name.startswith(batch_id + "-"):
+                result = self.read(self.path("done", name))
+                if result is not None:
+                    found.append((_job_id(name), result))
+                    try:
+                        os.remove(self.path("done", name))
+                    except OSError:
+                        pass
+        return found
+
+    def withdraw(self, batch_id):
+        # Queued jobs of a cancelled batch; claimed ones finish where they run
+        for name in self.names("queue"):
+            if name.startswith(batch_id + "-"):
+                try:
+                    os.remove(self.path("queue", name))
+                except OSError:
+                    pass
+
+    # Workers
+
+    def beat(self, worker, job_id=None):
+        self.write("workers", worker + ".json", {"host": socket.gethostname(), "pid": os.getpid(), "job": job_id})
+
+    def leave(self, worker):
+        for path in (self.path("workers", worker + ".json"), self.path("tmp", worker + ".clock")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def claim(self, worker):
+        """(job, claimed path) of the oldest queued job, now owned by worker, or None."""
+        for name in self.names("queue"):
+            job_id = _job_id(name)
+            claimed = self.path("claimed", f"{job_id}@{worker}.json")
+            try:
+                os.rename(self.path("queue", name), claimed)
+            except FileNotFoundError:
+                # Another worker got it first, unless a network file system
+                # retried a rename that had already succeeded for us
+                if not os.path.exists(claimed):
+                    continue
+            except OSError:
+                continue
+            if os.path.exists(self.path("done", name)):
+                # Requeued from a worker taken for dead that finished it after all
+                self.drop(claimed)
+                continue
+            job = self.read(claimed)
+            if job is None:
+                self.drop(claimed)
+                continue
+            return job, claimed
+        return None
+
+    def finish(self, claimed, job_id, result):
+        self.write("done", job_id + ".json", result)
+        self.drop(claimed)
+
+    def release(self, claimed, job):
+        # Back in the queue, for another worker to run from the start. A
+        # worker stopped on purpose did not fail the job, so its attempt is
+        # not counted towards giving it up.
+        if job.get("attempts"):
+            job["attempts"] -= 1
+        try:
+            self.write("claimed", os.path.basename(claimed), job)
+            os.rename(claimed, self.path("queue", job["id"] + ".json"))
+        except OSError:
+            pass
+
+    def drop(self, claimed):
+        try:
+            os.remove(claimed)
+        except OSError:
+            pass  # Already requeued by someone who took this worker for dead
+
+    def heartbeats(self, now):
+        # worker -> seconds since its last heartbeat
+        beats = {}
+        for name in self.names("workers"):
+            try:
+                beats[name[:-5]] = now - os.stat(self.path("workers", name)).st_mtime
+            except OSError:
+                continue
+        return beats
+
+    def reap(self, now):
+        """Requeues the jobs of workers silent for dead_after seconds; returns their ids."""
+        beats = self.heartbeats(now)
+        for worker, age in beats.items():
+            if age > FORGET_AFTER:
+                self.leave(worker)
+        requeued = []
+        for name in self.names("claimed"):
+            job_id, _, worker = name[:-5].partition("@")
+            age = beats.get(worker)
+            if age is not None and age <= self.dead_after:
+                continue
+            try:
+                os.rename(self.path("claimed", name), self.path("queue", job_id + ".json"))
+            except OSError:
+                continue  # Finished or requeued meanwhile
+            requeued.append(job_id)
+        return requeued
+
+    def workers(self, now):
+        # [(worker, seconds since its heartbeat, job it is running or None)]
+        rows = []
+        for worker, age in sorted(self.heartbeats(now).items()):
+            beat = self.read(self.path("workers", worker + ".json")) or {}
+            rows.append((worker, age, beat.get("job")))
+        return rows
+
+
+def job_batch(job, overrides=None, on_progress=None):
+    """The ktech/krane/crop batch that runs one spooled job. overrides are
+    options of the machine running it, such as its tool folder and workers."""
+    options = dict(job["options"])
+    for key, value in (overrides or {}).items():
+        if value is not None and key in options:
+            options[key] = value
+    if job["kind"] == CropBatch.kind:
+        return CropBatch(icon_names=job["items"], on_progress=on_progress, **options)
+    if job["kind"] not in BATCH_KINDS:
+        raise EngineError(f"Unknown job kind: {job['kind']}")
+    return BATCH_KINDS[job["kind"]](job["items"], on_progress=on_progress, **options)
+
+
+def _item_name(batch, item):
+    return batch.item_name(item) if hasattr(batch, "item_name") else os.path.splitext(item)[0]
+
+
+def failed_result(batch, job, error):
+    # Every input of a job that could not run, failed with the reason
+    items = [[idx, _item_name(batch, item), FAILED] for idx, item in enumerate(job["items"])]
+    return {"items": items, "lines": [[0, f"{job['id']}: {error}"]], "error": error}
+
+
+class SpoolWorker:
+    """Claims and runs spooled jobs until stop(), heartbeating meanwhile.
+
+    on_job(job) is called when a job starts, on_progress(idx, text) with
+    the status lines of its batch.
+    """
+
+    def __init__(self, spool, name=None, overrides=None, on_progress=None, on_job=None):
+        self.spool = spool
+        self.name = name or worker_name()
+        self.overrides = overrides or {}
+        self.on_progress = on_progress
+        self.on_job = on_job
+        self.jobs = 0
+        self._job_id = None
+        self._batch = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        # The running job is cancelled and goes back to the queue
+        self._stop.set()
+        with self._lock:
+            if self._batch is not None:
+                self._batch.cancel()
+
+    def heartbeat(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.spool.beat(self.name, self._job_id)
+            except OSError:
+                pass  # Share briefly unreachable; a long outage makes this worker look dead
+
+    def run(self, idle_exit=None):
+        """Runs jobs until stop(), or with idle_exit, until no job has been
+        queued or running for idle_exit seconds."""
+        self.spool.beat(self.name)
+        beat = threading.Thread(target=self.heartbeat, daemon=True)
+        beat.start()
+        reaped = 0.0
+        busy = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() - reaped >= HEARTBEAT_INTERVAL:
+                    reaped = time.monotonic()
+                    self.spool.reap(self.spool.now(self.name))
+                claimed = self.spool.claim(self.name)
+                if claimed is not None:
+                    self.run_job(*claimed)
+                    busy = time.monotonic()
+                    continue
+                if idle_exit is not None:
+                    if self.spool.names("claimed"):
+                        busy = time.monotonic()  # Others' jobs may yet come back to the queue
+                    elif time.monotonic() - busy >= idle_exit:
+                        break
+                self._stop.wait(POLL_INTERVAL)
+        finally:
+            self._stop.set()
+            beat.join()
+            self.spool.leave(self.name)
+
+    def run_job(self, job, claimed):
+        self._job_id = job["id"]
+        try:
+            self.spool.beat(self.name, job["id"])
+            result = self.run_batch(job, claimed)
+        finally:
+            self._job_id = None
+        if result is None:
+            self.spool.release(claimed, job)  # Stopped before it finished
+            return
+        result["worker"] = self.name
+        self.spool.finish(claimed, job["id"], result)
+        self.jobs += 1
+
+    def run_batch(self, job, claimed):
+        # The job's result, or None if the worker was stopped meanwhile
+        if self.on_job:
+            self.on_job(job)
+        lines = []
+
+        def on_progress(idx, text):
+            if not text.endswith(CONVERTING):
+                lines.append([idx, text])
+            if self.on_progress:
+                self.on_progress(idx, text)
+
+        with self._lock:
+            # The claim counts an attempt first, so a job that kills every
+            # worker is given up; release() takes it back after a clean stop
+            job["attempts"] = job.get("attempts", 0) + 1
+            self.spool.write("claimed", os.path.basename(claimed), job)
+            if self._stop.is_set():
+                return None
+            try:
+                batch = self._batch = job_batch(job, self.overrides, on_progress)
+            except (EngineError, TypeError) as e:
+                return failed_result(None, job, str(e))
+        try:
+            if job["attempts"] > MAX_ATTEMPTS:
+                return failed_result(batch, job, f"given up after {MAX_ATTEMPTS} workers stopped running it")
+            try:
+                result = batch.run()
+            except (EngineError, OSError, sqlite3.Error) as e:
+                # A job this machine cannot run fails, and the worker moves on
+                return failed_result(batch, job, str(e))
+        finally:
+            with self._lock:
+                self._batch = None
+        if result.cancelled:
+            return None
+        return {
+            "items": result.items, "lines": lines, "reasons": result.reasons,
+            "records": [record.as_dict() for record in result.report.records],
+            "duplicates": result.duplicates, "saved_seconds": result.saved_seconds, "saved_bytes": result.saved_bytes,
+        }
+
+
+class SpoolBatch:
+    """Coordinator standing in for a local batch: run() spools its inputs in
+    jobs of `chunk`, waits for workers to finish them all and returns the
+    merged BatchResult. Jobs are queued while a folder scan is still going."""
+
+    def __init__(self, spool, batch, chunk=DEFAULT_CHUNK, on_progress=None):
+        self.spool = spool
+        self.kind = batch.kind
+        self.items = getattr(batch, _ITEMS[batch.kind])
+        self.options = batch.options()
+        for key in _PATH_OPTIONS:
+            if self.options.get(key):
+                self.options[key] = os.path.abspath(self.options[key])
+        self.chunk = max(1, chunk)
+        self.on_progress = on_progress
+        self.batch_id = time.strftime("%Y%m%d-%H%M%S-") + worker_name()
+        self.result = BatchResult()
+        self.total = batch.total
+        self.job_id = None  # Not journaled: the spool itself survives a crash
+        self.pack_paths = []
+        self._jobs = {}  # Spooled job id -> index of its first input
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def progress(self, idx, text):
+        if self.on_progress:
+            self.on_progress(idx, text)
+
+    def submit(self, seq, first, items):
+        job_id = f"{self.batch_id}-{seq:06d}"
+        if self.kind != CropBatch.kind:
+            items = [os.path.abspath(item) for item in items]
+        self.spool.submit({"id": job_id, "kind": self.kind, "first": first, "items": items,
+                           "options": self.options})
+        self._jobs[job_id] = first
+
+    def collect(self):
+        for job_id, result in self.spool.results(self.batch_id):
+            offset = self._jobs.pop(job_id, None)
+            if offset is None:
+                continue  # Another run of a requeued job already came back
+            for idx, text in result.get("lines", []):
+                self.progress(offset + idx, text)
+            for idx, name, status in result["items"]:
+                self.result.add(offset + idx, name, status)
+            self.result.reasons.update(result.get("reasons", {}))
+            for fields in result.get("records", []):
+                record = JobRecord(fields["kind"], fields["name"])
+                for key, value in fields.items():
+                    setattr(record, key, value)
+                self.result.report.add(record)
+            self.result.duplicates += result.get("duplicates", 0)
+            self.result.saved_seconds += result.get("saved_seconds", 0.0)
+            self.result.saved_bytes += result.get("saved_bytes", 0)
+
+    def run(self):
+        chunk = []
+        seq = first = count = 0
+        try:
+            for item in self.items:
+                if self._cancelled:
+                    break
+                chunk.append(item)
+                count += 1
+                if len(chunk) == self.chunk:
+                    self.submit(seq, first, chunk)
+                    seq, first, chunk = seq + 1, count, []
+                    self.collect()
+            if chunk and not self._cancelled:
+                self.submit(seq, first, chunk)
+        except OSError as e:
+            self.spool.withdraw(self.batch_id)
+            raise EngineError(f"Cannot write to spool folder {self.spool.root}: {e.strerror}")
+        if self.kind != CropBatch.kind:
+            self.total = count
+        reaped = time.monotonic()
+        while self._jobs and not self._cancelled:
+            time.sleep(POLL_INTERVAL)
+            self.collect()
+            if time.monotonic() - reaped >= HEARTBEAT_INTERVAL:
+                # Workers reap too, but may all be busy or gone
+                reaped = time.monotonic()
+                self.spool.reap(self.spool.now(self.batch_id))
+        self.spool.leave(self.batch_id)
+        if self._cancelled:
+            self.spool.withdraw(self.batch_id)
+        else:
+            self.total = self.result.done
+        self.result.cancelled = self._cancelled
+        return self.result
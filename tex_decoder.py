@@ -0,0 +1,197 @@
+import os
+import struct
+import numpy as np
+from PIL import Image
+
+# Klei TEX (KTEX) reader. Pixel data is stored bottom-up like OpenGL expects,
+# so decoded images are flipped to match what ktech writes.
+
+KTEX_MAGIC = b"KTEX"
+
+DXT1 = 0
+DXT3 = 1
+DXT5 = 2
+RGBA = 4
+RGB = 5
+
+PIXEL_FORMAT_NAMES = {DXT1: "DXT1", DXT3: "DXT3", DXT5: "DXT5", RGBA: "RGBA", RGB: "RGB"}
+BLOCK_BYTES = {DXT1: 8, DXT3: 16, DXT5: 16}
+
+
+class TexError(ValueError):
+    pass
+
+
+class Mipmap:
+    def __init__(self, width, height, pitch, offset, size):
+        self.width = width
+        self.height = height
+        self.pitch = pitch
+        self.offset = offset
+        self.size = size
+
+
+class TexFile:
+    """Header and mipmap table of a .tex file, decoding mipmaps on demand."""
+
+    def __init__(self, data):
+        if data[:4] != KTEX_MAGIC:
+            raise TexError("Not a KTEX file")
+        if len(data) < 8:
+            raise TexError("Truncated KTEX header")
+        (bits,) = struct.unpack_from("<I", data, 4)
+        if bits >> 20 == 0xFFF:
+            # Post-caves layout
+            self.platform = bits & 0xF
+            self.pixel_format = (bits >> 4) & 0x1F
+            self.texture_type = (bits >> 9) & 0xF
+            mip_count = (bits >> 13) & 0x1F
+            self.flags = (bits >> 18) & 0x3
+        else:
+            # Pre-caves layout
+            self.platform = bits & 0x7
+            self.pixel_format = (bits >> 3) & 0x7
+            self.texture_type = (bits >> 6) & 0x7
+            mip_count = (bits >> 9) & 0xF
+            self.flags = (bits >> 13) & 0x1
+        self.data = data
+
+        self.mipmaps = []
+        table_end = 8 + mip_count * 10
+        if len(data) < table_end:
+            raise TexError("Truncated mipmap table")
+        offset = table_end
+        for i in range(mip_count):
+            width, height, pitch, size = struct.unpack_from("<HHHI", data, 8 + i * 10)
+            self.mipmaps.append(Mipmap(width, height, pitch, offset, size))
+            offset += size
+        if offset > len(data):
+            raise TexError("Truncated pixel data")
+
+    @property
+    def pixel_format_name(self):
+        return PIXEL_FORMAT_NAMES.get(self.pixel_format, f"unknown ({self.pixel_format})")
+
+    def pixels(self, mip=0):
+        # (height, width, 4) uint8 RGBA array, top row first
+        if not self.mipmaps:
+            raise TexError("No mipmaps")
+        mipmap = self.mipmaps[mip]
+        raw = np.frombuffer(self.data, np.uint8, mipmap.size, mipmap.offset)
+        width, height = mipmap.width, mipmap.height
+        if self.pixel_format in BLOCK_BYTES:
+            rgba = decode_dxt(raw, width, height, self.pixel_format)
+        elif self.pixel_format == RGBA:
+            rgba = _unpack_rows(raw, width, height, 4)
+        elif self.pixel_format == RGB:
+            rgb = _unpack_rows(raw, width, height, 3)
+            rgba = np.dstack((rgb, np.full((height, width), 255, np.uint8)))
+        else:
+            raise TexError(f"Unsupported pixel format {self.pixel_format_name}")
+        return rgba[::-1]
+
+    def image(self, mip=0):
+        return Image.fromarray(np.ascontiguousarray(self.pixels(mip)), "RGBA")
+
+
+def read_tex(path):
+    with open(path, "rb") as f:
+        return TexFile(f.read())
+
+
+def tex_to_png(tex_path, output_dir, mip=0, **save_options):
+    # Same output name as `ktech file.tex output_dir`
+    base = os.path.splitext(os.path.basename(tex_path))[0]
+    out_png = os.path.join(output_dir, base + ".png")
+    read_tex(tex_path).image(mip).save(out_png, **save_options)
+    return out_png
+
+
+def _unpack_rows(raw, width, height, channels):
+    row_bytes = width * channels
+    if raw.size < row_bytes * height:
+        raise TexError("Truncated pixel data")
+    pitch = raw.size // height if height else row_bytes
+    rows = raw[:pitch * height].reshape(height, pitch)
+    return rows[:, :row_bytes].reshape(height, width, channels)
+
+
+def _expand_565(color):
+    r = (color >> 11) & 0x1F
+    g = (color >> 5) & 0x3F
+    b = color & 0x1F
+    return np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis=-1)
+
+
+def _decode_color(blocks, has_alpha_mode):
+    # blocks: (n, 8) uint8 color blocks -> (n, 16, 4) RGBA
+    c0 = blocks[:, 0].astype(np.uint32) | (blocks[:, 1].astype(np.uint32) << 8)
+    c1 = blocks[:, 2].astype(np.uint32) | (blocks[:, 3].astype(np.uint32) << 8)
+    rgb0 = _expand_565(c0)
+    rgb1 = _expand_565(c1)
+
+    palette = np.empty((blocks.shape[0], 4, 4), np.uint32)
+    palette[:, 0, :3] = rgb0
+    palette[:, 1, :3] = rgb1
+    palette[:, :, 3] = 255
+    four_color = c0 > c1 if has_alpha_mode else np.ones(c0.shape, bool)
+    palette[:, 2, :3] = np.where(four_color[:, None], (2 * rgb0 + rgb1) // 3, (rgb0 + rgb1) // 2)
+    palette[:, 3, :3] = np.where(four_color[:, None], (rgb0 + 2 * rgb1) // 3, 0)
+    palette[:, 3, 3] = np.where(four_color, 255, 0)
+
+    bits = blocks[:, 4:8].copy().view("<u4")[:, 0]
+    indices = (bits[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 0x3
+    indices += 4 * np.arange(blocks.shape[0], dtype=np.uint32)[:, None]
+    return palette.astype(np.uint8).reshape(-1, 4)[indices]
+
+
+def _decode_dxt3_alpha(blocks):
+    nibbles = np.empty((blocks.shape[0], 16), np.uint8)
+    nibbles[:, 0::2] = blocks[:, :8] & 0xF
+    nibbles[:, 1::2] = blocks[:, :8] >> 4
+    return nibbles * 17
+
+
+def _decode_dxt5_alpha(blocks):
+    a0 = blocks[:, 0].astype(np.uint32)
+    a1 = blocks[:, 1].astype(np.uint32)
+    i = np.arange(1, 7, dtype=np.uint32)
+    palette = np.empty((blocks.shape[0], 8), np.uint32)
+    palette[:, 0] = a0
+    palette[:, 1] = a1
+    eight = (a0 > a1)[:, None]
+    interp8 = ((7 - i) * a0[:, None] + i * a1[:, None]) // 7
+    interp6 = ((5 - i[:4]) * a0[:, None] + i[:4] * a1[:, None]) // 5
+    interp6 = np.concatenate((interp6, np.zeros_like(a0)[:, None], np.full_like(a0, 255)[:, None]), axis=1)
+    palette[:, 2:] = np.where(eight, interp8, interp6)
+
+    bits = np.zeros(blocks.shape[0], np.uint64)
+    for k in range(6):
+        bits |= blocks[:, 2 + k].astype(np.uint64) << np.uint64(8 * k)
+    indices = (bits[:, None] >> (np.uint64(3) * np.arange(16, dtype=np.uint64))) & np.uint64(0x7)
+    indices += np.uint64(8) * np.arange(blocks.shape[0], dtype=np.uint64)[:, None]
+    return palette.astype(np.uint8).reshape(-1)[indices]
+
+
+def decode_dxt(raw, width, height, pixel_format):
+    # Decompress a whole DXT1/3/5 mipmap at once; returns (height, width, 4) uint8
+    block_bytes = BLOCK_BYTES[pixel_format]
+    blocks_x = max(1, (width + 3) // 4)
+    blocks_y = max(1, (height + 3) // 4)
+    count = blocks_x * blocks_y
+    if raw.size < count * block_bytes:
+        raise TexError("Truncated pixel data")
+    blocks = raw[:count * block_bytes].reshape(count, block_bytes)
+
+    if pixel_format == DXT1:
+        rgba = _decode_color(blocks, True)
+    else:
+        rgba = _decode_color(blocks[:, 8:], False)
+        if pixel_format == DXT3:
+            rgba[:, :, 3] = _decode_dxt3_alpha(blocks)
+        else:
+            rgba[:, :, 3] = _decode_dxt5_alpha(blocks)
+
+    pixels = rgba.reshape(blocks_y, blocks_x, 4, 4, 4)
+    pixels = pixels.transpose(0, 2, 1, 3, 4).reshape(blocks_y * 4, blocks_x * 4, 4)
+    return pixels[:height, :width]
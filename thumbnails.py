@@ -0,0 +1,162 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from atlas_index import load_atlas_image
+from build_cache import CACHE_DIR
+from engine import crop_box
+
+# Small previews of every icon of an atlas. The first request for an atlas
+# decodes it once and writes all its icons, downscaled, to one thumbnail file
+# under CACHE_DIR: a JSON header with each icon's offset, followed by the
+# thumbnail pngs. Later requests, in this run or the next, read just the
+# bytes of one png from that file. The file is rebuilt when the atlas's
+# mtime or size, or its icon list, changes. Recently shown thumbnails are
+# also kept in memory, up to max_bytes.
+
+THUMB_SIZE = 48
+THUMB_VERSION = 1
+DEFAULT_THUMB_MEMORY_BYTES = 16 * 1024 * 1024
+_HEADER_SIZE = struct.Struct("<I")
+
+
+def make_thumbnail(image, size=THUMB_SIZE):
+    # png bytes of image scaled down to fit size x size
+    thumb = image.convert("RGBA")
+    thumb.thumbnail((size, size))
+    buffer = io.BytesIO()
+    thumb.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class _Sheet:
+    """Header of one atlas's thumbnail file, or the thumbnails themselves
+    when the cache folder cannot be written."""
+
+    def __init__(self, path, header, data_start, blob=None):
+        self.path = path
+        self.header = header
+        self.data_start = data_start
+        self.blob = blob
+
+    def matches(self, st, elements, size):
+        header = self.header
+        return (header.get("version") == THUMB_VERSION and header.get("mtime_ns") == st.st_mtime_ns
+                and header.get("size") == st.st_size and header.get("thumb") == size
+                and header.get("elements") == elements)
+
+    def read(self, icon):
+        span = self.header["icons"].get(icon)
+        if span is None:
+            return None
+        offset, length = span
+        if self.blob is not None:
+            return self.blob[offset:offset + length]
+        with open(self.path, "rb") as f:
+            f.seek(self.data_start + offset)
+            return f.read(length)
+
+
+class ThumbnailCache:
+    """Thumbnail png bytes of atlas icons, from memory, disk or the atlas itself."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_THUMB_MEMORY_BYTES, size=THUMB_SIZE,
+                 loader=load_atlas_image):
+        self.folder = os.path.join(cache_dir, "thumbnails")
+        self.max_bytes = max_bytes
+        self.size = size
+        self.loader = loader
+        self._thumbs = OrderedDict()  # (atlas path, mtime_ns, icon) -> png bytes
+        self._bytes = 0
+        self._sheets = {}  # atlas path -> _Sheet
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def sheet_path(self, image_path):
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(image_path)).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, key + ".thumbs")
+
+    def get(self, image_path, elements, icon):
+        """png bytes of icon's thumbnail; elements are the atlas's
+        {icon: [u1, u2, v1, v2]}. None if the atlas does not have icon."""
+        st = os.stat(image_path)
+        key = (os.path.abspath(image_path), st.st_mtime_ns, icon)
+        with self._lock:
+            if key in self._thumbs:
+                self._thumbs.move_to_end(key)
+                return self._thumbs[key]
+        data = self.sheet(image_path, st, elements).read(icon)
+        if data is None:
+            return None
+        with self._lock:
+            if key not in self._thumbs:
+                self._thumbs[key] = data
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, old = self._thumbs.popitem(last=False)
+                self._bytes -= len(old)
+        return data
+
+    def sheet(self, image_path, st, elements):
+        # The atlas's thumbnail file, built first if missing or out of date
+        sheet = self._sheets.get(image_path)
+        if sheet is not None and sheet.matches(st, elements, self.size):
+            return sheet
+        # One atlas is decoded at a time, and only once however many icons wait for it
+        with self._build_lock:
+            sheet = self._load(image_path)
+            if sheet is None or not sheet.matches(st, elements, self.size):
+                sheet = self._build(image_path, st, elements)
+            self._sheets[image_path] = sheet
+        return sheet
+
+    def _load(self, image_path):
+        path = self.sheet_path(image_path)
+        try:
+            with open(path, "rb") as f:
+                (length,) = _HEADER_SIZE.unpack(f.read(_HEADER_SIZE.size))
+                header = json.loads(f.read(length).decode("utf-8"))
+        except (OSError, ValueError, struct.error):
+            return None
+        return _Sheet(path, header, _HEADER_SIZE.size + length)
+
+    def _build(self, image_path, st, elements):
+        image = self.loader(image_path)
+        icons = {}
+        chunks = []
+        offset = 0
+        for name, uv in sorted(elements.items()):
+            left, top, right, bottom = crop_box(uv, image.size)
+            if right <= left or bottom <= top:
+                continue
+            data = make_thumbnail(image.crop((left, top, right, bottom)), self.size)
+            icons[name] = [offset, len(data)]
+            chunks.append(data)
+            offset += len(data)
+        header = {
+            "version": THUMB_VERSION, "atlas": os.path.abspath(image_path), "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size, "thumb": self.size, "elements": elements, "icons": icons,
+        }
+        encoded = json.dumps(header).encode("utf-8")
+        path = self.sheet_path(image_path)
+        tmp_path = path + ".tmp"
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER_SIZE.pack(len(encoded)))
+                f.write(encoded)
+                for data in chunks:
+                    f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return _Sheet(None, header, 0, b"".join(chunks))  # Not cached on disk, still shown this run
+        return _Sheet(path, header, _HEADER_SIZE.size + len(encoded))
+
+    def clear(self):
+        with self._lock:
+            self._thumbs.clear()
+            self._bytes = 0
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+# Polls a source tree for new and changed files without any OS watch
+# service. Folder mtimes change when a file is created, renamed or deleted in
+# them, so each poll stats every known folder and re-lists only those that
+# changed. Files rewritten in place do not touch their folder, so a slice of
+# the known files is also re-statted every poll; the whole tree is covered
+# every SWEEP_ROUNDS polls. An idle tree costs one stat per folder plus that
+# slice, and is never walked again after the first time.
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_DEBOUNCE = 1.0
+SWEEP_ROUNDS = 30
+SWEEP_MIN = 256
+
+
+def _signature(st):
+    return st.st_mtime_ns, st.st_size
+
+
+class TreeWatcher:
+    """Stat snapshot of the files under root for which wanted(name) is true."""
+
+    def __init__(self, root, wanted, exclude=()):
+        self.root = root
+        self.wanted = wanted
+        self.exclude = {os.path.normcase(os.path.abspath(path)) for path in exclude if path}
+        self.dirs = {}  # folder -> mtime_ns
+        self.files = {}  # path -> (mtime_ns, size)
+        self.children = {}  # folder -> its wanted files
+        self._sweep = []
+        self._cursor = 0
+
+    def prime(self):
+        # The one full walk, taking the snapshot later polls compare against
+        self._add_tree(self.root, None)
+
+    def _excluded(self, path):
+        return os.path.normcase(os.path.abspath(path)) in self.exclude
+
+    def _add_tree(self, top, changed):
+        stack = [top]
+        while stack:
+            stack.extend(self._list(stack.pop(), changed))
+
+    def _list(self, folder, changed):
+        # Records folder's files, returning its subfolders not seen before
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as it:
+                entries = list(it)
+        except OSError:
+            self._forget_dir(folder)
+            return []
+        self.dirs[folder] = mtime
+        seen = set()
+        new_dirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in self.dirs and not self._excluded(entry.path):
+                        new_dirs.append(entry.path)
+                elif self.wanted(entry.name) and entry.is_file():
+                    seen.add(entry.path)
+                    signature = _signature(entry.stat())
+                    if self.files.get(entry.path) != signature:
+                        if entry.path not in self.files:
+                            self._sweep.append(entry.path)
+                        self.files[entry.path] = signature
+                        if changed is not None:
+                            changed[entry.path] = signature
+            except OSError:
+                continue
+        for path in self.children.get(folder, set()) - seen:
+            self.files.pop(path, None)  # Deleted; dropped from the sweep when reached
+        self.children[folder] = seen
+        return new_dirs
+
+    def _forget_dir(self, folder):
+        prefix = folder + os.sep
+        for path in [d for d in self.dirs if d == folder or d.startswith(prefix)]:
+            del self.dirs[path]
+            for file in self.children.pop(path, ()):
+                self.files.pop(file, None)
+
+    def poll(self):
+        """{path: (mtime_ns, size)} of files created or changed since the last poll."""
+        changed = {}
+        for folder, mtime in list(self.dirs.items()):
+            if folder not in self.dirs:
+                continue  # Under a folder removed earlier in this poll
+            try:
+                current = os.stat(folder).st_mtime_ns
+            except OSError:
+                self._forget_dir(folder)
+                continue
+            if current != mtime:
+                for new_dir in self._list(folder, changed):
+                    self._add_tree(new_dir, changed)
+        self._sweep_files(changed)
+        return changed
+
+    def _sweep_files(self, changed):
+        count = max(SWEEP_MIN, len(self.files) // SWEEP_ROUNDS)
+        for _ in range(min(count, len(self._sweep))):
+            if self._cursor >= len(self._sweep):
+                self._cursor = 0
+            path = self._sweep[self._cursor]
+            if path not in self.files:
+                self._sweep.pop(self._cursor)
+                continue
+            self._cursor += 1
+            try:
+                signature = _signature(os.stat(path))
+            except OSError:
+                continue  # Its folder's mtime changed too; the next poll re-lists it
+            if signature != self.files[path]:
+                self.files[path] = signature
+                changed[path] = signature
+
+
+class WatchSession:
+    """Yields a batch for every burst of changes under a TreeWatcher's root.
+
+    to_items(paths) turns settled file paths into batch inputs (the .tex
+    files themselves, or their anim folders), and make_batch(items) builds
+    the batch. A file only settles once its size and mtime have not changed
+    for `debounce` seconds, so an export still being written is not
+    converted half done.
+    """
+
+    def __init__(self, watcher, to_items, make_batch, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        self.watcher = watcher
+        self.to_items = to_items
+        self.make_batch = make_batch
+        self.interval = interval
+        self.debounce = debounce
+        self._pending = {}  # path -> (signature, time it last changed)
+        self._stop = threading.Event()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+
+    def settled(self):
+        now = time.monotonic()
+        for path, signature in self.watcher.poll().items():
+            self._pending[path] = (signature, now)
+        ready = []
+        for path, (signature, changed_at) in list(self._pending.items()):
+            try:
+                current = _signature(os.stat(path))
+            except OSError:
+                del self._pending[path]
+                continue
+            if current != signature:
+                self._pending[path] = (current, now)
+            elif now - changed_at >= self.debounce:
+                del self._pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+    def batches(self):
+        # Runs until stop(); the caller runs each batch before asking for the next
+        while not self._stop.wait(self.interval):
+            items = self.to_items(self.settled())
+            if items:
+                yield self.make_batch(items)
@@ -0,0 +1,101 @@
+import os
+
+# Extra sizes of each cropped icon or converted texture, written from the
+# image already in memory, so a source is decoded once however many sizes
+# are exported. A profile is a space separated list of variants, each
+# "folder=step+step+..." or a single step, which also names its folder:
+#
+#   64        scale to fit 64x64, keeping the aspect ratio
+#   square    pad to a transparent square: the size given, or the longer side
+#   trim      cut away fully transparent borders, before scaling
+#   lanczos   resampling filter used to scale (also nearest, box, bilinear,
+#             hamming, bicubic; default lanczos)
+#
+# e.g. "64=64+square wiki=trim+32+square+nearest". Pillow is only imported
+# once a variant is applied.
+
+RESAMPLE_FILTERS = ("nearest", "box", "bilinear", "hamming", "bicubic", "lanczos")
+DEFAULT_RESAMPLE = "lanczos"
+MAX_VARIANT_SIZE = 8192
+
+
+class Variant:
+    def __init__(self, name, size=None, square=False, trim=False, resample=DEFAULT_RESAMPLE):
+        self.name = name
+        self.size = size
+        self.square = square
+        self.trim = trim
+        self.resample = resample
+
+    def spec(self):
+        steps = ["trim"] if self.trim else []
+        if self.size:
+            steps.append(str(self.size))
+        if self.square:
+            steps.append("square")
+        if self.resample != DEFAULT_RESAMPLE:
+            steps.append(self.resample)
+        return f"{self.name}={'+'.join(steps)}"
+
+    def apply(self, image):
+        from PIL import Image
+
+        if (self.trim or self.square) and image.mode != "RGBA":
+            image = image.convert("RGBA")
+        if self.trim:
+            box = image.getchannel("A").getbbox()
+            if box:
+                image = image.crop(box)
+        if self.size:
+            width, height = image.size
+            scale = self.size / max(width, height, 1)
+            new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            if new_size != image.size:
+                filters = getattr(Image, "Resampling", Image)  # Pillow < 9.1 has them on Image
+                image = image.resize(new_size, getattr(filters, self.resample.upper()))
+        if self.square:
+            side = self.size or max(image.size)
+            canvas = Image.new("RGBA", (side, side))
+            canvas.paste(image, ((side - image.width) // 2, (side - image.height) // 2))
+            image = canvas
+        return image
+
+
+def parse_variants(text):
+    """[Variant] of a profile such as "64=64+square 32"; ValueError if a step is unknown."""
+    variants = []
+    names = set()
+    for token in (text or "").split():
+        name, _, steps = token.partition("=")
+        if not _:
+            steps = name
+        if not name or name in (".", "..") or any(c in name for c in "/\\:"):
+            raise ValueError(f"Bad variant folder name: {name!r}")
+        if name.lower() in names:
+            raise ValueError(f"Variant {name} is listed twice")
+        names.add(name.lower())
+        variant = Variant(name)
+        for step in filter(None, steps.lower().split("+")):
+            if step.isdigit():
+                variant.size = int(step)
+                if not 0 < variant.size <= MAX_VARIANT_SIZE:
+                    raise ValueError(f"Variant {name}: size must be 1-{MAX_VARIANT_SIZE}")
+            elif step == "square":
+                variant.square = True
+            elif step == "trim":
+                variant.trim = True
+            elif step in RESAMPLE_FILTERS:
+                variant.resample = step
+            else:
+                raise ValueError(f"Variant {name}: unknown step {step!r}")
+        variants.append(variant)
+    return variants
+
+
+def format_variants(variants):
+    return " ".join(variant.spec() for variant in variants)
+
+
+def variant_path(path, output_dir, variant):
+    # path under output_dir, moved into the variant's folder there
+    return os.path.join(output_dir, variant.name, os.path.relpath(path, output_dir))